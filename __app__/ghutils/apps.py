@@ -0,0 +1,107 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Authenticate as a GitHub App.
+
+An App proves who it is with a JSON Web Token signed by its private key, then
+trades that for an installation access token to act on the repositories of
+an installation. Installation tokens last an hour and every installation has
+a rate limit of its own. PyJWT is only imported once a token is needed.
+"""
+
+import asyncio
+import datetime
+import time
+
+
+API_URL = "https://api.github.com"
+# Installation tokens are refreshed this many seconds before they expire.
+DEFAULT_MARGIN = 300
+
+
+def app_jwt(app_id, private_key, *, now=None):
+    """Create a JSON Web Token authenticating as the App.
+
+    The token is backdated a minute to allow for clock drift and expires after
+    the ten minutes GitHub allows.
+    """
+    import jwt
+
+    issued = int(time.time() if now is None else now) - 60
+    payload = {"iat": issued, "exp": issued + 600, "iss": str(app_id)}
+    return jwt.encode(payload, private_key, algorithm="RS256")
+
+
+def _timestamp(iso_time):
+    expires = datetime.datetime.strptime(iso_time, "%Y-%m-%dT%H:%M:%SZ")
+    return expires.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class InstallationTokens:
+
+    """Mint installation access tokens and cache them until shortly before expiry.
+
+    Concurrent requests for the token of the same installation share a single
+    request to GitHub. The 'minted' attribute counts the tokens created.
+    """
+
+    def __init__(self, app_id, private_key, *, margin=DEFAULT_MARGIN, url=API_URL):
+        self.app_id = app_id
+        self.margin = margin
+        self.url = url
+        self.minted = 0
+        self._private_key = private_key
+        # Installation ID -> (token, expiry timestamp)
+        self._tokens = {}
+        # Installation ID -> token being minted
+        self._minting = {}
+        # Repository full name (lowercased) -> installation ID
+        self._installations = {}
+
+    async def token(self, gh, installation_id):
+        """Return a token for the installation, minting one via 'gh' if needed."""
+        try:
+            token, expires = self._tokens[installation_id]
+        except KeyError:
+            pass
+        else:
+            if time.time() < expires - self.margin:
+                return token
+        if installation_id not in self._minting:
+            self._minting[installation_id] = asyncio.ensure_future(
+                self._mint(gh, installation_id)
+            )
+        try:
+            return await asyncio.shield(self._minting[installation_id])
+        finally:
+            self._minting.pop(installation_id, None)
+
+    async def installation_id(self, gh, repo):
+        """Return the ID of the App's installation on 'repo' (as OWNER/NAME).
+
+        It is looked up via 'gh' the first time it is needed.
+        """
+        key = repo.lower()
+        if key not in self._installations:
+            data = await gh.getitem(
+                f"{self.url}/repos/{repo}/installation",
+                accept="application/vnd.github.machine-man-preview+json",
+                jwt=app_jwt(self.app_id, self._private_key),
+            )
+            self._installations[key] = data["id"]
+        return self._installations[key]
+
+    def invalidate(self, installation_id):
+        """Forget the installation's token, e.g. because it was revoked."""
+        self._tokens.pop(installation_id, None)
+
+    async def _mint(self, gh, installation_id):
+        data = await gh.post(
+            f"{self.url}/app/installations/{installation_id}/access_tokens",
+            data=b"",
+            accept="application/vnd.github.machine-man-preview+json",
+            jwt=app_jwt(self.app_id, self._private_key),
+        )
+        self.minted += 1
+        self._tokens[installation_id] = data["token"], _timestamp(data["expires_at"])
+        return data["token"]
@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Dispatch a batch of queued webhook events at once.
+
+Seeing many events together means events for the same subject (e.g. an issue)
+can be handled in order while different subjects are handled concurrently, and
+runs of events which only call for reconciling a subject can be merged.
+"""
+
+import collections
+
+from . import fanout, instrument, ratelimit
+
+
+def group(events, key):
+    """Group events by the subject 'key' maps them to, keeping them in order.
+
+    Groups are ordered by their first event. Events for which 'key' returns
+    None form groups of their own.
+    """
+    groups = collections.OrderedDict()
+    for event in events:
+        subject = key(event)
+        if subject is None:
+            subject = object()
+        groups.setdefault(subject, []).append(event)
+    return list(groups.values())
+
+
+def merge(events, mergeable):
+    """Split a group of events into runs to handle one at a time.
+
+    Consecutive events for which 'mergeable' returns true form a single run;
+    every other event is a run of its own.
+    """
+    runs = []
+    for event in events:
+        if runs and mergeable(event) and mergeable(runs[-1][-1]):
+            runs[-1].append(event)
+        else:
+            runs.append([event])
+    return runs
+
+
+class Batch:
+
+    """Dispatch a batch of events through a router.
+
+    The 'key' callable maps an event to its subject. Events for the same
+    subject are dispatched one after another, and up to 'limit' subjects are
+    handled at once. If 'reconcile' is provided then consecutive events of a
+    subject for which 'mergeable' returns true are handled by a single call to
+    it with the latest of them instead of being dispatched. 'gh_factory' is
+    called with each event to create its GitHubAPI instance.
+
+    Failed events are logged and don't stop the rest of the batch. Events
+    deferred due to rate limiting are returned along with how long to wait, as
+    are the later events of the same subject to keep them in order. If
+    'metrics' is provided then the timings of handling each event are added to
+    it and logged.
+    """
+
+    def __init__(
+        self,
+        router,
+        gh_factory,
+        *,
+        key,
+        mergeable=None,
+        reconcile=None,
+        limit=fanout.DEFAULT_LIMIT,
+        logger=None,
+        metrics=None,
+    ):
+        self.router = router
+        self._gh_factory = gh_factory
+        self._key = key
+        self._mergeable = mergeable
+        self.reconcile = reconcile
+        self.limit = limit
+        self._logger = logger
+        self._metrics = metrics
+        self.merged = 0
+
+    async def dispatch(self, events):
+        """Handle the events, returning (event, retry_after) for those deferred."""
+        deferred = []
+        subjects = group(events, self._key)
+        await fanout.gather(
+            [self._subject(subject, deferred) for subject in subjects],
+            limit=self.limit,
+        )
+        return deferred
+
+    async def _subject(self, events, deferred):
+        if self.reconcile is not None:
+            runs = merge(events, self._mergeable)
+        else:
+            runs = [[event] for event in events]
+        for position, run in enumerate(runs):
+            latest = run[-1]
+            try:
+                await self._handle(run)
+            except ratelimit.Deferred as exc:
+                if self._logger:
+                    self._logger.info(
+                        f"Deferring delivery {latest.delivery_id} for {exc.retry_after:.1f} seconds"
+                    )
+                deferred.append((latest, exc.retry_after))
+                for later in runs[position + 1 :]:
+                    deferred.extend((event, exc.retry_after) for event in later)
+                return
+            except Exception:
+                if self._logger:
+                    self._logger.exception(
+                        f"Failed to process delivery {latest.delivery_id}"
+                    )
+
+    async def _handle(self, run):
+        event = run[-1]
+        gh = self._gh_factory(event)
+        delivery = instrument.Delivery(event)
+        try:
+            with delivery.active():
+                delivery.decode()
+                with delivery.stage("dispatch"):
+                    if len(run) > 1:
+                        self.merged += len(run) - 1
+                        await self.reconcile(event, gh, logger=self._logger)
+                    else:
+                        await self.router.dispatch(event, gh, logger=self._logger)
+        finally:
+            if self._metrics is not None:
+                instrument.report(delivery, self._metrics, self._logger)
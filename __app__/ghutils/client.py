@@ -0,0 +1,218 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Manage the HTTP connections used to talk to GitHub."""
+
+import asyncio
+import collections
+import http
+import time
+
+import aiohttp
+import gidgethub
+from gidgethub import aiohttp as gh_aiohttp
+
+from . import instrument, retry
+
+
+API_URL = "https://api.github.com"
+
+
+class GitHubAPI(gh_aiohttp.GitHubAPI):
+
+    """GitHubAPI which paces its requests with a ratelimit.Scheduler.
+
+    Requests are recorded with the instrument module. If 'tokens' (an
+    apps.InstallationTokens) is provided then requests are made with a token
+    for the App installation 'installation_id'. Requests failing transiently
+    are retried according to 'retry_policy' (a retry.Policy) if provided.
+    """
+
+    def __init__(
+        self,
+        session,
+        *args,
+        scheduler=None,
+        tokens=None,
+        installation_id=None,
+        retry_policy=None,
+        **kwargs,
+    ):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.installation_id = installation_id
+        self.retry_policy = retry_policy
+        super().__init__(session, *args, **kwargs)
+
+    async def _make_request(
+        self, method, url, url_vars, data, accept, jwt=None, oauth_token=None
+    ):
+        if self.tokens is None or jwt is not None or oauth_token is not None:
+            return await super()._make_request(
+                method, url, url_vars, data, accept, jwt=jwt, oauth_token=oauth_token
+            )
+        oauth_token = await self.tokens.token(self, self.installation_id)
+        try:
+            return await super()._make_request(
+                method, url, url_vars, data, accept, oauth_token=oauth_token
+            )
+        except gidgethub.BadRequest as exc:
+            if exc.status_code == http.HTTPStatus.UNAUTHORIZED:
+                # Mint a new token next time.
+                self.tokens.invalidate(self.installation_id)
+            raise
+
+    async def _request(self, method, url, headers, body=b""):
+        if self.retry_policy is None:
+            return await self._attempt(method, url, headers, body)
+        return await self.retry_policy.call(
+            lambda: self._attempt(method, url, headers, body)
+        )
+
+    async def _attempt(self, method, url, headers, body):
+        if self.scheduler is not None:
+            await self.scheduler.pace(method)
+        start = time.perf_counter()
+        try:
+            response = await super()._request(method, url, headers, body)
+        finally:
+            instrument.record_call(time.perf_counter() - start)
+        if self.scheduler is not None:
+            self.scheduler.observe(response[0], response[1])
+        if response[0] == http.HTTPStatus.NOT_MODIFIED:
+            # Plain mappings can be used as caches too, but don't count hits.
+            record_not_modified = getattr(self._cache, "record_not_modified", None)
+            if record_not_modified is not None:
+                record_not_modified()
+        return response
+
+
+class Client:
+
+    """Own a tuned connection pool and the GitHubAPI instances using it.
+
+    The connection pool is only created once it is first needed (which must be
+    from within a coroutine). GitHubAPI instances are shared between calls with
+    the same requester and OAuth token so that rate limit details carry over
+    from one event to the next. If 'cache' is provided then all GitHubAPI
+    instances use it for conditional requests. The 'scheduler_factory' is
+    called to create the rate limit scheduler for each GitHubAPI instance.
+    At most 'maxsize' GitHubAPI instances are kept, dropping the least recently
+    used one first. GitHubAPI instances for a GitHub App installation get their
+    tokens from 'installation_tokens'. All GitHubAPI instances retry requests
+    according to 'retry_policy'.
+    """
+
+    def __init__(
+        self,
+        *,
+        limit=100,
+        limit_per_host=30,
+        keepalive_timeout=60,
+        ttl_dns_cache=300,
+        timeout=30,
+        cache=None,
+        scheduler_factory=None,
+        maxsize=128,
+        installation_tokens=None,
+        retry_policy=None,
+    ):
+        self._connector_args = {
+            "limit": limit,
+            "limit_per_host": limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "ttl_dns_cache": ttl_dns_cache,
+        }
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache = cache
+        self._scheduler_factory = scheduler_factory
+        self._session = None
+        self._warming = None
+        self._maxsize = maxsize
+        self.installation_tokens = installation_tokens
+        self.retry_policy = retry_policy
+        self._apis = collections.OrderedDict()
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(**self._connector_args)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout
+            )
+        return self._session
+
+    def github_api(self, requester, *, oauth_token=None, installation_id=None):
+        """Return a GitHubAPI instance which uses the connection pool.
+
+        If 'installation_id' is provided then the instance acts on behalf of
+        that installation of the GitHub App.
+        """
+        key = requester, oauth_token, installation_id
+        try:
+            gh = self._apis[key]
+        except KeyError:
+            if self._scheduler_factory is not None:
+                scheduler = self._scheduler_factory()
+            else:
+                scheduler = None
+            gh = self._apis[key] = GitHubAPI(
+                self.session,
+                requester,
+                oauth_token=oauth_token,
+                cache=self.cache,
+                scheduler=scheduler,
+                tokens=self.installation_tokens
+                if installation_id is not None
+                else None,
+                installation_id=installation_id,
+                retry_policy=self.retry_policy,
+            )
+            while len(self._apis) > self._maxsize:
+                self._apis.popitem(last=False)
+        else:
+            self._apis.move_to_end(key)
+        return gh
+
+    async def warm(self, url=API_URL):
+        """Open a connection to GitHub ahead of it being needed.
+
+        This pays for DNS resolution and the TLS handshake up front. Failure is
+        not an error as the connection will simply be made when first used.
+        """
+        try:
+            async with self.session.head(url):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    def start_warming(self, url=API_URL):
+        """Run warm() in the background; close() stops it if still running."""
+        self._warming = asyncio.ensure_future(self.warm(url))
+
+    async def close(self):
+        """Close all connections."""
+        if self._warming is not None:
+            # Otherwise it could open a new session after this one is closed.
+            self._warming.cancel()
+            await asyncio.gather(self._warming, return_exceptions=True)
+            self._warming = None
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        self._apis.clear()
+
+    def close_connections(self):
+        """Close all connections from outside of a coroutine.
+
+        Meant to be called when the process is exiting.
+        """
+        if self._session is None or self._session.closed:
+            return
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            # No event loop is left, e.g. after asyncio.run() returned.
+            return
+        if not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(self.close())
@@ -0,0 +1,45 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Collapse bursts of related webhook events into a single reconciliation."""
+
+import asyncio
+
+
+class Coalescer:
+
+    """Debounce events in front of a router.
+
+    The 'key' callable maps an event to the subject it concerns (e.g. an
+    issue), or None if the event should be dispatched through the router
+    immediately. The first event for a subject waits 'window' seconds; any
+    other events for the same subject arriving during that time are merged
+    into it. The 'reconcile' coroutine is then called once with the latest
+    event to bring the subject into its desired state.
+
+    Instances have the same dispatch() signature as a router so they can be
+    used in place of one.
+    """
+
+    def __init__(self, router, key, reconcile, *, window=1):
+        self._router = router
+        self._key = key
+        self._reconcile = reconcile
+        self.window = window
+        self._pending = {}
+        self.coalesced = 0
+
+    async def dispatch(self, event, *args, **kwargs):
+        subject = self._key(event)
+        if subject is None:
+            await self._router.dispatch(event, *args, **kwargs)
+        elif subject in self._pending:
+            self._pending[subject] = event
+            self.coalesced += 1
+        else:
+            self._pending[subject] = event
+            try:
+                await asyncio.sleep(self.window)
+            finally:
+                latest = self._pending.pop(subject)
+            await self._reconcile(latest, *args, **kwargs)
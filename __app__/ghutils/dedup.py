@@ -0,0 +1,84 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Drop webhook deliveries which have already been (or are being) processed.
+
+GitHub redelivers an event if the bot is too slow to respond, with the same
+X-GitHub-Delivery ID as the original delivery.
+"""
+
+import collections
+import sqlite3
+import time
+
+
+class MemoryDeduplicator:
+
+    """Remember delivery IDs in process memory for 'ttl' seconds.
+
+    At most 'maxsize' delivery IDs are remembered. The 'duplicates' attribute
+    counts how many deliveries were dropped.
+    """
+
+    def __init__(self, *, ttl=3600, maxsize=10_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.duplicates = 0
+        # Delivery ID -> time claimed
+        self._seen = collections.OrderedDict()
+
+    def claim(self, delivery_id):
+        """Return true if the delivery is new, marking it as processing."""
+        now = time.monotonic()
+        while self._seen:
+            oldest, claimed = next(iter(self._seen.items()))
+            if now - claimed <= self.ttl:
+                break
+            del self._seen[oldest]
+        if delivery_id in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen[delivery_id] = now
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return True
+
+    def release(self, delivery_id):
+        """Forget the delivery so a redelivery will be processed."""
+        self._seen.pop(delivery_id, None)
+
+
+class SQLiteDeduplicator:
+
+    """Remember delivery IDs in a local SQLite database for 'ttl' seconds.
+
+    Delivery IDs survive the worker process being recycled.
+    """
+
+    def __init__(self, path, *, ttl=3600):
+        self.ttl = ttl
+        self.duplicates = 0
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries (id TEXT PRIMARY KEY, claimed REAL)"
+        )
+
+    def claim(self, delivery_id):
+        """Return true if the delivery is new, marking it as processing."""
+        now = time.time()
+        self._db.execute("DELETE FROM deliveries WHERE claimed < ?", (now - self.ttl,))
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO deliveries (id, claimed) VALUES (?, ?)",
+            (delivery_id, now),
+        )
+        if cursor.rowcount:
+            return True
+        self.duplicates += 1
+        return False
+
+    def release(self, delivery_id):
+        """Forget the delivery so a redelivery will be processed."""
+        self._db.execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,36 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Run independent GitHub API calls concurrently."""
+
+import asyncio
+
+
+DEFAULT_LIMIT = 8
+
+
+def _tolerate_nothing(exc):
+    return False
+
+
+async def gather(calls, *, limit=DEFAULT_LIMIT, tolerate=_tolerate_nothing):
+    """Await the coroutines in 'calls' with at most 'limit' running at once.
+
+    Every call runs to completion even if another one fails. The outcome of
+    each call is returned in order; exceptions for which 'tolerate' returns
+    true are returned in place of a result. Once all calls have finished,
+    the first exception which is not tolerated is raised.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(call):
+        async with semaphore:
+            return await call
+
+    outcomes = await asyncio.gather(
+        *(bounded(call) for call in calls), return_exceptions=True
+    )
+    for outcome in outcomes:
+        if isinstance(outcome, Exception) and not tolerate(outcome):
+            raise outcome
+    return outcomes
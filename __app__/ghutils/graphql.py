@@ -0,0 +1,121 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Combine GraphQL queries (or mutations) made at about the same time.
+
+Each request is a single field, e.g. a mutation, which is given an alias and
+merged with the other requests waiting to be sent into one GraphQL document.
+"""
+
+import asyncio
+import re
+
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+_VARIABLE = re.compile(r"\$(\w+)")
+
+
+class GraphQLError(Exception):
+
+    """GitHub reported an error for a field."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(error.get("message", "") for error in errors))
+        self.errors = errors
+
+
+class _Batch:
+    def __init__(self):
+        # (field, variables, future)
+        self.requests = []
+        self.handle = None
+
+
+class Batcher:
+
+    """Send requests made within 'window' seconds of each other together.
+
+    A batch is sent early once it holds 'maxsize' requests. Requests are sent
+    per GitHubAPI instance, and queries and mutations are batched separately.
+    """
+
+    def __init__(self, *, url=GRAPHQL_URL, window=0, maxsize=50):
+        self.url = url
+        self.window = window
+        self.maxsize = maxsize
+        self.sent = 0
+        # (GitHubAPI instance, kind) -> batch being collected
+        self._batches = {}
+
+    async def query(self, gh, field, variables=None):
+        """Return the data of 'field' from a batched query.
+
+        Variables are referred to as '$name' in the field's text, with
+        'variables' mapping each name to a (GraphQL type, value) pair.
+        """
+        return await self._request(gh, "query", field, variables or {})
+
+    async def mutate(self, gh, field, variables=None):
+        """Return the data of 'field' from a batched mutation."""
+        return await self._request(gh, "mutation", field, variables or {})
+
+    async def _request(self, gh, kind, field, variables):
+        key = gh, kind
+        loop = asyncio.get_event_loop()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.handle = loop.call_later(self.window, self._flush, key)
+        future = loop.create_future()
+        batch.requests.append((field, variables, future))
+        if len(batch.requests) >= self.maxsize:
+            batch.handle.cancel()
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._batches.pop(key)
+        asyncio.ensure_future(self._send(key, batch.requests))
+
+    async def _send(self, key, requests):
+        gh, kind = key
+        definitions = []
+        fields = []
+        variables = {}
+        for index, (field, field_variables, _) in enumerate(requests):
+            alias = f"r{index}"
+            for name, (type_, value) in field_variables.items():
+                definitions.append(f"${alias}_{name}: {type_}")
+                variables[f"{alias}_{name}"] = value
+            fields.append(f"{alias}: " + _VARIABLE.sub(rf"${alias}_\1", field))
+        document = kind
+        if definitions:
+            document += f"({', '.join(definitions)})"
+        document += " { " + " ".join(fields) + " }"
+        self.sent += 1
+        try:
+            response = await gh.post(
+                self.url, data={"query": document, "variables": variables}
+            )
+        except Exception as exc:
+            for _, _, future in requests:
+                if not future.cancelled():
+                    future.set_exception(exc)
+            return
+        data = response.get("data") or {}
+        errors = {}
+        for error in response.get("errors", []):
+            alias = (error.get("path") or [None])[0]
+            errors.setdefault(alias, []).append(error)
+        for index, (_, _, future) in enumerate(requests):
+            alias = f"r{index}"
+            if future.cancelled():
+                continue
+            elif alias in errors:
+                future.set_exception(GraphQLError(errors[alias]))
+            elif alias not in data:
+                # Errors which aren't for a specific field fail every request.
+                future.set_exception(GraphQLError(errors.get(None, [])))
+            else:
+                future.set_result(data[alias])
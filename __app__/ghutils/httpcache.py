@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Caches for GitHubAPI's conditional requests.
+
+GitHubAPI stores the ETag/Last-Modified details of GET responses in its cache
+and sends them with later requests for the same URL. When nothing changed
+GitHub replies with a 304 which does not count against the rate limit.
+"""
+
+import collections
+import collections.abc
+import json
+import sqlite3
+import time
+
+
+class LRUCache(collections.abc.MutableMapping):
+
+    """Hold up to 'maxsize' responses in memory, evicting the least recently used.
+
+    The 'conditional' attribute counts lookups which led to a conditional
+    request and 'misses' counts those which did not. 'hits' counts the
+    conditional requests GitHub answered with a 304, i.e. those which were
+    served from the cache without counting against the rate limit.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.conditional = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __getitem__(self, url):
+        try:
+            value = self._entries[url]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.conditional += 1
+        self._entries.move_to_end(url)
+        return value
+
+    def record_not_modified(self):
+        """Count a conditional request which GitHub answered with a 304."""
+        self.hits += 1
+
+    def __setitem__(self, url, value):
+        self._entries[url] = value
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __delitem__(self, url):
+        del self._entries[url]
+
+    def __contains__(self, url):
+        # Membership tests are not lookups by GitHubAPI, so don't count them.
+        return url in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(collections.abc.MutableMapping):
+
+    """Hold up to 'maxsize' responses in a local SQLite database.
+
+    The cache survives the worker process being recycled. Counters are the same
+    as for LRUCache.
+    """
+
+    def __init__(self, path, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.conditional = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses"
+            " (url TEXT PRIMARY KEY, value TEXT, used REAL)"
+        )
+
+    def __getitem__(self, url):
+        row = self._db.execute(
+            "SELECT value FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            raise KeyError(url)
+        self.conditional += 1
+        self._db.execute(
+            "UPDATE responses SET used = ? WHERE url = ?", (time.time(), url)
+        )
+        return tuple(json.loads(row[0]))
+
+    def record_not_modified(self):
+        """Count a conditional request which GitHub answered with a 304."""
+        self.hits += 1
+
+    def __setitem__(self, url, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (url, value, used) VALUES (?, ?, ?)",
+            (url, json.dumps(value), time.time()),
+        )
+        self._db.execute(
+            "DELETE FROM responses WHERE url NOT IN"
+            " (SELECT url FROM responses ORDER BY used DESC LIMIT ?)",
+            (self.maxsize,),
+        )
+
+    def __delitem__(self, url):
+        if url not in self:
+            raise KeyError(url)
+        self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    def __contains__(self, url):
+        # Membership tests are not lookups by GitHubAPI, so don't count them.
+        row = self._db.execute(
+            "SELECT 1 FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._db.execute("SELECT url FROM responses")])
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self._db.close()
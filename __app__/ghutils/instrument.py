@@ -0,0 +1,245 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Measure where the time and GitHub API calls go when processing a delivery.
+
+A Delivery records how long each stage of processing an event took, how long
+each callback ran, and the GitHub calls each callback made. Callbacks are only
+timed when dispatched through a router returned by router(), and GitHub calls
+are only counted when made through client.GitHubAPI, as are retries of them.
+Metrics aggregates Delivery records in process memory.
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import time
+
+import gidgethub.routing
+import gidgethub.sansio
+
+
+_DELIVERY = contextvars.ContextVar("instrument_delivery", default=None)
+_HANDLER = contextvars.ContextVar("instrument_handler", default=None)
+
+
+class Stats:
+
+    """Count and total up durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Delivery:
+
+    """Timings and GitHub calls for processing a single delivery.
+
+    GitHub calls made outside of any callback are attributed to None.
+    """
+
+    def __init__(self, event=None):
+        self.event = event
+        # Stage -> seconds
+        self.stages = {}
+        # Callback name -> seconds
+        self.handlers = {}
+        # Callback name -> latency of GitHub calls
+        self.calls = collections.defaultdict(Stats)
+        # Callback name -> time waited before retrying GitHub calls
+        self.retries = collections.defaultdict(Stats)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a stage of processing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    @contextlib.contextmanager
+    def active(self):
+        """Attribute callbacks and GitHub calls to this delivery."""
+        token = _DELIVERY.set(self)
+        try:
+            yield self
+        finally:
+            _DELIVERY.reset(token)
+
+    def parse(self, headers, body, *, secret=None):
+        """Create the event like Event.from_http(), timing the steps separately."""
+        if secret is not None and "x-hub-signature" in headers:
+            with self.stage("verify"):
+                gidgethub.sansio.validate_event(
+                    body, signature=headers["x-hub-signature"], secret=secret
+                )
+            headers = {
+                name: value
+                for name, value in headers.items()
+                if name != "x-hub-signature"
+            }
+            secret = None
+        with self.stage("parse"):
+            self.event = gidgethub.sansio.Event.from_http(headers, body, secret=secret)
+        return self.event
+
+    def decode(self):
+        """Decode the payload of a queued event ahead of dispatching it.
+
+        This is timed as part of the "parse" stage rather than being counted
+        against the first callback which reads the payload (see lazyevent).
+        """
+        with self.stage("parse"):
+            self.event.data
+
+    @property
+    def name(self):
+        """The event type and action, e.g. 'issues.opened'."""
+        action = self.event.data.get("action")
+        return f"{self.event.event}.{action}" if action else self.event.event
+
+    def as_dict(self):
+        """Return a summary suitable for structured logging."""
+        handlers = {}
+        for handler, seconds in self.handlers.items():
+            calls = self.calls.get(handler, Stats())
+            handlers[handler] = {
+                "ms": seconds * 1000,
+                "github_calls": calls.count,
+                "github_ms": calls.total * 1000,
+                "github_retries": self.retries.get(handler, Stats()).count,
+            }
+        return {
+            "delivery_id": self.event.delivery_id,
+            "event": self.name,
+            "stages_ms": {stage: secs * 1000 for stage, secs in self.stages.items()},
+            "handlers": handlers,
+            "github_calls": sum(stats.count for stats in self.calls.values()),
+            "github_ms": sum(stats.total for stats in self.calls.values()) * 1000,
+            "github_retries": sum(stats.count for stats in self.retries.values()),
+        }
+
+
+class Metrics:
+
+    """Aggregate Delivery records in process memory.
+
+    Snapshot keys are 'event.<type>.<action>' for the time to dispatch an
+    event, 'stage.<stage>' for each stage of processing (where 'stage.parse'
+    includes decoding the payload), 'handler.<callback>' for the time spent in
+    each callback, 'github.<callback>' for the GitHub calls made by each
+    callback ('github.other' for calls outside a callback), and
+    'retry.<callback>' likewise for the time waited before retrying calls.
+    """
+
+    def __init__(self):
+        self._stats = collections.defaultdict(Stats)
+
+    def add(self, delivery):
+        for stage, seconds in delivery.stages.items():
+            self._stats[f"stage.{stage}"].add(seconds)
+        if "dispatch" in delivery.stages:
+            self._stats[f"event.{delivery.name}"].add(delivery.stages["dispatch"])
+        for handler, seconds in delivery.handlers.items():
+            self._stats[f"handler.{handler}"].add(seconds)
+        for prefix, by_handler in (
+            ("github", delivery.calls),
+            ("retry", delivery.retries),
+        ):
+            for handler, calls in by_handler.items():
+                stats = self._stats[f"{prefix}.{handler or 'other'}"]
+                stats.count += calls.count
+                stats.total += calls.total
+                stats.max = max(stats.max, calls.max)
+
+    def snapshot(self):
+        """Return the aggregated stats by key."""
+        return {key: stats.as_dict() for key, stats in sorted(self._stats.items())}
+
+    def clear(self):
+        self._stats.clear()
+
+
+def report(delivery, metrics, logger=None):
+    """Add the delivery to the metrics and log it as JSON."""
+    metrics.add(delivery)
+    if logger:
+        record = json.dumps(delivery.as_dict(), sort_keys=True)
+        logger.info(f"Metrics for delivery ID {delivery.event.delivery_id}: {record}")
+
+
+def record_call(seconds):
+    """Record a GitHub call against the active delivery and callback (if any)."""
+    delivery = _DELIVERY.get()
+    if delivery is not None:
+        delivery.calls[_HANDLER.get()].add(seconds)
+
+
+def record_retry(delay):
+    """Record waiting 'delay' seconds to retry a GitHub call (see record_call())."""
+    delivery = _DELIVERY.get()
+    if delivery is not None:
+        delivery.retries[_HANDLER.get()].add(delay)
+
+
+def _timed(callback):
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def timed_callback(*args, **kwargs):
+        delivery = _DELIVERY.get()
+        if delivery is None:
+            return await callback(*args, **kwargs)
+        token = _HANDLER.set(name)
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            delivery.handlers[name] = delivery.handlers.get(name, 0.0) + elapsed
+            _HANDLER.reset(token)
+
+    return timed_callback
+
+
+def router(original):
+    """Return a copy of a router whose callbacks are timed."""
+    timed = {}
+
+    def wrap(callback):
+        # Callbacks registered for multiple routes are wrapped once.
+        if callback not in timed:
+            timed[callback] = _timed(callback)
+        return timed[callback]
+
+    instrumented = gidgethub.routing.Router()
+    for event_type, callbacks in original._shallow_routes.items():
+        for callback in callbacks:
+            instrumented.add(wrap(callback), event_type)
+    for event_type, details in original._deep_routes.items():
+        for data_key, data_values in details.items():
+            for data_value, callbacks in data_values.items():
+                for callback in callbacks:
+                    instrumented.add(
+                        wrap(callback), event_type, **{data_key: data_value}
+                    )
+    return instrumented
@@ -0,0 +1,207 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Keep a local journal of webhook events for crash recovery and reprocessing.
+
+Every verified event is appended to the journal before it is dispatched and a
+second record marks how dispatching it finished. Events missing the second
+record were interrupted, e.g. by the process crashing or the function timing
+out, and can be replayed. The journal is a directory of JSON lines files which
+are rotated once they reach a size limit.
+"""
+
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import pathlib
+import time
+
+import gidgethub.sansio
+
+from . import lazyevent, ratelimit
+
+
+_PREFIX = "journal-"
+_SUFFIX = ".jsonl"
+# Outcomes which mean an event may still need handling.
+UNFINISHED = frozenset({None, "deferred"})
+
+
+def files(directory):
+    """Return the journal's files, oldest first."""
+    paths = pathlib.Path(directory).glob(f"{_PREFIX}*{_SUFFIX}")
+    return sorted(paths, key=lambda path: int(path.name[len(_PREFIX) : -len(_SUFFIX)]))
+
+
+class Journal:
+
+    """Append records of events to the newest file in 'directory'.
+
+    Records are flushed to the operating system as they are written so they
+    survive the process crashing, but are only fsync'ed to survive the machine
+    crashing once every 'sync_every' records as that is comparatively slow.
+    Once a file reaches 'max_bytes' a new one is started, and only the newest
+    'keep' files are kept.
+    """
+
+    def __init__(self, directory, *, max_bytes=16 * 1024 * 1024, keep=8, sync_every=16):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.sync_every = sync_every
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = files(self.directory)
+        self._number = (
+            int(existing[-1].name[len(_PREFIX) : -len(_SUFFIX)]) if existing else 1
+        )
+        self._file = self._open()
+        self._unsynced = 0
+
+    def _open(self):
+        path = self.directory / f"{_PREFIX}{self._number:06}{_SUFFIX}"
+        return open(path, "a", encoding="utf-8")
+
+    def record(self, event):
+        """Record an event which is about to be dispatched."""
+        record = {
+            "type": "start",
+            "time": time.time(),
+            "delivery_id": event.delivery_id,
+            "event": event.event,
+        }
+        # A queued event's payload is copied as-is if it was never decoded.
+        self._write(lazyevent.dumps(record, event))
+
+    def finish(self, delivery_id, outcome):
+        """Record how dispatching an event ended ("ok", "deferred" or "error")."""
+        record = {
+            "type": "finish",
+            "time": time.time(),
+            "delivery_id": delivery_id,
+            "outcome": outcome,
+        }
+        self._write(json.dumps(record))
+
+    @contextlib.contextmanager
+    def track(self, event, *, recorded=False):
+        """Record the event and how dispatching it within the block ends.
+
+        If 'recorded' is true then the event is already in the journal and only
+        how dispatching it ends is recorded. Cancellation is left unrecorded as
+        the event was not handled.
+        """
+        if not recorded:
+            self.record(event)
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except ratelimit.Deferred:
+            self.finish(event.delivery_id, "deferred")
+            raise
+        except Exception:
+            self.finish(event.delivery_id, "error")
+            raise
+        else:
+            self.finish(event.delivery_id, "ok")
+
+    def _write(self, line):
+        self._file.write(line + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def sync(self):
+        """Make sure everything written is on disk."""
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def _rotate(self):
+        self.sync()
+        self._file.close()
+        self._number += 1
+        self._file = self._open()
+        for path in files(self.directory)[: -self.keep]:
+            path.unlink()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+
+def read(directory):
+    """Yield every record in the journal, oldest first.
+
+    A line left incomplete by a crash is skipped.
+    """
+    for path in files(directory):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class Entry:
+
+    """An event in the journal and how dispatching it last ended.
+
+    An outcome of None means dispatching never finished.
+    """
+
+    def __init__(self, event, outcome=None):
+        self.event = event
+        self.outcome = outcome
+
+
+def entries(directory):
+    """Return the journal's entries by delivery ID in the order first recorded."""
+    found = collections.OrderedDict()
+    for record in read(directory):
+        delivery_id = record["delivery_id"]
+        if record["type"] == "start":
+            event = gidgethub.sansio.Event(
+                record["data"], event=record["event"], delivery_id=delivery_id
+            )
+            found[delivery_id] = Entry(event)
+        elif delivery_id in found:
+            found[delivery_id].outcome = record["outcome"]
+    return found
+
+
+async def replay(router, gh_factory, events, *, journal=None, logger=None):
+    """Dispatch events again one at a time, waiting out rate limits.
+
+    Replays are recorded in 'journal' (if provided). Returns the outcome for
+    each delivery ID.
+    """
+    outcomes = collections.OrderedDict()
+    for event in events:
+        while True:
+            if journal is not None:
+                tracking = journal.track(event)
+            else:
+                tracking = contextlib.nullcontext()
+            try:
+                with tracking:
+                    await router.dispatch(event, gh_factory(event), logger=logger)
+            except ratelimit.Deferred as exc:
+                await asyncio.sleep(exc.retry_after)
+                continue
+            except Exception:
+                if logger:
+                    logger.exception(
+                        f"Replaying delivery ID {event.delivery_id} failed"
+                    )
+                outcomes[event.delivery_id] = "error"
+            else:
+                outcomes[event.delivery_id] = "ok"
+            break
+    return outcomes
@@ -0,0 +1,78 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Queued events whose payload is only decoded once something reads it.
+
+Payloads run to tens of kilobytes, mostly of details no callback looks at.
+Events loaded back from a queue keep the payload's JSON text until it is first
+read, so those which are never dispatched (e.g. duplicates dropped from a
+batch) don't pay for decoding it, and those queued again before being
+dispatched don't pay for encoding it again either. Webhook deliveries are
+parsed by gidgethub as usual; dispatched events are still decoded in full.
+"""
+
+import json
+
+
+_UNDECODED = object()
+
+
+class LazyEvent:
+
+    """A stand-in for gidgethub.sansio.Event which decodes 'data' on first use.
+
+    'payload' is the JSON text of the payload.
+    """
+
+    __slots__ = ("event", "delivery_id", "_payload", "_data")
+
+    def __init__(self, payload, *, event, delivery_id):
+        self.event = event
+        self.delivery_id = delivery_id
+        self._payload = payload
+        self._data = _UNDECODED
+
+    @property
+    def decoded(self):
+        """Whether the payload has been decoded."""
+        return self._data is not _UNDECODED
+
+    @property
+    def data(self):
+        if self._data is _UNDECODED:
+            self._data = json.loads(self._payload)
+            self._payload = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._payload = None
+
+
+def payload_json(event):
+    """Return an event's payload as JSON text, reusing the original if possible."""
+    if isinstance(event, LazyEvent) and not event.decoded:
+        return event._payload
+    return json.dumps(event.data)
+
+
+def dumps(record, event):
+    """Serialize 'record' to one line of JSON with the event's payload as "data"."""
+    serialized = json.dumps(record)
+    separator = ", " if record else ""
+    return f'{serialized[:-1]}{separator}"data": {payload_json(event)}}}'
+
+
+def loads(serialized):
+    """Deserialize what dumps() returned, leaving the payload undecoded.
+
+    Returns the record and the payload's JSON text.
+    """
+    # The payload comes last, and quotes within the record's strings are
+    # escaped, so the first "data" key is the payload's.
+    head, separator, payload = serialized.partition('"data": ')
+    if not separator:
+        raise ValueError("no payload")
+    record = json.loads(head.rstrip(", ") + "}")
+    return record, payload.rstrip()[:-1]
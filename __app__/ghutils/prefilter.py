@@ -0,0 +1,49 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Skip deliveries which no callback would handle without fully parsing them."""
+
+import re
+
+
+# GitHub puts the action first in a payload, so there's no need to decode it all.
+_ACTION = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([A-Za-z_]+)"')
+
+
+class Prefilter:
+
+    """Decide from a router's registrations whether a delivery is worth handling.
+
+    When the event type or action can't be found cheaply, or a callback is
+    registered on some detail of the payload other than the action, the
+    delivery is handled. The 'skipped' attribute counts how many deliveries
+    were not.
+    """
+
+    def __init__(self, router):
+        self.skipped = 0
+        # Event types with a callback for every delivery.
+        self._all = set(router._shallow_routes)
+        # Event type -> actions with a callback.
+        self._actions = {}
+        for event_type, details in router._deep_routes.items():
+            if event_type in self._all:
+                continue
+            elif set(details) != {"action"}:
+                self._all.add(event_type)
+            else:
+                self._actions[event_type] = frozenset(details["action"])
+
+    def wanted(self, headers, body):
+        """Return true if the delivery should be handled."""
+        event_type = headers.get("x-github-event")
+        if event_type is None or event_type in self._all:
+            return True
+        elif event_type in self._actions:
+            match = _ACTION.match(body)
+            if match is None:
+                return True
+            elif match.group(1).decode("ascii") in self._actions[event_type]:
+                return True
+        self.skipped += 1
+        return False
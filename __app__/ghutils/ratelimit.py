@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Pace requests to GitHub before it starts rejecting them."""
+
+import asyncio
+import time
+
+import gidgethub.sansio
+
+
+class Deferred(Exception):
+
+    """Work should be retried after 'retry_after' seconds due to rate limiting."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited; retry after {retry_after:.1f} seconds")
+        self.retry_after = retry_after
+
+
+class Scheduler:
+
+    """Track the rate limit of a requester and pace requests accordingly.
+
+    Reads are never delayed. Once fewer than 'reserve' requests remain,
+    mutations are spread evenly over the time left until the rate limit resets.
+    If that means waiting more than 'max_delay' seconds then Deferred is raised
+    instead. Deferred is also raised when GitHub rejects a request due to a
+    primary or secondary rate limit, and for any request made until the
+    requested back-off has passed.
+    """
+
+    def __init__(self, *, reserve=500, max_delay=5):
+        self.reserve = reserve
+        self.max_delay = max_delay
+        self.rate_limit = None
+        self.blocked_until = 0.0
+
+    async def pace(self, method):
+        """Wait until a request may be made."""
+        now = time.time()
+        if now < self.blocked_until:
+            raise Deferred(self.blocked_until - now)
+        elif method == "GET" or self.rate_limit is None:
+            return
+        elif self.rate_limit.remaining > self.reserve:
+            return
+        window = self.rate_limit.reset_datetime.timestamp() - now
+        if window <= 0:
+            return
+        delay = window / max(self.rate_limit.remaining, 1)
+        if delay > self.max_delay:
+            raise Deferred(delay)
+        await asyncio.sleep(delay)
+
+    def observe(self, status, headers):
+        """Update the rate limit details from a response."""
+        rate_limit = gidgethub.sansio.RateLimit.from_http(headers)
+        if rate_limit is not None:
+            self.rate_limit = rate_limit
+        if status not in {403, 429}:
+            return
+        elif "retry-after" in headers:
+            # Secondary rate limit.
+            wait = float(headers["retry-after"])
+        elif rate_limit is not None and not rate_limit.remaining:
+            wait = max(rate_limit.reset_datetime.timestamp() - time.time(), 0)
+        else:
+            # Some other reason for being forbidden.
+            return
+        self.blocked_until = time.time() + wait
+        raise Deferred(wait)
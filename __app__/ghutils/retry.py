@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Retry requests to GitHub which failed for transient reasons.
+
+Dropped connections, timeouts and 5xx responses from GitHub usually succeed
+when tried again shortly after, which is much cheaper than failing the whole
+delivery and having GitHub redeliver it. Rate limiting is left to the
+ratelimit module as retrying early only makes it worse.
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from . import instrument
+
+
+RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+RETRYABLE_ERRORS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class Policy:
+
+    """Retry up to 'attempts' times in total within 'budget' seconds.
+
+    The wait before each retry is drawn at random from between zero and an
+    exponentially growing ceiling ("full jitter") starting at 'base' seconds
+    and capped at 'cap' seconds, so clients failing together don't retry in
+    lockstep. A retry which couldn't start before the budget runs out isn't
+    made; keep the budget well within the function's timeout.
+    """
+
+    def __init__(self, *, attempts=3, base=0.5, cap=8.0, budget=30.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+
+    def backoff(self, attempt, elapsed):
+        """Return how long to wait before retrying, or None to give up.
+
+        'attempt' is how many attempts have been made so far and 'elapsed' is
+        how many seconds they took.
+        """
+        if attempt >= self.attempts:
+            return None
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        if elapsed + delay > self.budget:
+            return None
+        return delay
+
+    async def call(self, request):
+        """Make a request, retrying it while it fails transiently.
+
+        'request' is a coroutine function returning the response's status,
+        headers and body. Once retries are exhausted the last response is
+        returned or the last exception raised.
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await request()
+            except RETRYABLE_ERRORS:
+                delay = self.backoff(attempt, time.monotonic() - start)
+                if delay is None:
+                    raise
+            else:
+                if response[0] not in RETRYABLE_STATUSES:
+                    return response
+                delay = self.backoff(attempt, time.monotonic() - start)
+                if delay is None:
+                    return response
+            instrument.record_retry(delay)
+            await asyncio.sleep(delay)
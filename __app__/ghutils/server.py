@@ -2,20 +2,135 @@
 # Licensed under the MIT License.
 
 import asyncio
+import contextlib
 
 import gidgethub.sansio
 
+from . import instrument, ratelimit
 
-async def serve(gh, router, headers, body, *, secret=None, logger=None, pause=1):
-    """Process the webhook event based on the raw HTTP request."""
-    event = gidgethub.sansio.Event.from_http(headers, body, secret=secret)
+
+def _duplicate(event, dedup, logger):
+    if dedup is None or dedup.claim(event.delivery_id):
+        return False
+    if logger:
+        logger.info(
+            f"Dropping duplicate delivery ID {event.delivery_id}"
+            f" ({dedup.duplicates} duplicates dropped)"
+        )
+    return True
+
+
+def _unwanted(headers, body, prefilter, logger):
+    if prefilter is None or prefilter.wanted(headers, body):
+        return False
+    if logger:
+        logger.info(
+            f"Skipping delivery ID {headers.get('x-github-delivery')}"
+            f" of unhandled {headers.get('x-github-event')} event"
+            f" ({prefilter.skipped} skipped)"
+        )
+    return True
+
+
+async def serve(
+    gh,
+    router,
+    headers,
+    body,
+    *,
+    secret=None,
+    logger=None,
+    pause=1,
+    retry_queue=None,
+    dedup=None,
+    metrics=None,
+    prefilter=None,
+    journal=None,
+):
+    """Process the webhook event based on the raw HTTP request.
+
+    If processing is deferred due to rate limiting then the event is put on the
+    retry queue (if provided). Deliveries which the deduplicator (if provided)
+    has already seen are dropped. If 'metrics' is provided then the timings of
+    processing the event are added to it and logged. Deliveries which the
+    prefilter (if provided) says no callback handles are skipped before being
+    verified or parsed. If 'gh' is callable then it is called with the event to
+    create the GitHubAPI instance only once the event is known to be wanted,
+    before the pause so connecting to GitHub overlaps it. If 'journal' is provided then the event is recorded in it
+    before being dispatched, along with how dispatching it ended.
+    """
+    if _unwanted(headers, body, prefilter, logger):
+        return
+    delivery = instrument.Delivery()
+    event = delivery.parse(headers, body, secret=secret)
     if logger:
         logger.info(f"GitHub delivery ID: {event.delivery_id}")
+    if _duplicate(event, dedup, logger):
+        return
+    if callable(gh):
+        gh = gh(event)
     # Give GitHub some time to reach internal consistency.
     await asyncio.sleep(pause)
-    await router.dispatch(event, gh, logger=logger)
+    if journal is not None:
+        tracking = journal.track(event)
+    else:
+        tracking = contextlib.nullcontext()
+    try:
+        with delivery.active(), delivery.stage("dispatch"), tracking:
+            await router.dispatch(event, gh, logger=logger)
+    except ratelimit.Deferred as exc:
+        if retry_queue is None:
+            if dedup is not None:
+                dedup.release(event.delivery_id)
+            raise
+        if logger:
+            logger.info(
+                f"Deferring delivery ID {event.delivery_id} for {exc.retry_after:.1f} seconds"
+            )
+        await retry_queue.put(event, delay=exc.retry_after)
+    except Exception:
+        # Let GitHub redeliver the event.
+        if dedup is not None:
+            dedup.release(event.delivery_id)
+        raise
+    finally:
+        if metrics is not None:
+            instrument.report(delivery, metrics, logger)
     if logger:
         try:
             logger.info(f"GitHub requests remaining: {gh.rate_limit.remaining}")
         except AttributeError:
             logger.info("No rate limit data provided")
+
+
+async def acknowledge(
+    queue,
+    headers,
+    body,
+    *,
+    secret=None,
+    logger=None,
+    dedup=None,
+    prefilter=None,
+    journal=None,
+):
+    """Verify the webhook event and queue it for processing in the background.
+
+    The pause for GitHub's internal consistency is left to the queue.
+    Deliveries which the deduplicator (if provided) has already seen are
+    dropped, and those the prefilter (if provided) rejects are skipped. The
+    event is recorded in the journal (if provided) before being queued so it
+    isn't lost if the process ends before a worker gets to it.
+    """
+    if _unwanted(headers, body, prefilter, logger):
+        return
+    event = gidgethub.sansio.Event.from_http(headers, body, secret=secret)
+    if logger:
+        logger.info(f"GitHub delivery ID: {event.delivery_id}")
+    if _duplicate(event, dedup, logger):
+        return
+    if journal is not None:
+        journal.record(event)
+    await queue.put(event)
+    if logger:
+        logger.info(f"Queued delivery ID {event.delivery_id}")
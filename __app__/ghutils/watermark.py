@@ -0,0 +1,73 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Remember how far periodic work has got, e.g. the newest update synced.
+
+Watermarks are only ever advanced from the value a run started with, so when
+two runs overlap only the first to finish moves the watermark.
+"""
+
+import sqlite3
+
+
+class MemoryWatermarks:
+
+    """Keep watermarks in process memory."""
+
+    def __init__(self):
+        self._marks = {}
+
+    def get(self, key):
+        """Return the watermark for 'key', or None if there is none yet."""
+        return self._marks.get(key)
+
+    def advance(self, key, previous, value):
+        """Set the watermark to 'value' if it is still 'previous'.
+
+        Returns true if the watermark was set.
+        """
+        if self._marks.get(key) != previous:
+            return False
+        self._marks[key] = value
+        return True
+
+
+class SQLiteWatermarks:
+
+    """Keep watermarks in a local SQLite database.
+
+    Watermarks survive the worker process being recycled.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    def get(self, key):
+        """Return the watermark for 'key', or None if there is none yet."""
+        row = self._db.execute(
+            "SELECT value FROM watermarks WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def advance(self, key, previous, value):
+        """Set the watermark to 'value' if it is still 'previous'.
+
+        Returns true if the watermark was set.
+        """
+        if previous is None:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO watermarks (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+        else:
+            cursor = self._db.execute(
+                "UPDATE watermarks SET value = ? WHERE key = ? AND value = ?",
+                (value, key, previous),
+            )
+        return bool(cursor.rowcount)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,249 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Process webhook events in the background after acknowledging them."""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import sqlite3
+import time
+
+from . import instrument, lazyevent, ratelimit
+
+
+def dump_event(event):
+    """Serialize an event to a JSON string."""
+    return lazyevent.dumps(
+        {"event": event.event, "delivery_id": event.delivery_id}, event
+    )
+
+
+def load_event(serialized):
+    """Deserialize an event created by dump_event().
+
+    The payload is only decoded once it is read (see lazyevent).
+    """
+    details, payload = lazyevent.loads(serialized)
+    return lazyevent.LazyEvent(
+        payload, event=details["event"], delivery_id=details["delivery_id"]
+    )
+
+
+class MemoryStore:
+
+    """Hold queued events in process memory.
+
+    Events are handed out once due, earliest first, so an event which has to
+    wait (e.g. due to rate limiting) doesn't hold up those queued after it.
+    """
+
+    def __init__(self):
+        # (due, order queued, event)
+        self._heap = []
+        self._order = itertools.count()
+        self._changed = asyncio.Event()
+
+    async def put(self, due, event):
+        heapq.heappush(self._heap, (due, next(self._order), event))
+        self._changed.set()
+
+    async def get(self):
+        while True:
+            timeout = None
+            if self._heap:
+                timeout = self._heap[0][0] - time.time()
+                if timeout <= 0:
+                    due, _, event = heapq.heappop(self._heap)
+                    return due, event
+            # Wait until the earliest event is due or an event is queued.
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SQLiteStore:
+
+    """Hold queued events in a local SQLite database.
+
+    Events which have not been handed to a worker survive the process being
+    recycled. Like with MemoryStore, events are handed out once due, earliest
+    first.
+    """
+
+    def __init__(self, path, *, poll_interval=0.1):
+        self._poll_interval = poll_interval
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue"
+            " (id INTEGER PRIMARY KEY AUTOINCREMENT, due REAL, event TEXT)"
+        )
+
+    async def put(self, due, event):
+        self._db.execute(
+            "INSERT INTO queue (due, event) VALUES (?, ?)", (due, dump_event(event))
+        )
+
+    async def get(self):
+        while True:
+            row = self._db.execute(
+                "SELECT id, due, event FROM queue ORDER BY due, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                await asyncio.sleep(self._poll_interval)
+            elif row[1] > time.time():
+                # Poll for events queued in the meantime which are due earlier.
+                await asyncio.sleep(min(self._poll_interval, row[1] - time.time()))
+            else:
+                self._db.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+                return row[1], load_event(row[2])
+
+    def take(self, maxsize):
+        """Remove and return up to 'maxsize' of the events which are due.
+
+        Returned as (due, event) pairs in the order they were queued.
+        """
+        rows = self._db.execute(
+            "SELECT id, due, event FROM queue WHERE due <= ? ORDER BY id LIMIT ?",
+            (time.time(), maxsize),
+        ).fetchall()
+        self._db.executemany(
+            "DELETE FROM queue WHERE id = ?", [(row[0],) for row in rows]
+        )
+        return [(row[1], load_event(row[2])) for row in rows]
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+class WorkQueue:
+
+    """Dispatch queued events through a router with a pool of workers.
+
+    Every event waits 'delay' seconds from when it was queued before being
+    dispatched to give GitHub time to reach internal consistency. The
+    'gh_factory' is called with each event to create its GitHubAPI instance.
+    Events deferred due to rate limiting are queued again to be dispatched
+    once the rate limit allows; meanwhile workers handle events which are due.
+    If 'key' is provided then it maps an event to its subject (e.g. an issue),
+    and the subject's events queued after a deferred one are held back until
+    it has been dispatched so they aren't handled out of order. If 'metrics'
+    is provided then the timings of dispatching each event are added to it
+    and logged. If 'journal' is provided then how dispatching each event ended is
+    recorded in it; the event itself is expected to have been recorded when it
+    was first received (see server.acknowledge() and server.serve()) so its
+    payload isn't written again. How many events failed to be dispatched is
+    kept in 'failed'.
+    """
+
+    def __init__(
+        self,
+        router,
+        gh_factory,
+        *,
+        store=None,
+        workers=4,
+        delay=1,
+        key=None,
+        logger=None,
+        metrics=None,
+        journal=None,
+    ):
+        self._router = router
+        self._gh_factory = gh_factory
+        self._store = store if store is not None else MemoryStore()
+        self._worker_count = workers
+        self.delay = delay
+        self._key = key
+        # Subject -> (delivery ID, due) of its deferred event
+        self._held = {}
+        self._logger = logger
+        self._metrics = metrics
+        self._journal = journal
+        self._workers = []
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self.failed = 0
+
+    async def put(self, event, *, delay=None):
+        """Queue an event to be dispatched after a delay."""
+        if delay is None:
+            delay = self.delay
+        await self._enqueue(time.time() + delay, event)
+
+    async def _enqueue(self, due, event):
+        self._unfinished += 1
+        self._finished.clear()
+        await self._store.put(due, event)
+
+    def start(self):
+        """Start the workers (if they are not already running)."""
+        while len(self._workers) < self._worker_count:
+            self._workers.append(asyncio.ensure_future(self._work()))
+
+    async def join(self):
+        """Wait until every queued event has been processed."""
+        await self._finished.wait()
+
+    async def close(self):
+        """Stop all workers."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def _work(self):
+        while True:
+            _, event = await self._store.get()
+            subject = self._key(event) if self._key is not None else None
+            held = self._held.get(subject)
+            if held is not None and held[0] != event.delivery_id:
+                # Due at the same time but queued later, so it comes next.
+                await self._store.put(held[1], event)
+                continue
+            self._held.pop(subject, None)
+            try:
+                gh = self._gh_factory(event)
+                delivery = instrument.Delivery(event)
+                if self._journal is not None:
+                    tracking = self._journal.track(event, recorded=True)
+                else:
+                    tracking = contextlib.nullcontext()
+                try:
+                    with delivery.active(), tracking:
+                        delivery.decode()
+                        with delivery.stage("dispatch"):
+                            await self._router.dispatch(event, gh, logger=self._logger)
+                finally:
+                    if self._metrics is not None:
+                        instrument.report(delivery, self._metrics, self._logger)
+            except asyncio.CancelledError:
+                raise
+            except ratelimit.Deferred as exc:
+                if self._logger:
+                    self._logger.info(
+                        f"Deferring delivery {event.delivery_id} for {exc.retry_after:.1f} seconds"
+                    )
+                due = time.time() + exc.retry_after
+                if subject is not None:
+                    self._held[subject] = event.delivery_id, due
+                await self._enqueue(due, event)
+            except Exception:
+                self.failed += 1
+                if self._logger:
+                    self._logger.exception(
+                        f"Failed to process delivery {event.delivery_id}"
+                    )
+            finally:
+                # Events left over in a persistent store from a previous process
+                # were never counted.
+                self._unfinished = max(self._unfinished - 1, 0)
+                if not self._unfinished:
+                    self._finished.set()
@@ -1,36 +1,625 @@
+"""Azure Function entry point for GitHub webhook deliveries.
+
+Importing this module is kept cheap as it happens on every cold start of the
+function. Modules needed only to talk to GitHub or to queue events (e.g.
+aiohttp) are imported when first used, and the router is only built once a
+delivery arrives. That way deliveries which are skipped, duplicates or pings
+never pay for them.
+"""
+
 import asyncio
+import atexit
+import functools
 import logging
 import os
+import typing
 
-import aiohttp
 import azure.functions as func
-from gidgethub import aiohttp as gh_aiohttp
-from gidgethub import routing
 
-from ..ghutils import ping
+from ..ghutils import instrument
+from ..ghutils import prefilter
+from ..ghutils import ratelimit
 from ..ghutils import server
-from . import classify, closed
+from . import labelcache
 
 
-router = routing.Router(classify.router, closed.router, ping.router)
+REQUESTER = "Microsoft/pvscbot"
+METRICS = instrument.Metrics()
+ROUTER = None
+PREFILTER = None
+CLIENT = None
+COALESCER = None
+REPOSITORIES = None
+REPO_DISPATCHER = None
+LABEL_BACKEND = None
+DEDUPLICATOR = None
+JOURNAL = None
+BATCH = None
+SYNC_WATERMARKS = None
+RETRY_QUEUE = None
+WORK_QUEUE = None
 
-CLIENT_SESSION = None
 
+def event_router():
+    """Return the router with every callback the bot has."""
+    global ROUTER
 
-async def main(req: func.HttpRequest) -> func.HttpResponse:
-    global CLIENT_SESSION
+    if ROUTER is None:
+        from gidgethub import routing
+
+        from ..ghutils import ping
+        from . import classify, closed, labelcache, news
+
+        ROUTER = instrument.router(
+            routing.Router(
+                labelcache.router,
+                classify.router,
+                closed.router,
+                news.router,
+                ping.router,
+            )
+        )
+    return ROUTER
+
+
+def event_prefilter():
+    """Return the prefilter for deliveries no callback handles."""
+    global PREFILTER
+
+    if PREFILTER is None:
+        PREFILTER = prefilter.Prefilter(event_router())
+    return PREFILTER
+
+
+def __getattr__(name):
+    # The router used to be built on import.
+    if name == "router":
+        return event_router()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def response_cache():
+    """Create the cache for conditional requests to GitHub.
+
+    GH_CACHE_SIZE sets the maximum number of responses to keep (0 disables
+    caching) and GH_CACHE_PATH optionally keeps them in a SQLite database.
+    """
+    from ..ghutils import httpcache
+
+    maxsize = int(os.environ.get("GH_CACHE_SIZE", 512))
+    path = os.environ.get("GH_CACHE_PATH")
+    if not maxsize:
+        return None
+    elif path:
+        return httpcache.SQLiteCache(path, maxsize)
+    else:
+        return httpcache.LRUCache(maxsize)
+
+
+def rate_limit_scheduler():
+    """Create a scheduler to pace requests against a rate limit.
+
+    GH_RATE_LIMIT_RESERVE sets how many requests remaining triggers pacing and
+    GH_RATE_LIMIT_MAX_DELAY the longest to wait before deferring an event.
+    """
+    return ratelimit.Scheduler(
+        reserve=int(os.environ.get("GH_RATE_LIMIT_RESERVE", 500)),
+        max_delay=float(os.environ.get("GH_RATE_LIMIT_MAX_DELAY", 5)),
+    )
+
+
+def retry_policy():
+    """Create the policy for retrying requests which failed transiently.
+
+    GH_RETRY_ATTEMPTS sets how many times a request is tried in total (1
+    disables retrying) and GH_RETRY_BUDGET how many seconds may be spent on it;
+    keep the latter well within the function's timeout.
+    """
+    from ..ghutils import retry
+
+    return retry.Policy(
+        attempts=int(os.environ.get("GH_RETRY_ATTEMPTS", 3)),
+        budget=float(os.environ.get("GH_RETRY_BUDGET", 30)),
+    )
+
+
+def installation_tokens():
+    """Create the cache of GitHub App installation tokens, or None if not an App.
+
+    GH_APP_ID is the App's ID and GH_APP_PRIVATE_KEY its private key in PEM
+    format (with newlines optionally written as "\\n"). GH_APP_TOKEN_MARGIN
+    sets how many seconds before expiring a token is replaced.
+    """
+    app_id = os.environ.get("GH_APP_ID")
+    if not app_id:
+        return None
+    from ..ghutils import apps
+
+    return apps.InstallationTokens(
+        app_id,
+        os.environ["GH_APP_PRIVATE_KEY"].replace("\\n", "\n"),
+        margin=float(os.environ.get("GH_APP_TOKEN_MARGIN", apps.DEFAULT_MARGIN)),
+    )
+
+
+def http_client():
+    """Return the client managing connections to GitHub.
+
+    When first created the client starts connecting to GitHub in the background
+    so the first event doesn't pay for it, and its connections are closed when
+    the worker process exits.
+    """
+    global CLIENT
+
+    if CLIENT is None:
+        from ..ghutils import client
+
+        CLIENT = client.Client(
+            limit=int(os.environ.get("GH_HTTP_LIMIT", 100)),
+            limit_per_host=int(os.environ.get("GH_HTTP_LIMIT_PER_HOST", 30)),
+            keepalive_timeout=float(os.environ.get("GH_HTTP_KEEPALIVE", 60)),
+            ttl_dns_cache=int(os.environ.get("GH_HTTP_DNS_TTL", 300)),
+            timeout=float(os.environ.get("GH_HTTP_TIMEOUT", 30)),
+            cache=response_cache(),
+            scheduler_factory=rate_limit_scheduler,
+            maxsize=int(os.environ.get("GH_HTTP_MAX_APIS", 128)),
+            installation_tokens=installation_tokens(),
+            retry_policy=retry_policy(),
+        )
+        atexit.register(CLIENT.close_connections)
+        CLIENT.start_warming()
+    return CLIENT
+
+
+def repositories():
+    """Return the settings of the repositories served, or None if not configured.
+
+    GH_REPOS is the path to a JSON file of settings for each repository (see
+    the 'repos' module). GH_REPO_CONCURRENCY sets how many events for a
+    repository without a limit of its own are handled at once.
+    """
+    global REPOSITORIES
+
+    path = os.environ.get("GH_REPOS")
+    if not path:
+        return None
+    elif REPOSITORIES is None:
+        from . import repos
+
+        REPOSITORIES = repos.load(
+            path,
+            default_token=os.environ.get("GH_AUTH"),
+            concurrency=int(
+                os.environ.get("GH_REPO_CONCURRENCY", repos.DEFAULT_CONCURRENCY)
+            ),
+        )
+    return REPOSITORIES
+
+
+def github_api(event=None):
+    """Return a GitHubAPI instance acting on behalf of the bot.
+
+    When running as a GitHub App, events from an installation are handled with
+    the installation's token. Otherwise the OAuth token is the one for the
+    repository the event is for.
+    """
+    pool = http_client()
+    installation = (event.data.get("installation") or {}) if event is not None else {}
+    if pool.installation_tokens is not None and "id" in installation:
+        return pool.github_api(REQUESTER, installation_id=installation["id"])
+    configured = repositories()
+    if configured is not None and event is not None:
+        oauth_token = configured.for_event(event).oauth_token
+    else:
+        oauth_token = os.environ.get("GH_AUTH")
+    return pool.github_api(REQUESTER, oauth_token=oauth_token)
+
+
+def label_backend():
+    """Return how issues' labels are read and changed.
+
+    GH_LABEL_BACKEND is either "rest" (the default) or "graphql" to send the
+    label changes made within GH_GRAPHQL_WINDOW seconds of each other in a
+    single GraphQL request.
+    """
+    global LABEL_BACKEND
+
+    if LABEL_BACKEND is None:
+        from . import reconcile
+
+        if os.environ.get("GH_LABEL_BACKEND", "rest") == "graphql":
+            from ..ghutils import graphql
+
+            batcher = graphql.Batcher(
+                window=float(os.environ.get("GH_GRAPHQL_WINDOW", 0))
+            )
+            LABEL_BACKEND = reconcile.GraphQLLabels(batcher)
+        else:
+            LABEL_BACKEND = reconcile.RESTLabels()
+        reconcile.BACKEND = LABEL_BACKEND
+    return LABEL_BACKEND
+
+
+def _repository_dispatcher():
+    """Return the router, wrapped to use each repository's settings if configured."""
+    global REPO_DISPATCHER
+
+    configured = repositories()
+    if configured is None:
+        return event_router()
+    elif REPO_DISPATCHER is None:
+        from . import repos
+
+        REPO_DISPATCHER = repos.Dispatcher(event_router(), configured)
+    return REPO_DISPATCHER
+
+
+def _issue_reconciler():
+    """Return what reconciles an issue, with its repository's settings."""
+    from . import reconcile
+
+    target = _repository_dispatcher()
+    if target is REPO_DISPATCHER:
+        return functools.partial(target.call, reconcile.reconcile_issue)
+    return reconcile.reconcile_issue
+
+
+def dispatcher():
+    """Return what webhook events should be dispatched through.
+
+    If the GH_COALESCE_WINDOW environment variable is set then bursts of events
+    for the same issue over that many seconds are reconciled together. When
+    serving multiple repositories, events are dispatched with the settings of
+    the repository they are for; the coalescer is kept in front so an issue's
+    events only count against its repository's concurrency while being handled
+    and not while waiting out the window.
+    """
+    global COALESCER
+
+    label_backend()
+    window = os.environ.get("GH_COALESCE_WINDOW")
+    if not window:
+        return _repository_dispatcher()
+    elif COALESCER is None:
+        from ..ghutils import coalesce
+        from . import reconcile
+
+        COALESCER = coalesce.Coalescer(
+            _repository_dispatcher(), reconcile.issue_key, _issue_reconciler()
+        )
+    COALESCER.window = float(window)
+    return COALESCER
+
+
+def deduplicator():
+    """Return what tracks deliveries to drop redeliveries of the same event.
+
+    GH_DEDUP_TTL sets how many seconds to remember a delivery for and
+    GH_DEDUP_PATH optionally remembers them in a SQLite database.
+    """
+    global DEDUPLICATOR
+
+    if DEDUPLICATOR is None:
+        from ..ghutils import dedup
 
+        ttl = float(os.environ.get("GH_DEDUP_TTL", 3600))
+        path = os.environ.get("GH_DEDUP_PATH")
+        if path:
+            DEDUPLICATOR = dedup.SQLiteDeduplicator(path, ttl=ttl)
+        else:
+            DEDUPLICATOR = dedup.MemoryDeduplicator(ttl=ttl)
+    return DEDUPLICATOR
+
+
+def event_journal():
+    """Return the journal of events for crash recovery, or None if not kept.
+
+    GH_JOURNAL is the directory to keep the journal in. GH_JOURNAL_MAX_BYTES
+    sets the size of each file, GH_JOURNAL_KEEP how many files to keep, and
+    GH_JOURNAL_SYNC_EVERY how many records to write between syncs to disk.
+    """
+    global JOURNAL
+
+    directory = os.environ.get("GH_JOURNAL")
+    if not directory:
+        return None
+    elif JOURNAL is None:
+        from ..ghutils import journal
+
+        JOURNAL = journal.Journal(
+            directory,
+            max_bytes=int(os.environ.get("GH_JOURNAL_MAX_BYTES", 16 * 1024 * 1024)),
+            keep=int(os.environ.get("GH_JOURNAL_KEEP", 8)),
+            sync_every=int(os.environ.get("GH_JOURNAL_SYNC_EVERY", 16)),
+        )
+        atexit.register(JOURNAL.close)
+    return JOURNAL
+
+
+def work_queue():
+    """Return the background work queue, or None if events are served inline.
+
+    The GH_QUEUE environment variable is either "memory" for an in-process
+    queue or the path to a SQLite database to hold queued events.
+    """
+    global WORK_QUEUE
+
+    queue_location = os.environ.get("GH_QUEUE")
+    if not queue_location:
+        return None
+    elif WORK_QUEUE is None:
+        from ..ghutils import workqueue
+        from . import reconcile
+
+        if queue_location == "memory":
+            store = workqueue.MemoryStore()
+        else:
+            store = workqueue.SQLiteStore(queue_location)
+        WORK_QUEUE = workqueue.WorkQueue(
+            dispatcher(),
+            github_api,
+            store=store,
+            workers=int(os.environ.get("GH_QUEUE_WORKERS", 4)),
+            delay=float(os.environ.get("GH_QUEUE_DELAY", 1)),
+            key=reconcile.subject_key,
+            logger=logging,
+            metrics=METRICS,
+            journal=event_journal(),
+        )
+        WORK_QUEUE.start()
+    return WORK_QUEUE
+
+
+def retry_queue():
+    """Return the queue for events deferred due to rate limiting.
+
+    That is the work queue if there is one, else an in-process queue.
+    """
+    global RETRY_QUEUE
+
+    queue = work_queue()
+    if queue is not None:
+        return queue
+    elif RETRY_QUEUE is None:
+        from ..ghutils import workqueue
+        from . import reconcile
+
+        RETRY_QUEUE = workqueue.WorkQueue(
+            dispatcher(),
+            github_api,
+            workers=1,
+            delay=0,
+            key=reconcile.subject_key,
+            logger=logging,
+            metrics=METRICS,
+            journal=event_journal(),
+        )
+        RETRY_QUEUE.start()
+    return RETRY_QUEUE
+
+
+async def _answer_ping(req, body, secret):
+    from ..ghutils import ping
+
+    # Pings only need acknowledging, so nothing is set up for them.
+    await server.serve(
+        None, ping.router, req.headers, body, secret=secret, logger=logging, pause=0
+    )
+    return func.HttpResponse(status_code=200)
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        if CLIENT_SESSION is None:
-            CLIENT_SESSION = aiohttp.ClientSession()
+        labelcache.LABELS.max_age = float(
+            os.environ.get("GH_LABEL_MAX_AGE", labelcache.DEFAULT_MAX_AGE)
+        )
         secret = os.environ.get("GH_SECRET")
-        oauth_token = os.environ.get("GH_AUTH")
         body = req.get_body()
-        gh = gh_aiohttp.GitHubAPI(
-            CLIENT_SESSION, "Microsoft/pvscbot", oauth_token=oauth_token
+        if req.headers.get("x-github-event") == "ping":
+            return await _answer_ping(req, body, secret)
+        queue = work_queue()
+        if queue is not None:
+            await server.acknowledge(
+                queue,
+                req.headers,
+                body,
+                secret=secret,
+                logger=logging,
+                dedup=deduplicator(),
+                prefilter=event_prefilter(),
+                journal=event_journal(),
+            )
+            return func.HttpResponse(status_code=202)
+        await server.serve(
+            github_api,
+            dispatcher(),
+            req.headers,
+            body,
+            secret=secret,
+            logger=logging,
+            pause=float(os.environ.get("GH_PAUSE", 1)),
+            retry_queue=retry_queue(),
+            dedup=deduplicator(),
+            metrics=METRICS,
+            prefilter=event_prefilter(),
+            journal=event_journal(),
         )
-        await server.serve(gh, router, req.headers, body, secret=secret, logger=logging)
+        cache = CLIENT.cache if CLIENT is not None else None
+        if cache is not None:
+            logging.info(
+                f"GitHub response cache: {cache.hits} hits (304s) out of "
+                f"{cache.conditional} conditional requests, {cache.misses} misses"
+            )
         return func.HttpResponse(status_code=200)
     except Exception:
         logging.exception("Unhandled exception")
         return func.HttpResponse(status_code=500)
+
+
+class _Outgoing:
+
+    """Queue events on the Event Hub through a function's output binding."""
+
+    def __init__(self, binding):
+        self._binding = binding
+
+    async def put(self, event):
+        from ..ghutils import workqueue
+
+        self._binding.set(workqueue.dump_event(event))
+
+
+async def publish(req: func.HttpRequest, outgoing: func.Out[str]) -> func.HttpResponse:
+    """Azure Function entry point queueing webhook events on the Event Hub.
+
+    Deliveries are verified and prefiltered, then sent as serialized by
+    workqueue.dump_event() for queued() to handle in batches. Duplicates are
+    left for queued() to drop.
+    """
+    try:
+        secret = os.environ.get("GH_SECRET")
+        body = req.get_body()
+        if req.headers.get("x-github-event") == "ping":
+            return await _answer_ping(req, body, secret)
+        await server.acknowledge(
+            _Outgoing(outgoing),
+            req.headers,
+            body,
+            secret=secret,
+            logger=logging,
+            prefilter=event_prefilter(),
+        )
+        return func.HttpResponse(status_code=202)
+    except Exception:
+        logging.exception("Unhandled exception")
+        return func.HttpResponse(status_code=500)
+
+
+def batch_dispatcher():
+    """Return what dispatches batches of queued events.
+
+    GH_BATCH_CONCURRENCY sets how many issues' events are handled at once.
+    """
+    global BATCH
+
+    from . import reconcile
+
+    target = dispatcher()
+    if BATCH is None:
+        from ..ghutils import batch
+
+        BATCH = batch.Batch(
+            target,
+            github_api,
+            key=reconcile.subject_key,
+            mergeable=reconcile.issue_key,
+            limit=int(os.environ.get("GH_BATCH_CONCURRENCY", 8)),
+            logger=logging,
+            metrics=METRICS,
+        )
+    BATCH.router = target
+    # Merged events are reconciled with their repository's settings too.
+    BATCH.reconcile = _issue_reconciler()
+    return BATCH
+
+
+async def process_batch(events):
+    """Handle a batch of queued webhook events.
+
+    Duplicate deliveries are dropped. Returns (event, retry_after) for the
+    events deferred due to rate limiting; they are forgotten by the
+    deduplicator so they are handled when retried.
+    """
+    dedup = deduplicator()
+    fresh = []
+    for event in events:
+        if dedup.claim(event.delivery_id):
+            fresh.append(event)
+        else:
+            logging.info(f"Dropping duplicate delivery ID {event.delivery_id}")
+    deferred = await batch_dispatcher().dispatch(fresh)
+    for event, _ in deferred:
+        dedup.release(event.delivery_id)
+    return deferred
+
+
+async def queued(events: typing.List[func.EventHubEvent]) -> None:
+    """Azure Function entry point for batches of queued webhook events.
+
+    Every event's body is an event serialized by workqueue.dump_event(). If
+    any event is deferred the batch fails, so the trigger's retry policy
+    retries it before checkpointing instead of the event being lost; the
+    events already handled are then dropped as duplicates.
+    """
+    from ..ghutils import workqueue
+
+    loaded = [
+        workqueue.load_event(event.get_body().decode("utf-8")) for event in events
+    ]
+    deferred = await process_batch(loaded)
+    if deferred:
+        raise ratelimit.Deferred(max(retry_after for _, retry_after in deferred))
+
+
+def sync_watermarks():
+    """Return where the watermarks of scheduled syncs are kept, or None if off.
+
+    GH_SYNC_PATH is the path to a SQLite database to keep them in.
+    """
+    global SYNC_WATERMARKS
+
+    path = os.environ.get("GH_SYNC_PATH")
+    if not path:
+        return None
+    elif SYNC_WATERMARKS is None:
+        from ..ghutils import watermark
+
+        SYNC_WATERMARKS = watermark.SQLiteWatermarks(path)
+    return SYNC_WATERMARKS
+
+
+async def scheduled(timer: func.TimerRequest) -> None:
+    """Azure Function entry point syncing the issues updated since the last run.
+
+    GH_SYNC_REPOS lists the repositories to sync, separated by commas, and
+    GH_SYNC_LOOKBACK how many seconds back the first sync of one looks. When
+    running as a GitHub App, each repository is synced with the token of the
+    App's installation on it. A repository failing to sync, e.g. due to rate
+    limiting, leaves its watermark as it is so the next run tries again.
+    """
+    watermarks = sync_watermarks()
+    names = [
+        name.strip()
+        for name in os.environ.get("GH_SYNC_REPOS", "").split(",")
+        if name.strip()
+    ]
+    if watermarks is None or not names:
+        logging.info("No repositories to sync")
+        return
+    from . import labelrules, sync
+
+    label_backend()
+    lookback = float(os.environ.get("GH_SYNC_LOOKBACK", sync.DEFAULT_LOOKBACK))
+    configured = repositories()
+    pool = http_client()
+    for name in names:
+        if configured is not None:
+            repository = configured.get(name)
+            oauth_token, rules = repository.oauth_token, repository.rules
+        else:
+            oauth_token, rules = os.environ.get("GH_AUTH"), None
+        with labelrules.active(rules):
+            try:
+                tokens = pool.installation_tokens
+                if tokens is not None:
+                    installation_id = await tokens.installation_id(
+                        pool.github_api(REQUESTER), name
+                    )
+                    gh = pool.github_api(REQUESTER, installation_id=installation_id)
+                else:
+                    gh = pool.github_api(REQUESTER, oauth_token=oauth_token)
+                changes = await sync.sync(gh, name, watermarks, lookback=lookback)
+            except Exception:
+                logging.exception(f"Syncing {name} failed")
+            else:
+                logging.info(f"Synced {name}: {len(changes)} issues changed")
@@ -0,0 +1,161 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Reconcile the labels of every issue in a repository.
+
+Issues which were missed while the bot was down, or which predate a change to
+the rules, only get fixed once something happens to them. This applies the
+same rules as the webhook callbacks to all issues at once. Run with:
+
+    GH_AUTH=<token> python -m __app__.github.backfill OWNER/REPO [--dry-run]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import sys
+
+from ..ghutils import client, fanout, graphql, ratelimit
+from .. import github as github_main
+from . import reconcile
+
+
+class Change:
+
+    """Labels an issue has and the labels it should have."""
+
+    def __init__(self, issue, current, target):
+        self.issue = issue
+        self.current = current
+        self.target = target
+
+    def __str__(self):
+        added = [f"+{label}" for label in sorted(self.target - self.current)]
+        removed = [f"-{label}" for label in sorted(self.current - self.target)]
+        return f"#{self.issue['number']}: {' '.join(added + removed)}"
+
+
+def review(issue):
+    """Return the Change an issue's labels need, or None if they are right.
+
+    Pull requests are left alone.
+    """
+    if "pull_request" in issue:
+        return None
+    current = frozenset(label["name"] for label in issue["labels"])
+    target = reconcile.target_labels(issue["state"], current)
+    return Change(issue, current, target) if target != current else None
+
+
+async def plan(gh, repo, *, state="open"):
+    """Yield a Change for every issue in 'repo' whose labels need changing."""
+    owner, _, name = repo.partition("/")
+    url = "/repos/{owner}/{name}/issues{?state,per_page}"
+    url_vars = {"owner": owner, "name": name, "state": state, "per_page": 100}
+    async for issue in gh.getiter(url, url_vars):
+        change = review(issue)
+        if change is not None:
+            yield change
+
+
+async def apply(gh, change):
+    """Apply a change, waiting out any rate limit."""
+    while True:
+        try:
+            # The issue may have changed since it was listed, so only send the
+            # difference instead of replacing all labels.
+            await reconcile.apply_labels(
+                gh, change.issue, change.current, change.target
+            )
+        except ratelimit.Deferred as exc:
+            await asyncio.sleep(exc.retry_after)
+        else:
+            return
+
+
+async def backfill(
+    gh, repo, *, state="open", dry_run=False, limit=fanout.DEFAULT_LIMIT, out=None
+):
+    """Reconcile the labels of the issues in 'repo', returning the changes.
+
+    Every change is written to 'out' (if provided). Unless 'dry_run' is true,
+    changes are then applied with at most 'limit' issues being changed at once.
+    """
+    changes = []
+    async for change in plan(gh, repo, state=state):
+        changes.append(change)
+        if out is not None:
+            print(change, file=out)
+    if not dry_run:
+        await fanout.gather([apply(gh, change) for change in changes], limit=limit)
+    return changes
+
+
+@contextlib.asynccontextmanager
+async def command_line_api():
+    """Provide a GitHubAPI instance using GH_AUTH for running from the command line.
+
+    Rate limits are waited out instead of deferring work like the webhook does.
+    """
+    http_client = client.Client(
+        scheduler_factory=lambda: ratelimit.Scheduler(max_delay=math.inf)
+    )
+    try:
+        yield http_client.github_api(
+            github_main.REQUESTER, oauth_token=os.environ.get("GH_AUTH")
+        )
+    finally:
+        await http_client.close()
+
+
+def report(changes, *, dry_run):
+    """Print how many issues were (or would have been) changed."""
+    if dry_run:
+        print(f"{len(changes)} issues need changes", file=sys.stderr)
+    else:
+        print(f"{len(changes)} issues changed", file=sys.stderr)
+
+
+async def _main(args):
+    if args.graphql:
+        reconcile.BACKEND = reconcile.GraphQLLabels(graphql.Batcher())
+    async with command_line_api() as gh:
+        changes = await backfill(
+            gh,
+            args.repo,
+            state=args.state,
+            dry_run=args.dry_run,
+            limit=args.limit,
+            out=sys.stdout,
+        )
+    report(changes, dry_run=args.dry_run)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("repo", help="repository as OWNER/REPO")
+    parser.add_argument(
+        "--state",
+        choices=["open", "closed", "all"],
+        default="open",
+        help="which issues to reconcile (default: open)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only print the changes")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=fanout.DEFAULT_LIMIT,
+        help="most issues to change at once",
+    )
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="change labels through batched GraphQL requests",
+    )
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 
 import gidgethub.routing
 
-from . import labels
+from . import labelrules, reconcile
 
 router = gidgethub.routing.Router()
 
@@ -14,23 +14,19 @@ def is_opened(event):
 
 def has_classify(event):
     return any(
-        label["name"] == labels.Status.classify.value
+        label["name"] == labelrules.current().classify
         for label in event.data["issue"]["labels"]
     )
 
 
-async def add_classify_label(gh, event):
-    await gh.post(
-        event.data["issue"]["labels_url"],
-        data={"labels": [labels.Status.classify.value]},
-    )
+def current_labels(event):
+    return frozenset(label["name"] for label in event.data["issue"]["labels"])
 
 
-def classify_unneeded(labels_to_check):
-    """Determine if an existing label negates needing 'classify'."""
-    status_labels = set(labels.STATUS_LABELS) | labels.CLASSIFICATION_LABELS
-    status_labels.add(labels.Team.data_science.value)
-    return any(label in status_labels for label in labels_to_check)
+async def update_labels(gh, event, current):
+    """Apply whatever changes the rules call for to the issue's labels."""
+    target = reconcile.target_labels(event.data["issue"]["state"], current)
+    await reconcile.apply_labels(gh, event.data["issue"], current, target)
 
 
 # Removing 'classify' from closed issues is taken care of in the 'closed' submodule.
@@ -39,16 +35,16 @@ def classify_unneeded(labels_to_check):
 async def classify_new_issue(event, gh, *args, **kwargs):
     """Add the 'classify' label."""
     issue = event.data["issue"]
-    existing_labels = {label["name"] for label in issue["labels"]}
-    if classify_unneeded(existing_labels):
+    existing_labels = current_labels(event)
+    if reconcile.classify_unneeded(existing_labels):
         # Teammate pre-classified the issue when creating it.
         return
-    async for label in gh.getiter(issue["labels_url"]):
-        if classify_unneeded({label["name"]}):
-            # Issue already has a status label.
-            return
+    latest_labels = await reconcile.read_labels(gh, issue)
+    if reconcile.classify_unneeded(latest_labels):
+        # Issue already has a status label.
+        return
     else:
-        await add_classify_label(gh, event)
+        await update_labels(gh, event, latest_labels)
 
 
 @router.register("issues", action="labeled")
@@ -57,24 +53,17 @@ async def added_label(event, gh, *args, **kwargs):
     added_label = event.data["label"]["name"]
     if not is_opened(event):
         return
-    elif added_label == labels.Status.classify.value:
+    elif added_label == labelrules.current().classify:
         return
     elif has_classify(event):
-        if classify_unneeded({added_label}):
-            try:
-                await gh.delete(
-                    event.data["issue"]["labels_url"],
-                    {"name": labels.Status.classify.value},
-                )
-            except gidgethub.BadRequest as exc:
-                if not "Label does not exist" in str(exc):
-                    raise
+        # The issue's labels in the payload may not include the added label yet.
+        await update_labels(gh, event, current_labels(event) | {added_label})
 
 
 @router.register("issues", action="unlabeled")
 async def removed_label(event, gh, *args, **kwargs):
-    remaining_labels = {label["name"] for label in event.data["issue"]["labels"]}
-    if not is_opened(event) or classify_unneeded(remaining_labels):
+    remaining_labels = current_labels(event)
+    if not is_opened(event) or reconcile.classify_unneeded(remaining_labels):
         return
     else:
-        await add_classify_label(gh, event)
+        await update_labels(gh, event, remaining_labels)
@@ -3,20 +3,19 @@
 
 import gidgethub.routing
 
-from . import labels
+from . import reconcile
 
 
 router = gidgethub.routing.Router()
 
-ALL_STATUS_LABELS = {label.value for label in labels.Status}
-
 
 @router.register("issues", action="closed")
 async def remove_status_labels(event, gh, *args, **kwargs):
     """Remove all status-related labels."""
-    labels = event.data["issue"]["labels"]
-    labels_url = event.data["issue"]["labels_url"]
-    for label in labels:
-        label_name = label["name"]
-        if label_name in ALL_STATUS_LABELS:
-            await gh.delete(labels_url, {"name": label_name})
+    issue = event.data["issue"]
+    current = frozenset(label["name"] for label in issue["labels"])
+    target = reconcile.closed_rule(issue["state"], current)
+    # The payload's labels may be stale by the time the event is handled, so
+    # only remove labels instead of replacing them all; anything added in the
+    # meantime is kept.
+    await reconcile.apply_labels(gh, issue, current, target)
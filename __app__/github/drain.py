@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Handle the events queued in a local SQLite database in batches.
+
+This stands in for the Event Hub feeding the batch entry point, e.g. to try
+out batching against events queued with GH_QUEUE set to a database path.
+Run with:
+
+    GH_AUTH=<token> python -m __app__.github.drain DATABASE [--size N]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from ..ghutils import workqueue
+from .. import github as github_main
+
+
+async def drain(store, *, size=100, poll_interval=1):
+    """Handle batches of up to 'size' events until 'store' is empty.
+
+    Deferred events are put back in the store until they are due. Returns how
+    many events were taken from the store.
+    """
+    taken = 0
+    while len(store):
+        events = [event for _, event in store.take(size)]
+        if not events:
+            # Everything left was deferred.
+            await asyncio.sleep(poll_interval)
+            continue
+        taken += len(events)
+        for event, retry_after in await github_main.process_batch(events):
+            await store.put(time.time() + retry_after, event)
+    return taken
+
+
+async def _main(args):
+    store = workqueue.SQLiteStore(args.database)
+    try:
+        taken = await drain(store, size=args.size)
+    finally:
+        store.close()
+        # Nothing was connected if no event got as far as GitHub.
+        if github_main.CLIENT is not None:
+            await github_main.CLIENT.close()
+    print(f"{taken} events handled", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("database", help="SQLite database holding queued events")
+    parser.add_argument(
+        "--size", type=int, default=100, help="most events to handle at once"
+    )
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
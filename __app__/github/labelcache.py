@@ -0,0 +1,98 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Remember the labels of issues to avoid asking GitHub for them again.
+
+The cache is filled from webhook payloads and from the label changes the bot
+makes itself.
+"""
+
+import collections
+import time
+
+import gidgethub.routing
+
+
+DEFAULT_MAX_AGE = 60
+
+router = gidgethub.routing.Router()
+
+
+class LabelCache:
+
+    """Map an issue's labels URL to its most recently known labels.
+
+    Entries older than 'max_age' seconds are considered stale. Payloads are
+    ordered by the issue's 'updated_at' timestamp so that a delayed or
+    redelivered event cannot overwrite newer details.
+    """
+
+    def __init__(self, *, max_age=DEFAULT_MAX_AGE, maxsize=1024):
+        self.max_age = max_age
+        self._maxsize = maxsize
+        # labels URL -> (labels, time recorded, issue's 'updated_at')
+        self._entries = collections.OrderedDict()
+
+    def get(self, labels_url):
+        """Return the known labels, or None if they are unknown or stale."""
+        try:
+            label_names, recorded, _ = self._entries[labels_url]
+        except KeyError:
+            return None
+        if time.monotonic() - recorded > self.max_age:
+            return None
+        self._entries.move_to_end(labels_url)
+        return label_names
+
+    def record(self, labels_url, label_names, *, updated_at=None):
+        """Record the labels an issue currently has.
+
+        If 'updated_at' is not specified then the labels are assumed to be at
+        least as new as what is already known.
+        """
+        try:
+            _, _, known_updated_at = self._entries[labels_url]
+        except KeyError:
+            known_updated_at = None
+        if updated_at is None:
+            updated_at = known_updated_at
+        elif known_updated_at is not None and updated_at < known_updated_at:
+            return
+        self._entries[labels_url] = (
+            frozenset(label_names),
+            time.monotonic(),
+            updated_at,
+        )
+        self._entries.move_to_end(labels_url)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, labels_url):
+        """Forget what is known about an issue's labels."""
+        self._entries.pop(labels_url, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+LABELS = LabelCache()
+
+
+# Only the actions the bot's rules act on, so a delivery of any other action
+# can still be skipped by the prefilter.
+@router.register("issues", action="opened")
+@router.register("issues", action="reopened")
+@router.register("issues", action="labeled")
+@router.register("issues", action="unlabeled")
+@router.register("issues", action="closed")
+async def remember_labels(event, *args, **kwargs):
+    """Record the labels of the issue in the payload."""
+    issue = event.data["issue"]
+    label_names = {label["name"] for label in issue["labels"]}
+    # Don't rely on the issue's labels already reflecting the change.
+    action = event.data.get("action")
+    if action == "labeled":
+        label_names.add(event.data["label"]["name"])
+    elif action == "unlabeled":
+        label_names.discard(event.data["label"]["name"])
+    LABELS.record(issue["labels_url"], label_names, updated_at=issue.get("updated_at"))
@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""The labels in each category the bot's rules act on.
+
+The categories come from the enums in the 'labels' module. Set the
+GH_LABEL_RULES environment variable to the path of a JSON file to override any
+of them, e.g. {"team": ["data science", "xteam"]}, without changing code.
+Repositories with rules of their own make them active while their events are
+handled, so code acting on labels asks for the current() rules.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+
+from . import labels
+
+
+class LabelRules:
+
+    """Frozen indexes of the labels in each category.
+
+    'classify' marks issues nobody has classified yet and is always a status
+    label. 'classifying' holds every label which means an issue has been
+    classified.
+    """
+
+    def __init__(self, *, status, classification, team, classify):
+        self.classify = classify
+        self.status = frozenset(status) | {classify}
+        self.classification = frozenset(classification)
+        self.team = frozenset(team)
+        self.classifying = self.status | self.classification | self.team
+
+
+def defaults():
+    """Return the categories as defined by the label enums."""
+    return {
+        "status": labels.STATUS_LABELS,
+        "classification": labels.CLASSIFICATION_LABELS,
+        "team": {labels.Team.data_science.value},
+        "classify": labels.Status.classify.value,
+    }
+
+
+def build(overrides):
+    """Build the rules from the label enums and a mapping of overrides."""
+    categories = defaults()
+    unknown = set(overrides) - set(categories)
+    if unknown:
+        raise ValueError(f"unknown label categories: {', '.join(sorted(unknown))}")
+    categories.update(overrides)
+    return LabelRules(**categories)
+
+
+def load(path=None):
+    """Build the rules from the label enums and the overrides at 'path'."""
+    if not path:
+        return build({})
+    with open(path, encoding="utf-8") as file:
+        return build(json.load(file))
+
+
+REGISTRY = load(os.environ.get("GH_LABEL_RULES"))
+
+_ACTIVE = contextvars.ContextVar("labelrules_active", default=None)
+
+
+def current():
+    """Return the rules for the repository being handled."""
+    return _ACTIVE.get() or REGISTRY
+
+
+@contextlib.contextmanager
+def active(rules):
+    """Make 'rules' the current rules."""
+    token = _ACTIVE.set(rules)
+    try:
+        yield rules
+    finally:
+        _ACTIVE.reset(token)
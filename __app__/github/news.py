@@ -0,0 +1,68 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Check that pull requests come with a news entry.
+
+A news entry is a Markdown file in a subdirectory of 'news/' for the category
+of the change, e.g. 'news/3 Code Health/3684.md'. Pull requests which don't
+need one get the 'skip news' label.
+"""
+
+import re
+
+import gidgethub.routing
+
+from . import labels
+
+
+router = gidgethub.routing.Router()
+
+NEWS_FILE = re.compile(r"news/[^/]+/[^/]+\.md")
+STATUS_CONTEXT = "pvscbot/news"
+
+
+def has_skip_news(pull_request):
+    return any(
+        label["name"] == labels.Skip.news.value for label in pull_request["labels"]
+    )
+
+
+async def has_news_file(gh, pull_request):
+    """Look for a news entry among the pull request's files.
+
+    Files are listed a page at a time, so the listing stops at the first news
+    entry instead of going through every file of a large pull request.
+    """
+    files_url = pull_request["url"] + "/files{?per_page}"
+    async for changed in gh.getiter(files_url, {"per_page": 100}):
+        if changed["status"] != "removed" and NEWS_FILE.fullmatch(changed["filename"]):
+            return True
+    return False
+
+
+async def set_status(gh, pull_request, state, description):
+    await gh.post(
+        pull_request["statuses_url"],
+        data={"state": state, "context": STATUS_CONTEXT, "description": description},
+    )
+
+
+@router.register("pull_request", action="opened")
+@router.register("pull_request", action="reopened")
+@router.register("pull_request", action="synchronize")
+@router.register("pull_request", action="labeled")
+@router.register("pull_request", action="unlabeled")
+async def check_news(event, gh, *args, **kwargs):
+    """Set a status on the pull request saying whether it has a news entry."""
+    pull_request = event.data["pull_request"]
+    if event.data["action"] in {"labeled", "unlabeled"}:
+        if event.data["label"]["name"] != labels.Skip.news.value:
+            # Other labels don't change the outcome.
+            return
+    if has_skip_news(pull_request):
+        # The label is all that matters, so don't bother listing files.
+        await set_status(gh, pull_request, "success", "Labeled as skipping news")
+    elif await has_news_file(gh, pull_request):
+        await set_status(gh, pull_request, "success", "News entry found")
+    else:
+        await set_status(gh, pull_request, "failure", "No news entry in news/")
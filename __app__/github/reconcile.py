@@ -0,0 +1,262 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Calculate and apply the labels an issue should have.
+
+Rules take the state of an issue and its labels and return the labels the
+issue should have. Running an issue's current labels through all of the rules
+gives the target labels, and only the difference is sent to GitHub.
+"""
+
+import asyncio
+
+import gidgethub
+
+from ..ghutils import fanout
+from . import labelcache, labelrules
+
+
+COALESCED_ACTIONS = frozenset({"opened", "reopened", "labeled", "unlabeled", "closed"})
+
+
+def classify_unneeded(labels_to_check):
+    """Determine if an existing label negates needing 'classify'."""
+    return not labelrules.current().classifying.isdisjoint(labels_to_check)
+
+
+def closed_rule(state, current):
+    """Closed issues have no status labels."""
+    if state == "closed":
+        return current - labelrules.current().status
+    else:
+        return current
+
+
+def classify_rule(state, current):
+    """Open issues need 'classify' until some other label classifies them."""
+    if state != "open":
+        return current
+    classify = labelrules.current().classify
+    without_classify = current - {classify}
+    if classify_unneeded(without_classify):
+        return without_classify
+    else:
+        return without_classify | {classify}
+
+
+RULES = closed_rule, classify_rule
+
+
+def target_labels(state, current, rules=RULES):
+    """Calculate the labels an issue in the specified state should have."""
+    target = frozenset(current)
+    for rule in rules:
+        target = rule(state, target)
+    return target
+
+
+def label_missing(exc):
+    """Check if the exception is from removing a label an issue doesn't have.
+
+    That can happen when the issue changed after the event was sent.
+    """
+    return isinstance(exc, gidgethub.BadRequest) and "Label does not exist" in str(exc)
+
+
+class RESTLabels:
+
+    """Read and change an issue's labels through the REST API."""
+
+    async def read(self, gh, issue):
+        return frozenset(
+            [label["name"] async for label in gh.getiter(issue["labels_url"])]
+        )
+
+    async def apply(self, gh, issue, current, target, *, replace=False):
+        labels_url = issue["labels_url"]
+        added = target - current
+        removed = current - target
+        if replace and len(added) + len(removed) > 1:
+            await gh.put(labels_url, data={"labels": sorted(target)})
+            labelcache.LABELS.record(labels_url, target)
+            return
+        calls = [
+            gh.delete(labels_url, {"name": label_name})
+            for label_name in sorted(removed)
+        ]
+        if added:
+            calls.append(gh.post(labels_url, data={"labels": sorted(added)}))
+        outcomes = await fanout.gather(calls, tolerate=label_missing)
+        if any(isinstance(outcome, Exception) for outcome in outcomes):
+            # 'current' was out-of-date.
+            labelcache.LABELS.invalidate(labels_url)
+        elif calls:
+            labelcache.LABELS.record(labels_url, target)
+
+
+class GraphQLLabels:
+
+    """Read and change an issue's labels through batched GraphQL requests.
+
+    Label changes for different issues made at about the same time are sent
+    to GitHub together. 'replace' makes no difference as additions and
+    removals are already sent in a single request. Labels which don't exist
+    in the repository can't be added.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        # (repository URL, label name) -> label node ID
+        self._label_ids = {}
+        # (repository URL, label name) -> label ID being looked up
+        self._lookups = {}
+
+    async def read(self, gh, issue):
+        data = await self.batcher.query(
+            gh,
+            "node(id: $id) { ... on Issue { labels(first: 100) { nodes { name } } } }",
+            {"id": ("ID!", issue["node_id"])},
+        )
+        return frozenset(label["name"] for label in data["labels"]["nodes"])
+
+    async def _lookup_label_id(self, gh, repository_url, name):
+        owner, repo = repository_url.rsplit("/", 2)[-2:]
+        data = await self.batcher.query(
+            gh,
+            "repository(owner: $owner, name: $repo) { label(name: $name) { id } }",
+            {
+                "owner": ("String!", owner),
+                "repo": ("String!", repo),
+                "name": ("String!", name),
+            },
+        )
+        label = data["label"]
+        return label["id"] if label is not None else None
+
+    async def _label_id(self, gh, repository_url, name):
+        key = repository_url, name
+        if key in self._label_ids:
+            return self._label_ids[key]
+        # Concurrent changes adding the same label share the lookup.
+        if key not in self._lookups:
+            self._lookups[key] = asyncio.ensure_future(
+                self._lookup_label_id(gh, repository_url, name)
+            )
+        try:
+            label_id = await asyncio.shield(self._lookups[key])
+        finally:
+            self._lookups.pop(key, None)
+        # A missing label may be created later, so only remember labels found.
+        if label_id is not None:
+            self._label_ids[key] = label_id
+        return label_id
+
+    async def _label_ids_for(self, gh, issue, names):
+        known = {
+            label["name"]: label["node_id"]
+            for label in issue.get("labels", [])
+            if "node_id" in label
+        }
+        for name, node_id in known.items():
+            self._label_ids[issue["repository_url"], name] = node_id
+        ids = await asyncio.gather(
+            *(self._label_id(gh, issue["repository_url"], name) for name in names)
+        )
+        return dict(zip(names, ids))
+
+    async def apply(self, gh, issue, current, target, *, replace=False):
+        labels_url = issue["labels_url"]
+        added = sorted(target - current)
+        removed = sorted(current - target)
+        if not added and not removed:
+            return
+        label_ids = await self._label_ids_for(gh, issue, added + removed)
+        missing = [name for name in added if label_ids[name] is None]
+        if missing:
+            raise LookupError(f"labels do not exist: {', '.join(missing)}")
+        calls = []
+        if added:
+            calls.append(
+                self.batcher.mutate(
+                    gh,
+                    "addLabelsToLabelable(input: $input) { clientMutationId }",
+                    {
+                        "input": (
+                            "AddLabelsToLabelableInput!",
+                            {
+                                "labelableId": issue["node_id"],
+                                "labelIds": [label_ids[name] for name in added],
+                            },
+                        )
+                    },
+                )
+            )
+        # A label missing from the repository can't be on the issue.
+        removed_ids = [label_ids[name] for name in removed if label_ids[name]]
+        if removed_ids:
+            calls.append(
+                self.batcher.mutate(
+                    gh,
+                    "removeLabelsFromLabelable(input: $input) { clientMutationId }",
+                    {
+                        "input": (
+                            "RemoveLabelsFromLabelableInput!",
+                            {"labelableId": issue["node_id"], "labelIds": removed_ids},
+                        )
+                    },
+                )
+            )
+        try:
+            await asyncio.gather(*calls)
+        except Exception:
+            labelcache.LABELS.invalidate(labels_url)
+            raise
+        labelcache.LABELS.record(labels_url, target)
+
+
+BACKEND = RESTLabels()
+
+
+async def read_labels(gh, issue):
+    """Return an issue's labels, asking GitHub only if they aren't known."""
+    label_names = labelcache.LABELS.get(issue["labels_url"])
+    if label_names is None:
+        label_names = await BACKEND.read(gh, issue)
+        labelcache.LABELS.record(issue["labels_url"], label_names)
+    return label_names
+
+
+async def apply_labels(gh, issue, current, target, *, replace=False):
+    """Change an issue's labels from 'current' to 'target'.
+
+    If 'replace' is true and more than one change is necessary then all labels
+    are set in a single request. That is only safe when 'current' is
+    up-to-date as any label added in the interim would be dropped. Otherwise
+    all additions are made in one request and removals are made concurrently.
+    """
+    await BACKEND.apply(gh, issue, current, target, replace=replace)
+
+
+def subject_key(event):
+    """Identify the issue or pull request an event concerns, if any."""
+    subject = event.data.get("issue") or event.data.get("pull_request")
+    repository = event.data.get("repository")
+    if subject is None or repository is None:
+        return None
+    return repository["full_name"], subject["number"]
+
+
+def issue_key(event):
+    """Identify the issue an event concerns if it can be coalesced."""
+    if event.event != "issues" or event.data.get("action") not in COALESCED_ACTIONS:
+        return None
+    return event.data["repository"]["full_name"], event.data["issue"]["number"]
+
+
+async def reconcile_issue(event, gh, *args, **kwargs):
+    """Apply the minimal label changes for the issue the event concerns."""
+    # The event may be stale by now, so get the current state of the issue.
+    issue = await gh.getitem(event.data["issue"]["url"])
+    current = frozenset(label["name"] for label in issue["labels"])
+    target = target_labels(issue["state"], current)
+    await apply_labels(gh, issue, current, target, replace=True)
@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Replay events from the journal kept with GH_JOURNAL.
+
+Events whose dispatching was interrupted, e.g. by a crash, or which were
+deferred and never retried are replayed by default. Specific deliveries or
+event types can be picked out to reprocess them instead. Run with:
+
+    GH_AUTH=<token> python -m __app__.github.replay DIRECTORY [--dry-run]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from ..ghutils import journal
+from .. import github as github_main
+
+
+def select(entries, *, everything=False, delivery_ids=(), event_types=()):
+    """Return the events in 'entries' to replay."""
+    selected = []
+    for delivery_id, entry in entries.items():
+        if delivery_ids and delivery_id not in delivery_ids:
+            continue
+        elif event_types and entry.event.event not in event_types:
+            continue
+        elif (
+            not (everything or delivery_ids) and entry.outcome not in journal.UNFINISHED
+        ):
+            continue
+        selected.append(entry.event)
+    return selected
+
+
+async def _main(args):
+    events = select(
+        journal.entries(args.directory),
+        everything=args.all,
+        delivery_ids=set(args.delivery),
+        event_types=set(args.event),
+    )
+    for event in events:
+        print(f"{event.delivery_id} ({event.event})")
+    if args.dry_run:
+        print(f"{len(events)} events to replay", file=sys.stderr)
+        return
+    record = journal.Journal(args.directory)
+    try:
+        outcomes = await journal.replay(
+            github_main.dispatcher(),
+            github_main.github_api,
+            events,
+            journal=record,
+            logger=logging,
+        )
+    finally:
+        record.close()
+        # Nothing was connected if no event got as far as GitHub.
+        if github_main.CLIENT is not None:
+            await github_main.CLIENT.close()
+    failed = sum(outcome != "ok" for outcome in outcomes.values())
+    print(f"{len(outcomes)} events replayed, {failed} failed", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("directory", help="directory holding the journal")
+    parser.add_argument(
+        "--all", action="store_true", help="replay finished events as well"
+    )
+    parser.add_argument(
+        "--delivery",
+        action="append",
+        default=[],
+        metavar="ID",
+        help="replay the delivery with this ID (may be repeated)",
+    )
+    parser.add_argument(
+        "--event",
+        action="append",
+        default=[],
+        metavar="TYPE",
+        help="only replay events of this type (may be repeated)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only print the events to replay"
+    )
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Serve many repositories from one deployment.
+
+Settings are read from a JSON file mapping each repository's full name to its
+settings, e.g.:
+
+    {
+        "Microsoft/vscode-python": {
+            "auth": "GH_AUTH_VSCODE_PYTHON",
+            "labels": {"team": ["data science", "xteam"]},
+            "concurrency": 4
+        }
+    }
+
+"auth" names the environment variable holding the repository's OAuth token,
+"labels" overrides label categories like labelrules.load() does, and
+"concurrency" is how many of the repository's events may be handled at once.
+Repositories which aren't listed use the defaults.
+"""
+
+import asyncio
+import json
+import os
+
+from . import labelrules
+
+
+DEFAULT_CONCURRENCY = 10
+
+
+class Repository:
+
+    """Settings for a repository.
+
+    Rules of None means the default label rules.
+    """
+
+    def __init__(self, full_name, *, oauth_token=None, rules=None, concurrency=None):
+        self.full_name = full_name
+        self.oauth_token = oauth_token
+        self.rules = rules
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        """Limit how many of the repository's events are handled at once."""
+        # Created on first use so it belongs to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+
+class Repositories:
+
+    """Look up the settings of repositories by full name.
+
+    Repositories without settings of their own get 'default_token' and
+    'concurrency'. Names are case-insensitive like on GitHub.
+    """
+
+    def __init__(self, repositories=(), *, default_token=None, concurrency=None):
+        self.default_token = default_token
+        self.concurrency = concurrency
+        self._repositories = {repo.full_name.lower(): repo for repo in repositories}
+
+    def get(self, full_name):
+        key = full_name.lower()
+        if key not in self._repositories:
+            self._repositories[key] = Repository(
+                full_name, oauth_token=self.default_token, concurrency=self.concurrency
+            )
+        return self._repositories[key]
+
+    def for_event(self, event):
+        """Return the settings of the repository an event is for."""
+        repository = event.data.get("repository") or {}
+        return self.get(repository.get("full_name", ""))
+
+
+def load(path, *, default_token=None, concurrency=None):
+    """Read the settings of repositories from a JSON file."""
+    with open(path, encoding="utf-8") as file:
+        settings = json.load(file)
+    repositories = []
+    for full_name, details in settings.items():
+        if "auth" in details:
+            oauth_token = os.environ.get(details["auth"])
+        else:
+            oauth_token = default_token
+        if "labels" in details:
+            rules = labelrules.build(details["labels"])
+        else:
+            rules = None
+        repositories.append(
+            Repository(
+                full_name,
+                oauth_token=oauth_token,
+                rules=rules,
+                concurrency=details.get("concurrency", concurrency),
+            )
+        )
+    return Repositories(
+        repositories, default_token=default_token, concurrency=concurrency
+    )
+
+
+class Dispatcher:
+
+    """Dispatch events with the settings of the repository they are for.
+
+    The repository's label rules are made current, and at most its
+    concurrency's worth of its events are dispatched at once so one busy
+    repository can't hold up the rest.
+    """
+
+    def __init__(self, router, repositories):
+        self.router = router
+        self.repositories = repositories
+
+    async def call(self, callback, event, *args, **kwargs):
+        """Call 'callback' with the event under its repository's settings.
+
+        For handling an event some other way than through the router, e.g.
+        reconciling the issue it concerns.
+        """
+        repository = self.repositories.for_event(event)
+        async with repository.semaphore:
+            with labelrules.active(repository.rules):
+                await callback(event, *args, **kwargs)
+
+    async def dispatch(self, event, *args, **kwargs):
+        await self.call(self.router.dispatch, event, *args, **kwargs)
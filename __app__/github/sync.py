@@ -0,0 +1,144 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Reconcile the labels of the issues updated since the last sync.
+
+Events lost while the bot was down or throttled leave issues with the wrong
+labels. Instead of a full backfill, this lists only the issues updated since a
+persisted watermark, which usually takes a single request, applies the same
+rules as the webhook callbacks to them, and then advances the watermark. Run
+with:
+
+    GH_AUTH=<token> python -m __app__.github.sync OWNER/REPO DATABASE [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from ..ghutils import fanout, watermark
+from . import backfill, reconcile
+
+
+# How far back the first sync of a repository looks, in seconds.
+DEFAULT_LOOKBACK = 24 * 60 * 60
+
+
+def _timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+async def plan(gh, repo, since):
+    """Return the changes for issues in 'repo' updated since 'since'.
+
+    Also returns when the newest of the issues was updated, or None if no
+    issue was.
+    """
+    owner, _, name = repo.partition("/")
+    url = "/repos/{owner}/{name}/issues{?state,since,sort,direction,per_page}"
+    url_vars = {
+        "owner": owner,
+        "name": name,
+        "state": "all",
+        "since": since,
+        "sort": "updated",
+        "direction": "asc",
+        "per_page": 100,
+    }
+    changes = []
+    newest = None
+    async for issue in gh.getiter(url, url_vars):
+        # ISO 8601 timestamps in UTC sort like strings.
+        if newest is None or issue["updated_at"] > newest:
+            newest = issue["updated_at"]
+        change = backfill.review(issue)
+        if change is not None:
+            changes.append(change)
+    return changes, newest
+
+
+async def sync(
+    gh,
+    repo,
+    watermarks,
+    *,
+    lookback=DEFAULT_LOOKBACK,
+    dry_run=False,
+    limit=fanout.DEFAULT_LIMIT,
+    out=None,
+):
+    """Reconcile the issues in 'repo' updated since its watermark.
+
+    Without a watermark, issues updated within the last 'lookback' seconds are
+    synced. Every change is written to 'out' (if provided). Unless 'dry_run'
+    is true, changes are then applied with at most 'limit' issues being
+    changed at once, and only once all of them succeeded is the watermark
+    advanced; a failed sync is tried again in full next time. Returns the
+    changes.
+    """
+    previous = watermarks.get(repo)
+    since = previous or _timestamp(time.time() - lookback)
+    changes, newest = await plan(gh, repo, since)
+    if out is not None:
+        for change in changes:
+            print(change, file=out)
+    if dry_run:
+        return changes
+    # Only the difference is sent as the issues may have changed since listed.
+    await fanout.gather(
+        [
+            reconcile.apply_labels(gh, change.issue, change.current, change.target)
+            for change in changes
+        ],
+        limit=limit,
+    )
+    if newest is not None:
+        watermarks.advance(repo, previous, newest)
+    return changes
+
+
+async def _main(args):
+    watermarks = watermark.SQLiteWatermarks(args.database)
+    try:
+        async with backfill.command_line_api() as gh:
+            changes = await sync(
+                gh,
+                args.repo,
+                watermarks,
+                lookback=args.lookback * 60 * 60,
+                dry_run=args.dry_run,
+                limit=args.limit,
+                out=sys.stdout,
+            )
+    finally:
+        watermarks.close()
+    backfill.report(changes, dry_run=args.dry_run)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("repo", help="repository as OWNER/REPO")
+    parser.add_argument("database", help="SQLite database holding the watermarks")
+    parser.add_argument(
+        "--lookback",
+        type=float,
+        default=DEFAULT_LOOKBACK / 60 / 60,
+        help="hours to look back without a watermark (default: 24)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only print the changes, leaving the watermark as it is",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=fanout.DEFAULT_LIMIT,
+        help="most issues to change at once",
+    )
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Measure the cold start of the Azure Function entry point.
+
+Every measurement is taken in a fresh interpreter. Run with:
+
+    python -m benchmarks.coldstart [--top N] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+
+ROOT = pathlib.Path(__file__).parent.parent
+ENTRY_POINT = "__app__.github"
+# Modules which are only needed once the bot talks to GitHub.
+HEAVY_MODULES = ("aiohttp", "gidgethub.aiohttp")
+DELIVERIES = {
+    "ping": {"zen": "Design for failure."},
+    "unhandled": {"action": "closed", "pull_request": {}},
+}
+
+
+def _python(*args):
+    completed = subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    return completed.stdout, completed.stderr
+
+
+def import_profile(module=ENTRY_POINT):
+    """Return (module, self µs, cumulative µs) for every module 'module' imports."""
+    _, stderr = _python("-X", "importtime", "-c", f"import {module}")
+    profile = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        profile.append((name.strip(), int(self_us), int(cumulative_us)))
+    return profile
+
+
+def first_delivery(kind):
+    """Import the entry point and handle one delivery in a fresh interpreter."""
+    stdout, _ = _python(
+        "-c", f"from benchmarks import coldstart; coldstart.child({kind!r})"
+    )
+    return json.loads(stdout)
+
+
+def child(kind):
+    """Measure a cold start from within the fresh interpreter."""
+    os.environ.pop("GH_SECRET", None)
+    os.environ.pop("GH_QUEUE", None)
+    os.environ["GH_PAUSE"] = "0"
+    start = time.perf_counter()
+    import azure.functions as func
+    from __app__ import github as github_main
+
+    imported = time.perf_counter()
+    event_type = "ping" if kind == "ping" else "pull_request"
+    request = func.HttpRequest(
+        method="POST",
+        url="/api/github",
+        headers={
+            "content-type": "application/json",
+            "x-github-event": event_type,
+            "x-github-delivery": "cold-start",
+        },
+        body=json.dumps(DELIVERIES[kind]).encode("utf-8"),
+    )
+
+    async def deliver():
+        response = await github_main.main(request)
+        if github_main.RETRY_QUEUE is not None:
+            await github_main.RETRY_QUEUE.close()
+        return response
+
+    response = asyncio.run(deliver())
+    delivered = time.perf_counter()
+    print(
+        json.dumps(
+            {
+                "status": response.status_code,
+                "import_ms": (imported - start) * 1000,
+                "delivery_ms": (delivered - imported) * 1000,
+                "heavy_modules": [
+                    name for name in HEAVY_MODULES if name in sys.modules
+                ],
+            }
+        )
+    )
+
+
+def run(*, top=10):
+    profile = import_profile()
+    return {
+        "import_ms": sum(self_us for _, self_us, _ in profile) / 1000,
+        "modules": len(profile),
+        "slowest": [
+            {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cum_us / 1000}
+            for name, self_us, cum_us in sorted(profile, key=lambda entry: -entry[1])[
+                :top
+            ]
+        ],
+        "deliveries": {kind: first_delivery(kind) for kind in DELIVERIES},
+    }
+
+
+def report(results):
+    print(f"import {ENTRY_POINT}: {results['import_ms']:.1f} ms, ", end="")
+    print(f"{results['modules']} modules")
+    for entry in results["slowest"]:
+        print(
+            f"  {entry['module']}: {entry['self_ms']:.1f} ms"
+            f" ({entry['cumulative_ms']:.1f} ms cumulative)"
+        )
+    for kind, result in results["deliveries"].items():
+        heavy = ", ".join(result["heavy_modules"]) or "none"
+        print(
+            f"first {kind} delivery: {result['status']} after"
+            f" {result['import_ms']:.1f} ms importing and"
+            f" {result['delivery_ms']:.1f} ms handling; heavy modules: {heavy}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--top", type=int, default=10, help="slowest modules shown")
+    parser.add_argument("--json", action="store_true", help="print raw results")
+    args = parser.parse_args(argv)
+    results = run(top=args.top)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
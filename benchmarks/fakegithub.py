@@ -0,0 +1,232 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""A local stand-in for the parts of GitHub's REST API the bot uses."""
+
+import asyncio
+import collections
+import hashlib
+import json
+import random
+import time
+
+from aiohttp import web
+
+
+def _labels(names):
+    return [{"name": name} for name in sorted(names)]
+
+
+class FakeGitHub:
+
+    """Serve issues and their labels over HTTP on a random local port.
+
+    Every request waits 'latency' seconds before being answered. Responses carry
+    rate limit headers starting from 'rate_limit' requests per 'window' seconds,
+    and once none remain requests are rejected until the window ends. GET
+    responses carry an ETag so conditional requests get a 304 (which, like on
+    GitHub, does not count against the rate limit). An issue's labels are
+    listed 'per_page' at a time, as are the 'files_per_pull' files of every pull
+    request, the last of which is a news entry.
+
+    Failures are injected at random: 'error_rate' of all requests get a 502,
+    and 'secondary_limit_rate' of changes hit a secondary rate limit asking to
+    retry after 'retry_after' seconds. Pass 'seed' to make them repeatable.
+
+    The 'calls' counter is keyed by method, with 304 responses counted under
+    "GET 304" and injected failures under "502" and "403".
+    """
+
+    def __init__(
+        self,
+        *,
+        latency=0.0,
+        rate_limit=5000,
+        window=3600,
+        per_page=30,
+        files_per_pull=10,
+        error_rate=0.0,
+        secondary_limit_rate=0.0,
+        retry_after=1,
+        seed=None,
+    ):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.per_page = per_page
+        self.files_per_pull = files_per_pull
+        self.error_rate = error_rate
+        self.secondary_limit_rate = secondary_limit_rate
+        self.retry_after = retry_after
+        self.remaining = rate_limit
+        self.reset_at = time.time() + window
+        self.calls = collections.Counter()
+        # Issue path -> label names
+        self.labels = {}
+        self.url = None
+        self._runner = None
+        self._random = random.Random(seed)
+
+    def seed(self, payload):
+        """Give the issue of a webhook payload the labels in the payload."""
+        issue = payload.get("issue") or payload.get("pull_request")
+        path = issue["url"].replace(self.url, "").replace("/pulls/", "/issues/")
+        self.labels[path] = {label["name"] for label in issue["labels"]}
+
+    def reset(self):
+        self.remaining = self.rate_limit
+        self.reset_at = time.time() + self.window
+        self.calls.clear()
+        self.labels.clear()
+
+    async def start(self):
+        app = web.Application(middlewares=[self._faults])
+        issue = "/repos/{owner}/{repo}/issues/{number}"
+        app.add_routes(
+            [
+                web.head("/", self._root),
+                web.get(issue, self._get_issue),
+                web.get(issue + "/labels", self._get_labels),
+                web.post(issue + "/labels", self._add_labels),
+                web.put(issue + "/labels", self._replace_labels),
+                web.delete(issue + "/labels/{name}", self._remove_label),
+                web.get("/repos/{owner}/{repo}/pulls/{number}/files", self._get_files),
+                web.post("/repos/{owner}/{repo}/statuses/{sha}", self._add_status),
+            ]
+        )
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    def _issue_path(self, request):
+        info = request.match_info
+        return f"/repos/{info['owner']}/{info['repo']}/issues/{info['number']}"
+
+    def _headers(self):
+        now = time.time()
+        if now >= self.reset_at:
+            self.remaining = self.rate_limit
+            self.reset_at = now + self.window
+        return {
+            "content-type": "application/json; charset=utf-8",
+            "x-ratelimit-limit": str(self.rate_limit),
+            "x-ratelimit-remaining": str(self.remaining),
+            "x-ratelimit-reset": str(int(self.reset_at)),
+        }
+
+    @web.middleware
+    async def _faults(self, request, handler):
+        """Delay every request and fail some before they are handled."""
+        if request.path == "/":
+            return await handler(request)
+        await asyncio.sleep(self.latency)
+        headers = self._headers()
+        if not self.remaining:
+            self.calls["403"] += 1
+            message = "API rate limit exceeded"
+        elif self._random.random() < self.error_rate:
+            self.calls["502"] += 1
+            self.remaining -= 1
+            headers["x-ratelimit-remaining"] = str(self.remaining)
+            body = json.dumps({"message": "Server Error"}).encode("utf-8")
+            return web.Response(status=502, body=body, headers=headers)
+        elif (
+            request.method != "GET"
+            and self._random.random() < self.secondary_limit_rate
+        ):
+            self.calls["403"] += 1
+            headers["retry-after"] = str(self.retry_after)
+            message = "You have exceeded a secondary rate limit."
+        else:
+            return await handler(request)
+        body = json.dumps({"message": message}).encode("utf-8")
+        return web.Response(status=403, body=body, headers=headers)
+
+    async def _respond(self, request, data, status=200, *, links=None):
+        body = json.dumps(data).encode("utf-8")
+        headers = self._headers()
+        if links:
+            headers["link"] = ", ".join(
+                f'<{url}>; rel="{rel}"' for rel, url in links.items()
+            )
+        if request.method == "GET":
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            headers["etag"] = etag
+            if request.headers.get("if-none-match") == etag:
+                self.calls["GET 304"] += 1
+                return web.Response(status=304, headers=headers)
+        self.calls[request.method] += 1
+        self.remaining = max(self.remaining - 1, 0)
+        headers["x-ratelimit-remaining"] = str(self.remaining)
+        return web.Response(status=status, body=body, headers=headers)
+
+    async def _root(self, request):
+        return web.Response()
+
+    async def _get_issue(self, request):
+        path = self._issue_path(request)
+        data = {
+            "url": self.url + path,
+            "labels_url": self.url + path + "/labels{/name}",
+            "number": int(request.match_info["number"]),
+            "state": "open",
+            "labels": _labels(self.labels.get(path, ())),
+        }
+        return await self._respond(request, data)
+
+    def _page(self, request, items):
+        """Return the page of 'items' asked for along with links to the rest."""
+        per_page = int(request.query.get("per_page", self.per_page))
+        page = int(request.query.get("page", 1))
+        last = max(-(-len(items) // per_page), 1)
+        links = {}
+        if page < last:
+            links["next"] = request.url.update_query(page=page + 1, per_page=per_page)
+            links["last"] = request.url.update_query(page=last, per_page=per_page)
+        return items[(page - 1) * per_page : page * per_page], links
+
+    async def _get_labels(self, request):
+        path = self._issue_path(request)
+        labels, links = self._page(request, _labels(self.labels.get(path, ())))
+        return await self._respond(request, labels, links=links)
+
+    async def _get_files(self, request):
+        number = request.match_info["number"]
+        files = [
+            {"filename": f"src/file{index}.ts", "status": "modified"}
+            for index in range(self.files_per_pull - 1)
+        ]
+        files.append({"filename": f"news/2 Fixes/{number}.md", "status": "added"})
+        files, links = self._page(request, files)
+        return await self._respond(request, files, links=links)
+
+    async def _add_status(self, request):
+        data = await request.json()
+        return await self._respond(request, data, status=201)
+
+    async def _add_labels(self, request):
+        path = self._issue_path(request)
+        added = (await request.json())["labels"]
+        self.labels.setdefault(path, set()).update(added)
+        return await self._respond(request, _labels(self.labels[path]))
+
+    async def _replace_labels(self, request):
+        path = self._issue_path(request)
+        self.labels[path] = set((await request.json())["labels"])
+        return await self._respond(request, _labels(self.labels[path]))
+
+    async def _remove_label(self, request):
+        path = self._issue_path(request)
+        name = request.match_info["name"]
+        if name not in self.labels.get(path, ()):
+            return await self._respond(
+                request, {"message": "Label does not exist"}, status=404
+            )
+        self.labels[path].discard(name)
+        return await self._respond(request, _labels(self.labels[path]))
@@ -0,0 +1,242 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Measure how the bot holds up under a sustained stream of webhook deliveries.
+
+Signed deliveries made from the sample payloads are sent to the Azure Function
+entry point at a steady rate, whether or not earlier ones have finished, against
+a local fake of GitHub which can be made slow, rate limited or flaky. Run with:
+
+    python -m benchmarks.load [--rate N] [--duration SECONDS] [--latency SECONDS]
+                              [--error-rate FRACTION] [--secondary-limit-rate
+                              FRACTION] [--queue]
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import time
+
+from __app__ import github as github_main
+from __app__.ghutils import client
+
+from . import fakegithub, pipeline
+
+
+class Backlog:
+
+    """Sample how many deliveries are unfinished while load is generated.
+
+    Deliveries still being answered are 'in_flight'; events acknowledged but not
+    yet processed sit in the work or retry queue.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.samples = []
+
+    @staticmethod
+    def _queues():
+        return {github_main.WORK_QUEUE, github_main.RETRY_QUEUE} - {None}
+
+    def queued(self):
+        return sum(queue._unfinished for queue in self._queues())
+
+    def failed(self):
+        """Return how many queued events failed to be processed."""
+        return sum(queue.failed for queue in self._queues())
+
+    def sample(self):
+        self.samples.append(self.in_flight + self.queued())
+
+    async def drain(self):
+        """Wait for every queued event to be processed."""
+        for queue in (github_main.WORK_QUEUE, github_main.RETRY_QUEUE):
+            if queue is not None:
+                await queue.join()
+
+
+async def generate(fake, samples, *, rate, duration):
+    """Deliver events at 'rate' per second for 'duration' seconds.
+
+    Returns the results as in pipeline.summarize() along with the response
+    statuses, the backlog, and how far sending fell behind schedule. Errors
+    count both failed responses and events which failed to be processed in the
+    background after being acknowledged.
+    """
+    events = pipeline.synthetic(samples, max(int(rate * duration), 1))
+    pipeline.prepare(fake, events)
+    backlog = Backlog()
+    loop = asyncio.get_running_loop()
+
+    async def send(event_type, payload):
+        backlog.in_flight += 1
+        try:
+            return await pipeline.timed(event_type, payload)
+        finally:
+            backlog.in_flight -= 1
+
+    start = loop.time()
+    lag = 0.0
+    sending = []
+    for index, event in enumerate(events):
+        due = start + index / rate
+        await asyncio.sleep(max(due - loop.time(), 0))
+        lag = max(lag, loop.time() - due)
+        backlog.sample()
+        sending.append(asyncio.ensure_future(send(*event)))
+    results = await asyncio.gather(*sending)
+    answered = time.perf_counter()
+    await backlog.drain()
+    elapsed = loop.time() - start
+    latencies, statuses = zip(*results)
+    summary = pipeline.summarize(fake, events, latencies, statuses, elapsed)
+    failed = backlog.failed()
+    errors = sum(status >= 400 for status in statuses) + failed
+    summary.update(
+        {
+            "errors": errors,
+            "error_rate": errors / len(events),
+            "worker_failures": failed,
+            "statuses": dict(collections.Counter(statuses)),
+            "target_rate": rate,
+            "send_lag_ms": lag * 1000,
+            "drain_ms": (time.perf_counter() - answered) * 1000,
+            "max_backlog": max(backlog.samples),
+            "mean_backlog": sum(backlog.samples) / len(backlog.samples),
+        }
+    )
+    return summary
+
+
+async def run(
+    *,
+    rate=50,
+    duration=10,
+    latency=0.0,
+    error_rate=0.0,
+    secondary_limit_rate=0.0,
+    retry_after=1,
+    seed=None,
+):
+    """Generate load against a fake GitHub, returning the results.
+
+    The GH_SECRET and GH_PAUSE environment variables must be set as in
+    pipeline.ENVIRONMENT. Set GH_QUEUE to acknowledge deliveries before
+    processing them.
+    """
+    fake = fakegithub.FakeGitHub(
+        latency=latency,
+        error_rate=error_rate,
+        secondary_limit_rate=secondary_limit_rate,
+        retry_after=retry_after,
+        seed=seed,
+    )
+    await fake.start()
+    try:
+        # Created here so the client doesn't try to connect to GitHub itself.
+        github_main.CLIENT = client.Client(
+            cache=github_main.response_cache(),
+            scheduler_factory=github_main.rate_limit_scheduler,
+            retry_policy=github_main.retry_policy(),
+        )
+        await github_main.CLIENT.warm(fake.url)
+        samples = pipeline.load_samples(fake.url)
+        github_main.METRICS.clear()
+        results = await generate(fake, samples, rate=rate, duration=duration)
+        results["metrics"] = github_main.METRICS.snapshot()
+        return results
+    finally:
+        for name in ("WORK_QUEUE", "RETRY_QUEUE"):
+            queue = getattr(github_main, name)
+            if queue is not None:
+                await queue.close()
+                setattr(github_main, name, None)
+        await github_main.CLIENT.close()
+        await fake.close()
+
+
+def report(results):
+    print(
+        f"{results['events']} events at {results['target_rate']}/s: "
+        f"{results['throughput']:.1f} events/s sustained, "
+        f"{results['error_rate']:.1%} errors {results['statuses']} "
+        f"({results['worker_failures']} failed in the background)"
+    )
+    print(
+        f"latency: p50 {results['p50_ms']:.2f} ms, p99 {results['p99_ms']:.2f} ms; "
+        f"sending fell behind by up to {results['send_lag_ms']:.2f} ms"
+    )
+    print(
+        f"backlog: max {results['max_backlog']}, "
+        f"mean {results['mean_backlog']:.1f}; "
+        f"drained {results['drain_ms']:.2f} ms after the last response"
+    )
+    print(
+        f"GitHub: {results['calls_per_event']:.2f} API calls/event {results['calls']}"
+    )
+    retries = sum(
+        stats["count"]
+        for key, stats in results["metrics"].items()
+        if key.startswith("retry.")
+    )
+    print(f"retries: {retries}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--rate", type=float, default=50, help="events per second")
+    parser.add_argument(
+        "--duration", type=float, default=10, help="seconds to generate load for"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per fake API call"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of calls to fail"
+    )
+    parser.add_argument(
+        "--secondary-limit-rate",
+        type=float,
+        default=0.0,
+        help="fraction of changes to reject with a secondary rate limit",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1,
+        help="seconds a secondary rate limit asks to wait",
+    )
+    parser.add_argument("--seed", type=int, help="seed for injecting failures")
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="acknowledge deliveries and process them in the background",
+    )
+    parser.add_argument("--json", action="store_true", help="print raw results")
+    args = parser.parse_args(argv)
+    os.environ.update(pipeline.ENVIRONMENT)
+    if args.queue:
+        os.environ["GH_QUEUE"] = "memory"
+        os.environ["GH_QUEUE_DELAY"] = "0"
+    results = asyncio.run(
+        run(
+            rate=args.rate,
+            duration=args.duration,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            secondary_limit_rate=args.secondary_limit_rate,
+            retry_after=args.retry_after,
+            seed=args.seed,
+        )
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Measure what it costs to handle a webhook delivery.
+
+The recorded sample payloads, plus synthetic bursts made from them, are
+delivered through the Azure Function entry point against a local fake of
+GitHub. Events captured in a journal (see GH_JOURNAL) can be used instead of
+the samples. Run with:
+
+    python -m benchmarks.pipeline [--rounds N] [--burst N] [--latency SECONDS]
+                                  [--journal DIRECTORY]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import time
+import tracemalloc
+import uuid
+
+import azure.functions as func
+
+from __app__ import github as github_main
+from __app__.ghutils import client, journal
+from __app__.github import labelcache
+
+from . import fakegithub
+
+
+SAMPLES = pathlib.Path(__file__).parent.parent / "tests" / "test_github" / "samples"
+SECRET = "benchmark"
+ENVIRONMENT = {"GH_SECRET": SECRET, "GH_PAUSE": "0"}
+
+
+def _usable(payload):
+    return isinstance(payload, dict) and "action" in payload
+
+
+def load_samples(base_url, *, journal_dir=None):
+    """Return (event type, payload) pairs pointed at 'base_url'.
+
+    The events come from the journal in 'journal_dir' if provided, otherwise
+    from the recorded samples.
+    """
+    if journal_dir is not None:
+        captured = [
+            (entry.event.event, json.dumps(entry.event.data))
+            for entry in journal.entries(journal_dir).values()
+        ]
+    else:
+        captured = [
+            (path.name.partition("-")[0], path.read_text(encoding="utf-8"))
+            for path in sorted(SAMPLES.glob("*.json"))
+        ]
+    samples = []
+    for event_type, text in captured:
+        payload = json.loads(text.replace("https://api.github.com", base_url))
+        if _usable(payload) and ("issue" in payload or "pull_request" in payload):
+            samples.append((event_type, payload))
+    return samples
+
+
+def synthetic(samples, count):
+    """Return 'count' events cycled from 'samples', each for a different issue."""
+    events = []
+    for index in range(count):
+        event_type, payload = samples[index % len(samples)]
+        issue = payload.get("issue") or payload.get("pull_request")
+        number = issue["number"]
+        text = json.dumps(payload)
+        for kind in ("issues", "pulls"):
+            text = text.replace(f"/{kind}/{number}", f"/{kind}/{100_000 + index}")
+        events.append((event_type, json.loads(text)))
+    return events
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+async def deliver(event_type, payload):
+    """Deliver an event to the bot, returning the response's status code."""
+    body = json.dumps(payload).encode("utf-8")
+    signature = hmac.new(SECRET.encode("utf-8"), body, hashlib.sha1).hexdigest()
+    headers = {
+        "content-type": "application/json",
+        "x-github-event": event_type,
+        "x-github-delivery": str(uuid.uuid4()),
+        "x-hub-signature": f"sha1={signature}",
+    }
+    request = func.HttpRequest(
+        method="POST", url="/api/github", headers=headers, body=body
+    )
+    response = await github_main.main(request)
+    return response.status_code
+
+
+async def timed(event_type, payload):
+    start = time.perf_counter()
+    status = await deliver(event_type, payload)
+    return time.perf_counter() - start, status
+
+
+def summarize(fake, events, latencies, statuses, elapsed):
+    count = len(events)
+    return {
+        "events": count,
+        "errors": sum(status != 200 for status in statuses),
+        "throughput": count / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "calls_per_event": sum(fake.calls.values()) / count,
+        "calls": dict(fake.calls),
+    }
+
+
+def prepare(fake, events):
+    fake.reset()
+    labelcache.LABELS.clear()
+    for _, payload in events:
+        fake.seed(payload)
+
+
+async def replay(fake, samples, rounds):
+    """Deliver every sample one after the other, 'rounds' times."""
+    events = samples * rounds
+    prepare(fake, events)
+    latencies = []
+    statuses = []
+    start = time.perf_counter()
+    for event_type, payload in events:
+        latency, status = await timed(event_type, payload)
+        latencies.append(latency)
+        statuses.append(status)
+    return summarize(fake, events, latencies, statuses, time.perf_counter() - start)
+
+
+async def burst(fake, samples, count):
+    """Deliver 'count' events for different issues all at once."""
+    events = synthetic(samples, count)
+    prepare(fake, events)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(*event) for event in events))
+    elapsed = time.perf_counter() - start
+    latencies, statuses = zip(*results)
+    return summarize(fake, events, latencies, statuses, elapsed)
+
+
+async def allocations(fake, samples):
+    """Measure the memory allocated while delivering each sample.
+
+    Reported as the mean peak of traced memory and the mean number of memory
+    blocks still allocated afterwards (e.g. due to caching).
+    """
+    prepare(fake, samples)
+    peaks = []
+    blocks = []
+    for event_type, payload in samples:
+        tracemalloc.start()
+        before = len(tracemalloc.take_snapshot().traces)
+        await deliver(event_type, payload)
+        after = len(tracemalloc.take_snapshot().traces)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        blocks.append(after - before)
+    return {
+        "events": len(samples),
+        "peak_kib_per_event": sum(peaks) / len(peaks) / 1024,
+        "retained_blocks_per_event": sum(blocks) / len(blocks),
+    }
+
+
+async def run(*, rounds=20, burst_size=200, latency=0.0, journal_dir=None):
+    """Run every scenario, returning their results by name.
+
+    The events delivered come from the journal in 'journal_dir' if provided.
+
+    The GH_SECRET and GH_PAUSE environment variables must be set as in
+    ENVIRONMENT.
+    """
+    fake = fakegithub.FakeGitHub(latency=latency)
+    await fake.start()
+    try:
+        # Created here so the client doesn't try to connect to GitHub itself.
+        github_main.CLIENT = client.Client(
+            cache=github_main.response_cache(),
+            scheduler_factory=github_main.rate_limit_scheduler,
+        )
+        await github_main.CLIENT.warm(fake.url)
+        samples = load_samples(fake.url, journal_dir=journal_dir)
+        github_main.METRICS.clear()
+        return {
+            "replay": await replay(fake, samples, rounds),
+            "burst": await burst(fake, samples, burst_size),
+            "allocations": await allocations(fake, samples),
+            "metrics": github_main.METRICS.snapshot(),
+        }
+    finally:
+        if github_main.RETRY_QUEUE is not None:
+            await github_main.RETRY_QUEUE.close()
+        await github_main.CLIENT.close()
+        await fake.close()
+
+
+def report(results):
+    for name in ("replay", "burst"):
+        result = results[name]
+        print(
+            f"{name:>6}: {result['events']} events, {result['errors']} errors, "
+            f"{result['throughput']:.1f} events/s, "
+            f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+            f"{result['calls_per_event']:.2f} API calls/event {result['calls']}"
+        )
+    result = results["allocations"]
+    print(
+        f"memory: {result['peak_kib_per_event']:.1f} KiB peak/event, "
+        f"{result['retained_blocks_per_event']:.1f} blocks retained/event"
+    )
+    for key, stats in results["metrics"].items():
+        if key.startswith(("handler.", "github.", "retry.")):
+            print(
+                f"{key}: {stats['count']} x {stats['mean_ms']:.2f} ms"
+                f" (max {stats['max_ms']:.2f} ms)"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per fake API call"
+    )
+    parser.add_argument(
+        "--journal", metavar="DIRECTORY", help="deliver the events in a journal"
+    )
+    parser.add_argument("--json", action="store_true", help="print raw results")
+    args = parser.parse_args(argv)
+    os.environ.update(ENVIRONMENT)
+    results = asyncio.run(
+        run(
+            rounds=args.rounds,
+            burst_size=args.burst,
+            latency=args.latency,
+            journal_dir=args.journal,
+        )
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+from benchmarks import coldstart
+
+
+def test_run():
+    results = coldstart.run(top=3)
+    assert results["import_ms"] > 0
+    assert len(results["slowest"]) == 3
+    for result in results["deliveries"].values():
+        assert result["status"] == 200
+        # Connecting to GitHub isn't needed for these deliveries.
+        assert not result["heavy_modules"]
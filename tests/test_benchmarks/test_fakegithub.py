@@ -0,0 +1,86 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import aiohttp
+import pytest
+
+from benchmarks import fakegithub
+
+
+ISSUE = "/repos/Microsoft/vscode-python/issues/1"
+
+
+@pytest.fixture
+async def fake():
+    fake = fakegithub.FakeGitHub(per_page=2, rate_limit=3)
+    await fake.start()
+    async with aiohttp.ClientSession() as session:
+        fake.session = session
+        yield fake
+    await fake.close()
+
+
+@pytest.mark.asyncio
+async def test_pagination(fake):
+    fake.labels[ISSUE] = {"a", "b", "c"}
+    async with fake.session.get(fake.url + ISSUE + "/labels") as response:
+        assert await response.json() == [{"name": "a"}, {"name": "b"}]
+        next_url = response.links["next"]["url"]
+    async with fake.session.get(next_url) as response:
+        assert await response.json() == [{"name": "c"}]
+        assert "next" not in response.links
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(fake):
+    for remaining in (2, 1, 0):
+        async with fake.session.get(fake.url + ISSUE) as response:
+            assert response.headers["x-ratelimit-remaining"] == str(remaining)
+    async with fake.session.get(fake.url + ISSUE) as response:
+        assert response.status == 403
+    assert fake.calls == {"GET": 3, "403": 1}
+
+    # The limit is restored once the window ends.
+    fake.reset_at = 0
+    async with fake.session.get(fake.url + ISSUE) as response:
+        assert response.status == 200
+
+
+@pytest.mark.asyncio
+async def test_injected_failures(fake):
+    fake.error_rate = 1
+    async with fake.session.get(fake.url + ISSUE) as response:
+        assert response.status == 502
+
+    fake.error_rate = 0
+    fake.secondary_limit_rate = 1
+    fake.retry_after = 30
+    # Only changes hit the secondary rate limit.
+    async with fake.session.get(fake.url + ISSUE) as response:
+        assert response.status == 200
+    url = fake.url + ISSUE + "/labels"
+    async with fake.session.post(url, json={"labels": ["bug"]}) as response:
+        assert response.status == 403
+        assert response.headers["retry-after"] == "30"
+    assert ISSUE not in fake.labels
+    assert fake.calls == {"502": 1, "GET": 1, "403": 1}
+
+
+@pytest.mark.asyncio
+async def test_pull_request_files(fake):
+    fake.files_per_pull = 3
+    url = fake.url + "/repos/Microsoft/vscode-python/pulls/1/files"
+    async with fake.session.get(url) as response:
+        files = await response.json()
+        next_url = response.links["next"]["url"]
+    async with fake.session.get(next_url) as response:
+        files += await response.json()
+    assert [changed["filename"] for changed in files] == [
+        "src/file0.ts",
+        "src/file1.ts",
+        "news/2 Fixes/1.md",
+    ]
+
+    url = fake.url + "/repos/Microsoft/vscode-python/statuses/abc"
+    async with fake.session.post(url, json={"state": "success"}) as response:
+        assert response.status == 201
@@ -0,0 +1,54 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+
+from __app__ import github as github_main
+from benchmarks import load, pipeline
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    for name, value in pipeline.ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("GH_QUEUE", raising=False)
+    for name in ("CLIENT", "DEDUPLICATOR", "RETRY_QUEUE", "WORK_QUEUE"):
+        monkeypatch.setattr(github_main, name, None)
+
+
+@pytest.mark.asyncio
+async def test_run(environment):
+    results = await load.run(rate=200, duration=0.1, error_rate=0.2, seed=1)
+    assert results["events"] == 20
+    assert results["statuses"] == {200: 20}
+    assert results["error_rate"] == 0
+    assert results["worker_failures"] == 0
+    # Injected failures are retried.
+    assert results["calls"]["502"]
+    assert any(key.startswith("retry.") for key in results["metrics"])
+    assert github_main.RETRY_QUEUE is None
+
+
+@pytest.mark.asyncio
+async def test_run_queued(environment, monkeypatch):
+    monkeypatch.setenv("GH_QUEUE", "memory")
+    monkeypatch.setenv("GH_QUEUE_DELAY", "0")
+    results = await load.run(
+        rate=200, duration=0.1, secondary_limit_rate=0.5, retry_after=0, seed=1
+    )
+    assert results["statuses"] == {202: 20}
+    # Changes hitting the secondary rate limit were queued again and retried.
+    assert results["calls"]["403"]
+    assert github_main.WORK_QUEUE is None
+
+
+@pytest.mark.asyncio
+async def test_run_queued_failures(environment, monkeypatch):
+    monkeypatch.setenv("GH_QUEUE", "memory")
+    monkeypatch.setenv("GH_QUEUE_DELAY", "0")
+    monkeypatch.setenv("GH_RETRY_ATTEMPTS", "1")
+    results = await load.run(rate=200, duration=0.1, error_rate=1, seed=1)
+    # Every delivery was acknowledged, but none could be processed.
+    assert results["statuses"] == {202: 20}
+    assert results["worker_failures"] == results["errors"] > 0
+    assert results["error_rate"] == results["errors"] / 20
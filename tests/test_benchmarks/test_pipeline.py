@@ -0,0 +1,58 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import gidgethub.sansio
+import pytest
+
+from __app__ import github as github_main
+from __app__.ghutils import journal
+from benchmarks import pipeline
+
+
+@pytest.mark.asyncio
+async def test_run(monkeypatch):
+    for name, value in pipeline.ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    for name in ("CLIENT", "DEDUPLICATOR", "RETRY_QUEUE"):
+        monkeypatch.setattr(github_main, name, None)
+
+    results = await pipeline.run(rounds=1, burst_size=5)
+
+    replay = results["replay"]
+    assert replay["events"] == len(pipeline.load_samples("http://localhost"))
+    assert not replay["errors"]
+    assert replay["calls_per_event"] > 0
+    assert results["burst"]["events"] == 5
+    assert not results["burst"]["errors"]
+    assert results["allocations"]["peak_kib_per_event"] > 0
+    assert "handler.classify_new_issue" in results["metrics"]
+
+
+def test_synthetic():
+    samples = pipeline.load_samples("http://localhost")
+    events = pipeline.synthetic(samples, len(samples) + 1)
+    urls = {
+        (payload.get("issue") or payload["pull_request"])["url"]
+        for _, payload in events
+    }
+    assert len(urls) == len(events)
+    assert all(url.startswith("http://localhost/") for url in urls)
+
+
+def test_load_journal(tmp_path):
+    record = journal.Journal(tmp_path)
+    samples = pipeline.load_samples("https://api.github.com")[:2]
+    for delivery_id, (event_type, payload) in enumerate(samples):
+        record.record(
+            gidgethub.sansio.Event(payload, event=event_type, delivery_id=delivery_id)
+        )
+    # Events the pipeline can't deliver are skipped.
+    record.record(
+        gidgethub.sansio.Event({"zen": "Design"}, event="ping", delivery_id=2)
+    )
+    record.close()
+
+    loaded = pipeline.load_samples("http://localhost", journal_dir=tmp_path)
+    assert [event_type for event_type, _ in loaded] == ["issues", "issues"]
+    for _, payload in loaded:
+        assert payload["issue"]["url"].startswith("http://localhost/")
@@ -0,0 +1,182 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import datetime
+import time
+
+import aiohttp.test_utils
+import aiohttp.web
+import gidgethub
+import jwt
+import pytest
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from __app__.ghutils import apps, client
+
+
+APP_ID = 1234
+KEY = rsa.generate_private_key(
+    public_exponent=65537, key_size=2048, backend=default_backend()
+)
+PRIVATE_KEY = KEY.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.TraditionalOpenSSL,
+    serialization.NoEncryption(),
+).decode("ascii")
+PUBLIC_KEY = KEY.public_key()
+
+
+def expires_in(seconds):
+    expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds)
+    return expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGitHub:
+
+    """Mint installation tokens and serve an issue to holders of one."""
+
+    def __init__(self):
+        self.lifetime = 3600
+        self.minted = []
+        self.revoked = set()
+        self.authorizations = []
+        self.looked_up = []
+
+    async def access_tokens(self, request):
+        scheme, _, token = request.headers["authorization"].partition(" ")
+        assert scheme == "bearer"
+        claims = jwt.decode(token, PUBLIC_KEY, algorithms=["RS256"])
+        assert claims["iss"] == str(APP_ID)
+        assert "machine-man-preview" in request.headers["accept"]
+        await asyncio.sleep(0.01)
+        installation_id = request.match_info["installation_id"]
+        token = f"v1.{installation_id}.{len(self.minted)}"
+        self.minted.append(token)
+        return aiohttp.web.json_response(
+            {"token": token, "expires_at": expires_in(self.lifetime)}, status=201
+        )
+
+    async def issue(self, request):
+        authorization = request.headers["authorization"]
+        self.authorizations.append(authorization)
+        if authorization.partition(" ")[2] in self.revoked:
+            return aiohttp.web.json_response({"message": "Bad credentials"}, status=401)
+        return aiohttp.web.json_response({"number": 1})
+
+    async def installation(self, request):
+        scheme, _, token = request.headers["authorization"].partition(" ")
+        assert scheme == "bearer"
+        jwt.decode(token, PUBLIC_KEY, algorithms=["RS256"])
+        self.looked_up.append(request.match_info["name"])
+        if request.match_info["name"] == "missing":
+            return aiohttp.web.json_response({"message": "Not Found"}, status=404)
+        return aiohttp.web.json_response({"id": 42})
+
+
+@pytest.fixture
+async def fake_github():
+    fake = FakeGitHub()
+    app = aiohttp.web.Application()
+    app.router.add_post(
+        "/app/installations/{installation_id}/access_tokens", fake.access_tokens
+    )
+    app.router.add_get("/issue", fake.issue)
+    app.router.add_get("/repos/{owner}/{name}/installation", fake.installation)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        fake.url = str(server.make_url("")).rstrip("/")
+        fake.tokens = apps.InstallationTokens(APP_ID, PRIVATE_KEY, url=fake.url)
+        fake.client = client.Client(installation_tokens=fake.tokens)
+        yield fake
+        await fake.client.close()
+
+
+def test_app_jwt():
+    token = apps.app_jwt(APP_ID, PRIVATE_KEY, now=1_000_000)
+    claims = jwt.decode(
+        token, PUBLIC_KEY, algorithms=["RS256"], options={"verify_exp": False}
+    )
+    assert claims == {"iat": 999_940, "exp": 1_000_540, "iss": "1234"}
+
+    claims = jwt.decode(apps.app_jwt(APP_ID, PRIVATE_KEY), PUBLIC_KEY, ["RS256"])
+    assert claims["iat"] <= time.time() < claims["exp"]
+
+
+@pytest.mark.asyncio
+async def test_token_cached(fake_github):
+    gh = fake_github.client.github_api("pvscbot")
+    tokens = fake_github.tokens
+    first, second = await asyncio.gather(tokens.token(gh, 1), tokens.token(gh, 1))
+    # Concurrent requests share one token.
+    assert first == second == "v1.1.0"
+    assert await tokens.token(gh, 1) == first
+    assert await tokens.token(gh, 2) == "v1.2.1"
+    assert tokens.minted == 2
+
+    tokens.invalidate(1)
+    assert await tokens.token(gh, 1) == "v1.1.2"
+
+
+@pytest.mark.asyncio
+async def test_token_refreshed(fake_github):
+    gh = fake_github.client.github_api("pvscbot")
+    tokens = fake_github.tokens
+    # Expiring within the margin.
+    fake_github.lifetime = tokens.margin - 60
+    assert await tokens.token(gh, 1) == "v1.1.0"
+    assert await tokens.token(gh, 1) == "v1.1.1"
+
+
+@pytest.mark.asyncio
+async def test_installation_requests(fake_github):
+    gh = fake_github.client.github_api("pvscbot", installation_id=7)
+    assert gh.installation_id == 7
+    assert fake_github.client.github_api("pvscbot", installation_id=7) is gh
+    issue_url = fake_github.url + "/issue"
+    await gh.getitem(issue_url)
+    await gh.getitem(issue_url)
+    assert fake_github.minted == ["v1.7.0"]
+    assert fake_github.authorizations == ["token v1.7.0", "token v1.7.0"]
+    # An explicit token is used as-is.
+    await gh.getitem(issue_url, oauth_token="personal")
+    assert fake_github.authorizations[-1] == "token personal"
+
+    # A revoked token is replaced for the next request.
+    fake_github.revoked.add("v1.7.0")
+    with pytest.raises(gidgethub.BadRequest):
+        await gh.getitem(issue_url)
+    await gh.getitem(issue_url)
+    assert fake_github.authorizations[-1] == "token v1.7.1"
+
+
+@pytest.mark.asyncio
+async def test_other_errors_keep_token(fake_github):
+    gh = fake_github.client.github_api("pvscbot", installation_id=7)
+    with pytest.raises(gidgethub.BadRequest):
+        await gh.getitem(fake_github.url + "/missing")
+    await gh.getitem(fake_github.url + "/issue")
+    assert fake_github.minted == ["v1.7.0"]
+
+
+@pytest.mark.asyncio
+async def test_oauth_requests(fake_github):
+    # Without an installation the App's tokens aren't used.
+    gh = fake_github.client.github_api("pvscbot", oauth_token="personal")
+    assert gh.tokens is None
+    await gh.getitem(fake_github.url + "/issue")
+    assert fake_github.authorizations == ["token personal"]
+    assert not fake_github.minted
+
+
+@pytest.mark.asyncio
+async def test_installation_id(fake_github):
+    gh = fake_github.client.github_api("pvscbot")
+    tokens = fake_github.tokens
+    assert await tokens.installation_id(gh, "Microsoft/vscode-python") == 42
+    # Looked up once per repository, whatever the case of its name.
+    assert await tokens.installation_id(gh, "microsoft/VSCode-Python") == 42
+    assert fake_github.looked_up == ["vscode-python"]
+    with pytest.raises(gidgethub.BadRequest):
+        await tokens.installation_id(gh, "Microsoft/missing")
@@ -0,0 +1,194 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import batch, instrument, ratelimit
+
+
+class Logger:
+    def __init__(self):
+        self._logged = []
+
+    def info(self, message):
+        self._logged.append(message)
+
+    def exception(self, message):
+        self._logged.append(message)
+
+
+def make_event(delivery_id, number, action="labeled"):
+    return gidgethub.sansio.Event(
+        {"action": action, "number": number}, event="issues", delivery_id=delivery_id
+    )
+
+
+def number(event):
+    return event.data["number"]
+
+
+def is_label_change(event):
+    return event.data["action"] in {"labeled", "unlabeled"}
+
+
+def delivery_ids(groups):
+    return [[event.delivery_id for event in events] for events in groups]
+
+
+def test_group():
+    events = [
+        make_event("1", 1),
+        make_event("2", 2),
+        make_event("3", None),
+        make_event("4", 1),
+        make_event("5", None),
+    ]
+    assert delivery_ids(batch.group(events, number)) == [
+        ["1", "4"],
+        ["2"],
+        ["3"],
+        ["5"],
+    ]
+
+
+def test_merge():
+    events = [
+        make_event("1", 1, "opened"),
+        make_event("2", 1),
+        make_event("3", 1, "unlabeled"),
+        make_event("4", 1, "edited"),
+        make_event("5", 1),
+    ]
+    runs = batch.merge(events, is_label_change)
+    assert delivery_ids(runs) == [["1"], ["2", "3"], ["4"], ["5"]]
+
+
+class Recorder:
+
+    """Record the order events are handled in and how many run at once."""
+
+    def __init__(self):
+        self.router = gidgethub.routing.Router()
+        self.handled = []
+        self.reconciled = []
+        self.running = 0
+        self.most_running = 0
+        self.router.add(self.handle, "issues")
+
+    async def handle(self, event, gh, **kwargs):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await asyncio.sleep(0)
+            self.handled.append(event.delivery_id)
+            instrument.record_call(0.1)
+        finally:
+            self.running -= 1
+
+    async def reconcile(self, event, gh, **kwargs):
+        self.reconciled.append(event.delivery_id)
+
+
+@pytest.mark.asyncio
+async def test_dispatch():
+    recorder = Recorder()
+    gh_events = []
+
+    def gh_factory(event):
+        gh_events.append(event.delivery_id)
+        return object()
+
+    dispatcher = batch.Batch(recorder.router, gh_factory, key=number, limit=2)
+    events = [make_event(str(index), index % 3) for index in range(9)]
+    assert await dispatcher.dispatch(events) == []
+    assert sorted(recorder.handled) == sorted(event.delivery_id for event in events)
+    # Each issue's events are handled in order, two issues at a time.
+    for issue in range(3):
+        mine = [event.delivery_id for event in events if number(event) == issue]
+        assert [handled for handled in recorder.handled if handled in mine] == mine
+    assert recorder.most_running == 2
+    assert sorted(gh_events) == sorted(recorder.handled)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_merged():
+    recorder = Recorder()
+    metrics = instrument.Metrics()
+    dispatcher = batch.Batch(
+        recorder.router,
+        lambda event: object(),
+        key=number,
+        mergeable=is_label_change,
+        reconcile=recorder.reconcile,
+        metrics=metrics,
+    )
+    events = [
+        make_event("1", 1, "opened"),
+        make_event("2", 1),
+        make_event("3", 1),
+        make_event("4", 1),
+        make_event("5", 2),
+    ]
+    assert await dispatcher.dispatch(events) == []
+    assert recorder.handled == ["1", "5"]
+    # Only the latest of the label changes needed handling.
+    assert recorder.reconciled == ["4"]
+    assert dispatcher.merged == 2
+    assert metrics.snapshot()["event.issues.labeled"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_dispatch_deferred():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    handled = []
+
+    @router.register("issues")
+    async def handle(event, gh, **kwargs):
+        if event.delivery_id == "2":
+            raise ratelimit.Deferred(30)
+        handled.append(event.delivery_id)
+
+    dispatcher = batch.Batch(router, lambda event: None, key=number, logger=logger)
+    events = [make_event(str(index), 1) for index in range(1, 5)]
+    events.append(make_event("5", 2))
+    deferred = await dispatcher.dispatch(events)
+    assert handled == ["1", "5"]
+    # Later events for the issue wait their turn.
+    assert [(event.delivery_id, delay) for event, delay in deferred] == [
+        ("2", 30),
+        ("3", 30),
+        ("4", 30),
+    ]
+    assert logger._logged == ["Deferring delivery 2 for 30.0 seconds"]
+
+    # Logging is optional.
+    dispatcher = batch.Batch(router, lambda event: None, key=number)
+    assert len(await dispatcher.dispatch(events)) == 3
+
+
+@pytest.mark.asyncio
+async def test_dispatch_failure():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    handled = []
+
+    @router.register("issues")
+    async def handle(event, gh, **kwargs):
+        if event.delivery_id == "1":
+            raise ValueError
+        handled.append(event.delivery_id)
+
+    dispatcher = batch.Batch(router, lambda event: None, key=number, logger=logger)
+    events = [make_event("1", 1), make_event("2", 1)]
+    assert await dispatcher.dispatch(events) == []
+    # The rest of the batch is still handled.
+    assert handled == ["2"]
+    assert logger._logged == ["Failed to process delivery 1"]
+
+    dispatcher = batch.Batch(router, lambda event: None, key=number)
+    assert await dispatcher.dispatch(events) == []
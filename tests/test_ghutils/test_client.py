@@ -0,0 +1,250 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import gidgethub.aiohttp
+import pytest
+
+from __app__.ghutils import client, instrument, ratelimit
+
+
+@pytest.mark.asyncio
+async def test_session_settings():
+    http_client = client.Client(
+        limit=10, limit_per_host=5, keepalive_timeout=15, ttl_dns_cache=600, timeout=9
+    )
+    session = http_client.session
+    assert http_client.session is session
+    connector = session.connector
+    assert connector.limit == 10
+    assert connector.limit_per_host == 5
+    assert connector._keepalive_timeout == 15
+    assert connector._cached_hosts._ttl == 600
+    assert session._timeout.total == 9
+    await http_client.close()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_github_api_shared():
+    http_client = client.Client()
+    gh = http_client.github_api("pvscbot", oauth_token="secret")
+    assert isinstance(gh, gidgethub.aiohttp.GitHubAPI)
+    assert gh._session is http_client.session
+    assert gh.requester == "pvscbot"
+    assert gh.oauth_token == "secret"
+    assert http_client.github_api("pvscbot", oauth_token="secret") is gh
+    assert http_client.github_api("pvscbot", oauth_token="other") is not gh
+    await http_client.close()
+    # A new session and GitHubAPI instances are created after closing.
+    assert http_client.github_api("pvscbot", oauth_token="secret") is not gh
+    await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_github_api_bounded():
+    http_client = client.Client(maxsize=2)
+    first = http_client.github_api("pvscbot", oauth_token="A")
+    second = http_client.github_api("pvscbot", oauth_token="B")
+    assert http_client.github_api("pvscbot", oauth_token="A") is first
+    third = http_client.github_api("pvscbot", oauth_token="C")
+    # The least recently used instance is dropped, but all share the session.
+    assert http_client.github_api("pvscbot", oauth_token="A") is first
+    assert http_client.github_api("pvscbot", oauth_token="B") is not second
+    assert third._session is first._session
+    await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_github_api_cache():
+    cache = {}
+    http_client = client.Client(cache=cache)
+    gh = http_client.github_api("pvscbot")
+    assert gh._cache is cache
+    await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_github_api_scheduler():
+    http_client = client.Client(scheduler_factory=ratelimit.Scheduler)
+    gh = http_client.github_api("pvscbot", oauth_token="A")
+    assert isinstance(gh.scheduler, ratelimit.Scheduler)
+    other_gh = http_client.github_api("pvscbot", oauth_token="B")
+    assert other_gh.scheduler is not gh.scheduler
+    await http_client.close()
+
+    http_client = client.Client()
+    assert http_client.github_api("pvscbot").scheduler is None
+    await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_requests_unpaced():
+    async def labels(request):
+        return aiohttp.web.json_response([{"name": "bug"}])
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/labels", labels)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client()
+        gh = http_client.github_api("pvscbot")
+        delivery = instrument.Delivery()
+        with delivery.active():
+            labels_url = str(server.make_url("/labels"))
+            assert await gh.getitem(labels_url) == [{"name": "bug"}]
+        assert delivery.calls[None].count == 1
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_requests_paced():
+    async def labels(request):
+        return aiohttp.web.json_response(
+            [], headers={"x-ratelimit-remaining": "10", "x-ratelimit-limit": "5000"}
+        )
+
+    async def secondary_limit(request):
+        return aiohttp.web.json_response(
+            {"message": "You have exceeded a secondary rate limit."},
+            status=403,
+            headers={"retry-after": "30"},
+        )
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/labels", labels)
+    app.router.add_post("/labels", secondary_limit)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client(scheduler_factory=ratelimit.Scheduler)
+        gh = http_client.github_api("pvscbot")
+        url = str(server.make_url("/labels"))
+        await gh.getitem(url)
+        with pytest.raises(ratelimit.Deferred):
+            await gh.post(url, data={"labels": ["bug"]})
+        with pytest.raises(ratelimit.Deferred):
+            await gh.getitem(url)
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_warm():
+    requests = []
+
+    async def handler(request):
+        requests.append(request.method)
+        return aiohttp.web.Response()
+
+    app = aiohttp.web.Application()
+    app.router.add_route("*", "/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client()
+        await http_client.warm(str(server.make_url("/")))
+        assert requests == ["HEAD"]
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_while_warming():
+    requests = []
+    started = asyncio.Event()
+
+    async def handler(request):
+        requests.append(request.method)
+        started.set()
+        await asyncio.sleep(60)
+        return aiohttp.web.Response()
+
+    app = aiohttp.web.Application()
+    app.router.add_route("*", "/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client()
+        http_client.start_warming(str(server.make_url("/")))
+        await started.wait()
+        await http_client.close()
+        # Warming up was stopped rather than opening a new session.
+        assert http_client._session is None
+        assert requests == ["HEAD"]
+        # Closing again is fine.
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_before_warming():
+    http_client = client.Client()
+    http_client.start_warming("http://127.0.0.1:1/")
+    await http_client.close()
+    await asyncio.sleep(0)
+    assert http_client._session is None
+
+
+@pytest.mark.asyncio
+async def test_warm_failure():
+    http_client = client.Client()
+    port = aiohttp.test_utils.unused_port()
+    # Nothing is listening, but that isn't an error.
+    await http_client.warm(f"http://127.0.0.1:{port}/")
+    await http_client.close()
+
+
+def test_close_connections(event_loop, monkeypatch):
+    monkeypatch.setattr(asyncio, "get_event_loop", lambda: event_loop)
+    http_client = client.Client()
+    http_client.close_connections()  # No session yet.
+
+    async def open_session():
+        return http_client.session
+
+    session = event_loop.run_until_complete(open_session())
+    http_client.close_connections()
+    assert session.closed
+    http_client.close_connections()  # Already closed.
+
+
+def test_close_connections_loop_closed(event_loop, monkeypatch):
+    monkeypatch.setattr(asyncio, "get_event_loop", lambda: event_loop)
+    http_client = client.Client()
+
+    async def open_session():
+        return http_client.session
+
+    session = event_loop.run_until_complete(open_session())
+    event_loop.close()
+    # Nothing can be done without an event loop.
+    http_client.close_connections()
+    assert not session.closed
+    session.detach()
+
+
+def test_close_connections_no_loop(event_loop, monkeypatch):
+    http_client = client.Client()
+
+    async def open_session():
+        return http_client.session
+
+    session = event_loop.run_until_complete(open_session())
+
+    def no_loop():
+        raise RuntimeError("There is no current event loop")
+
+    monkeypatch.setattr(asyncio, "get_event_loop", no_loop)
+    http_client.close_connections()
+    assert not session.closed
+    session.detach()
+
+
+@pytest.mark.asyncio
+async def test_close_connections_loop_running():
+    http_client = client.Client()
+    session = http_client.session
+    http_client.close_connections()
+    assert not session.closed
+    await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_close_unused():
+    http_client = client.Client()
+    await http_client.close()
@@ -0,0 +1,102 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import coalesce
+
+
+def make_event(subject, delivery_id):
+    return gidgethub.sansio.Event(
+        {"subject": subject}, event="issues", delivery_id=delivery_id
+    )
+
+
+def subject_key(event):
+    return event.data["subject"]
+
+
+@pytest.mark.asyncio
+async def test_burst_reconciled_once():
+    router = gidgethub.routing.Router()
+    reconciled = []
+
+    async def reconcile(event, gh, **kwargs):
+        reconciled.append((event.delivery_id, gh, kwargs))
+
+    coalescer = coalesce.Coalescer(router, subject_key, reconcile, window=0.01)
+    gh = object()
+    await asyncio.gather(
+        coalescer.dispatch(make_event("issue", "1"), gh, logger=None),
+        coalescer.dispatch(make_event("issue", "2"), gh, logger=None),
+        coalescer.dispatch(make_event("issue", "3"), gh, logger=None),
+    )
+
+    assert reconciled == [("3", gh, {"logger": None})]
+    assert coalescer.coalesced == 2
+    assert not coalescer._pending
+
+
+@pytest.mark.asyncio
+async def test_subjects_kept_separate():
+    router = gidgethub.routing.Router()
+    reconciled = []
+
+    async def reconcile(event, gh):
+        reconciled.append(event.delivery_id)
+
+    coalescer = coalesce.Coalescer(router, subject_key, reconcile, window=0)
+    await asyncio.gather(
+        coalescer.dispatch(make_event("A", "1"), object()),
+        coalescer.dispatch(make_event("B", "2"), object()),
+    )
+
+    assert sorted(reconciled) == ["1", "2"]
+    assert not coalescer.coalesced
+
+
+@pytest.mark.asyncio
+async def test_uncoalesced_events_routed():
+    router = gidgethub.routing.Router()
+    routed = []
+
+    @router.register("issues")
+    async def callback(event, gh):
+        routed.append(event.delivery_id)
+
+    reconciled = []
+
+    async def reconcile(event, gh):
+        reconciled.append(event.delivery_id)
+
+    coalescer = coalesce.Coalescer(router, subject_key, reconcile, window=60)
+    await coalescer.dispatch(make_event(None, "1"), object())
+
+    assert routed == ["1"]
+    assert not reconciled
+
+
+@pytest.mark.asyncio
+async def test_cancelled_while_waiting():
+    router = gidgethub.routing.Router()
+
+    reconciled = []
+
+    async def reconcile(event, gh):
+        reconciled.append(event.delivery_id)
+
+    coalescer = coalesce.Coalescer(router, subject_key, reconcile, window=60)
+    waiting = asyncio.ensure_future(
+        coalescer.dispatch(make_event("issue", "1"), object())
+    )
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert not coalescer._pending
+    assert not reconciled
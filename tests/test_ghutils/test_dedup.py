@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import time
+
+import pytest
+
+from __app__.ghutils import dedup
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def deduplicator(request, tmp_path, clock):
+    if request.param == "memory":
+        yield dedup.MemoryDeduplicator(ttl=60)
+    else:
+        deduplicator = dedup.SQLiteDeduplicator(str(tmp_path / "dedup.db"), ttl=60)
+        yield deduplicator
+        deduplicator.close()
+
+
+def test_duplicates(deduplicator):
+    assert deduplicator.claim("1")
+    assert deduplicator.claim("2")
+    assert not deduplicator.claim("1")
+    assert not deduplicator.claim("1")
+    assert deduplicator.duplicates == 2
+
+
+def test_expiry(deduplicator, clock):
+    assert deduplicator.claim("1")
+    clock[0] += 30
+    assert deduplicator.claim("2")
+    clock[0] += 31
+    assert deduplicator.claim("1")
+    assert not deduplicator.claim("2")
+
+
+def test_release(deduplicator):
+    assert deduplicator.claim("1")
+    deduplicator.release("1")
+    assert deduplicator.claim("1")
+    deduplicator.release("2")  # Unknown deliveries are fine.
+    assert not deduplicator.duplicates
+
+
+def test_memory_maxsize(clock):
+    deduplicator = dedup.MemoryDeduplicator(maxsize=2)
+    for delivery_id in "123":
+        assert deduplicator.claim(delivery_id)
+    assert deduplicator.claim("1")
+    assert not deduplicator.claim("3")
+
+
+def test_sqlite_persistence(tmp_path, clock):
+    path = str(tmp_path / "dedup.db")
+    deduplicator = dedup.SQLiteDeduplicator(path)
+    assert deduplicator.claim("1")
+    deduplicator.close()
+    deduplicator = dedup.SQLiteDeduplicator(path)
+    assert not deduplicator.claim("1")
+    deduplicator.close()
@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import pytest
+
+from __app__.ghutils import fanout
+
+
+@pytest.mark.asyncio
+async def test_results_in_order():
+    async def call(value):
+        await asyncio.sleep(0.01 * (3 - value))
+        return value
+
+    assert await fanout.gather([call(1), call(2), call(3)]) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_no_calls():
+    assert await fanout.gather([]) == []
+
+
+@pytest.mark.asyncio
+async def test_limit():
+    running = 0
+    most_running = 0
+
+    async def call():
+        nonlocal running, most_running
+        running += 1
+        most_running = max(running, most_running)
+        await asyncio.sleep(0)
+        running -= 1
+
+    await fanout.gather([call() for _ in range(10)], limit=3)
+    assert most_running == 3
+
+
+@pytest.mark.asyncio
+async def test_tolerated_errors():
+    async def succeed():
+        return "success"
+
+    async def fail():
+        raise LookupError("tolerated")
+
+    outcomes = await fanout.gather(
+        [fail(), succeed()], tolerate=lambda exc: isinstance(exc, LookupError)
+    )
+    assert isinstance(outcomes[0], LookupError)
+    assert outcomes[1] == "success"
+
+
+@pytest.mark.asyncio
+async def test_untolerated_error_after_all_calls():
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(0.01)
+        finished.append("slow")
+
+    async def fail(exc):
+        raise exc
+
+    with pytest.raises(ValueError, match="first"):
+        await fanout.gather([fail(ValueError("first")), slow(), fail(KeyError())])
+    assert finished == ["slow"]
@@ -0,0 +1,196 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import re
+
+import aiohttp.test_utils
+import aiohttp.web
+import gidgethub
+import pytest
+
+from __app__.ghutils import client, graphql
+
+
+ALIAS = re.compile(r"(r\d+): ")
+
+
+class FakeEndpoint:
+
+    """Echo each field's variables back as its data.
+
+    A field whose 'fail' variable is set gets an error instead, an 'everything'
+    variable is an error for the whole document, and a variable set to
+    "status" fails the HTTP request.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.requests.append(payload)
+        variables = payload["variables"]
+        if "status" in variables.values():
+            return aiohttp.web.json_response({"message": "oops"}, status=502)
+        data = {}
+        errors = []
+        for alias in ALIAS.findall(payload["query"]):
+            echoed = {
+                name[len(alias) + 1 :]: value
+                for name, value in variables.items()
+                if name.startswith(alias + "_")
+            }
+            if echoed.get("fail"):
+                data[alias] = None
+                errors.append({"message": echoed["fail"], "path": [alias]})
+            elif echoed.get("everything"):
+                return aiohttp.web.json_response(
+                    {"errors": [{"message": echoed["everything"]}]}
+                )
+            else:
+                data[alias] = echoed
+        response = {"data": data}
+        if errors:
+            response["errors"] = errors
+        return aiohttp.web.json_response(response)
+
+
+@pytest.fixture
+async def endpoint():
+    fake = FakeEndpoint()
+    app = aiohttp.web.Application()
+    app.router.add_post("/graphql", fake.handle)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client()
+        fake.url = str(server.make_url("/graphql"))
+        fake.gh = http_client.github_api("pvscbot")
+        yield fake
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_batched(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    results = await asyncio.gather(
+        batcher.query(endpoint.gh, "node(id: $id) { id }", {"id": ("ID!", "A")}),
+        batcher.query(endpoint.gh, "node(id: $id) { id }", {"id": ("ID!", "B")}),
+    )
+    assert results == [{"id": "A"}, {"id": "B"}]
+    assert batcher.sent == 1
+    assert endpoint.requests == [
+        {
+            "query": "query($r0_id: ID!, $r1_id: ID!) "
+            "{ r0: node(id: $r0_id) { id } r1: node(id: $r1_id) { id } }",
+            "variables": {"r0_id": "A", "r1_id": "B"},
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_no_variables(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    assert await batcher.query(endpoint.gh, "viewer { login }") == {}
+    assert endpoint.requests[0]["query"] == "query { r0: viewer { login } }"
+
+
+@pytest.mark.asyncio
+async def test_queries_and_mutations_separate(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    await asyncio.gather(
+        batcher.query(endpoint.gh, "node(id: $id) { id }", {"id": ("ID!", "A")}),
+        batcher.mutate(
+            endpoint.gh,
+            "addLabelsToLabelable(input: $input) { clientMutationId }",
+            {"input": ("AddLabelsToLabelableInput!", {"labelableId": "A"})},
+        ),
+    )
+    assert batcher.sent == 2
+    kinds = sorted(request["query"].split("(")[0] for request in endpoint.requests)
+    assert kinds == ["mutation", "query"]
+
+
+@pytest.mark.asyncio
+async def test_window(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url, window=0.05)
+
+    async def later(value):
+        await asyncio.sleep(0.01)
+        return await batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", value)})
+
+    await asyncio.gather(
+        batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", 1)}), later(2)
+    )
+    assert batcher.sent == 1
+
+
+@pytest.mark.asyncio
+async def test_maxsize(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url, window=60, maxsize=2)
+    results = await asyncio.gather(
+        *(
+            batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", value)})
+            for value in range(4)
+        )
+    )
+    assert results == [{"v": value} for value in range(4)]
+    assert batcher.sent == 2
+
+
+@pytest.mark.asyncio
+async def test_field_error(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    good, bad = await asyncio.gather(
+        batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", 1)}),
+        batcher.query(endpoint.gh, "x(fail: $fail)", {"fail": ("String", "nope")}),
+        return_exceptions=True,
+    )
+    assert good == {"v": 1}
+    assert isinstance(bad, graphql.GraphQLError)
+    assert str(bad) == "nope"
+    assert bad.errors == [{"message": "nope", "path": ["r1"]}]
+
+
+@pytest.mark.asyncio
+async def test_request_error(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    results = await asyncio.gather(
+        batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", 1)}),
+        batcher.query(
+            endpoint.gh, "x(all: $everything)", {"everything": ("String", "broken")}
+        ),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, graphql.GraphQLError) for result in results)
+    assert str(results[0]) == "broken"
+
+
+@pytest.mark.asyncio
+async def test_http_error(endpoint):
+    batcher = graphql.Batcher(url=endpoint.url)
+    results = await asyncio.gather(
+        batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", 1)}),
+        batcher.query(endpoint.gh, "x(s: $s)", {"s": ("String", "status")}),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, gidgethub.GitHubBroken) for result in results)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [None, "status"])
+async def test_cancelled(endpoint, status):
+    batcher = graphql.Batcher(url=endpoint.url)
+    cancelled = asyncio.ensure_future(
+        batcher.query(endpoint.gh, "x(v: $v)", {"v": ("Int!", 1)})
+    )
+    kept = asyncio.ensure_future(
+        batcher.query(endpoint.gh, "x(s: $s)", {"s": ("String", status)})
+    )
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.wait([cancelled, kept])
+    assert cancelled.cancelled()
+    if status is None:
+        assert kept.result() == {"s": None}
+    else:
+        assert isinstance(kept.exception(), gidgethub.GitHubBroken)
@@ -0,0 +1,140 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import pytest
+from __app__.ghutils import client, httpcache
+
+
+RESPONSE = ("etag", "last-modified", [{"name": "bug"}], None)
+
+
+def test_lru_counters():
+    cache = httpcache.LRUCache()
+    with pytest.raises(KeyError):
+        cache["A"]
+    cache["A"] = RESPONSE
+    assert cache["A"] == RESPONSE
+    assert "A" in cache
+    assert "B" not in cache
+    assert cache.conditional == 1
+    assert cache.misses == 1
+    # Only 304s are hits.
+    assert not cache.hits
+    cache.record_not_modified()
+    assert cache.hits == 1
+
+
+def test_lru_eviction():
+    cache = httpcache.LRUCache(maxsize=2)
+    cache["A"] = RESPONSE
+    cache["B"] = RESPONSE
+    cache["A"]
+    cache["C"] = RESPONSE
+    assert list(cache) == ["A", "C"]
+    assert len(cache) == 2
+    del cache["A"]
+    assert list(cache) == ["C"]
+
+
+def test_sqlite(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = httpcache.SQLiteCache(path)
+    with pytest.raises(KeyError):
+        cache["A"]
+    cache["A"] = RESPONSE
+    assert cache["A"] == RESPONSE
+    assert cache.conditional == 1
+    assert cache.misses == 1
+    assert not cache.hits
+    cache.record_not_modified()
+    assert cache.hits == 1
+    cache.close()
+
+    # Survives reopening.
+    cache = httpcache.SQLiteCache(path)
+    assert "A" in cache
+    assert "B" not in cache
+    assert list(cache) == ["A"]
+    assert len(cache) == 1
+    assert not cache.conditional
+    del cache["A"]
+    with pytest.raises(KeyError):
+        del cache["A"]
+    assert not len(cache)
+    cache.close()
+
+
+def test_sqlite_eviction(tmp_path, monkeypatch):
+    now = 1000.0
+
+    def fake_time():
+        return now
+
+    monkeypatch.setattr(httpcache.time, "time", fake_time)
+    cache = httpcache.SQLiteCache(str(tmp_path / "cache.db"), maxsize=2)
+    cache["A"] = RESPONSE
+    now += 1
+    cache["B"] = RESPONSE
+    now += 1
+    cache["A"]
+    now += 1
+    cache["C"] = RESPONSE
+    assert sorted(cache) == ["A", "C"]
+    cache.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("in_database", [False, True])
+async def test_conditional_requests(tmp_path, in_database):
+    conditional = []
+    etags = ['"abc"', '"abc"', '"def"']
+
+    async def handler(request):
+        etag = etags.pop(0)
+        conditional.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == etag:
+            return aiohttp.web.Response(status=304, headers={"etag": etag})
+        return aiohttp.web.json_response([{"name": etag}], headers={"etag": etag})
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/labels", handler)
+    if in_database:
+        cache = httpcache.SQLiteCache(str(tmp_path / "cache.db"))
+    else:
+        cache = httpcache.LRUCache()
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as session:
+            gh = client.GitHubAPI(session, "pvscbot", cache=cache)
+            url = str(server.make_url("/labels"))
+            first = await gh.getitem(url)
+            second = await gh.getitem(url)
+            # Changed, so not served from the cache.
+            third = await gh.getitem(url)
+
+    assert first == second == [{"name": '"abc"'}]
+    assert third == [{"name": '"def"'}]
+    assert conditional == [None, '"abc"', '"abc"']
+    assert cache.misses == 1
+    assert cache.conditional == 2
+    assert cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_plain_mapping(tmp_path):
+    async def handler(request):
+        if request.headers.get("if-none-match"):
+            return aiohttp.web.Response(status=304, headers={"etag": '"abc"'})
+        return aiohttp.web.json_response([], headers={"etag": '"abc"'})
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/labels", handler)
+    cache = {}
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as session:
+            gh = client.GitHubAPI(session, "pvscbot", cache=cache)
+            url = str(server.make_url("/labels"))
+            await gh.getitem(url)
+            assert await gh.getitem(url) == []
@@ -0,0 +1,187 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+
+import gidgethub
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import instrument, lazyevent
+
+
+class Logger:
+    def __init__(self):
+        self._logged = []
+
+    def info(self, message):
+        self._logged.append(message)
+
+
+HEADERS = {
+    "content-type": "application/json",
+    "x-github-event": "pull_request",
+    "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+    "x-hub-signature": "sha1=c28e33b2e56e548956c446e890929a6cbec3ac89",
+}
+BODY = '{"action": "opened"}'.encode("UTF-8")
+
+
+def make_event(data=None, event_type="issues"):
+    if data is None:
+        data = {"action": "opened"}
+    return gidgethub.sansio.Event(data, event=event_type, delivery_id="12345")
+
+
+def test_stats():
+    stats = instrument.Stats()
+    assert stats.as_dict()["mean_ms"] == 0
+    stats.add(1)
+    stats.add(3)
+    assert stats.as_dict() == {
+        "count": 2,
+        "total_ms": 4000,
+        "mean_ms": 2000,
+        "max_ms": 3000,
+    }
+
+
+def test_parse():
+    delivery = instrument.Delivery()
+    event = delivery.parse(HEADERS, BODY, secret="123456")
+    assert event is delivery.event
+    assert set(delivery.stages) == {"verify", "parse"}
+    assert event.data == {"action": "opened"}
+    assert delivery.name == "pull_request.opened"
+
+    with pytest.raises(gidgethub.ValidationFailure):
+        instrument.Delivery().parse(HEADERS, BODY, secret="wrong")
+
+
+def test_parse_without_secret():
+    headers = dict(HEADERS)
+    del headers["x-hub-signature"]
+    delivery = instrument.Delivery()
+    delivery.parse(headers, BODY)
+    assert set(delivery.stages) == {"parse"}
+
+    # Validation is still enforced.
+    with pytest.raises(gidgethub.ValidationFailure):
+        instrument.Delivery().parse(HEADERS, BODY)
+
+
+def test_decode():
+    event = lazyevent.LazyEvent(BODY.decode("utf-8"), event="issues", delivery_id="1")
+    delivery = instrument.Delivery(event)
+    delivery.decode()
+    # Decoding a queued event's payload counts towards parsing.
+    assert event.decoded
+    assert set(delivery.stages) == {"parse"}
+
+
+@pytest.mark.asyncio
+async def test_router():
+    original = gidgethub.routing.Router()
+    seen = []
+
+    @original.register("issues")
+    async def shallow(event, *args, **kwargs):
+        seen.append("shallow")
+
+    @original.register("issues", action="opened")
+    @original.register("issues", action="reopened")
+    async def deep(event, *args, **kwargs):
+        seen.append("deep")
+        instrument.record_call(0.5)
+        instrument.record_retry(0.1)
+        instrument.record_call(0.25)
+
+    router = instrument.router(original)
+    assert router._deep_routes["issues"]["action"]["opened"] == (
+        router._deep_routes["issues"]["action"]["reopened"]
+    )
+    assert router._deep_routes["issues"]["action"]["opened"][0].__name__ == "deep"
+
+    # Nothing is recorded outside of a delivery.
+    instrument.record_call(1)
+    instrument.record_retry(1)
+    await router.dispatch(make_event())
+    assert seen == ["shallow", "deep"]
+
+    delivery = instrument.Delivery(make_event({"action": "reopened"}))
+    with delivery.active():
+        await router.dispatch(delivery.event)
+        instrument.record_call(1)
+    instrument.record_call(1)
+    assert set(delivery.handlers) == {"shallow", "deep"}
+    record = delivery.as_dict()
+    assert record["delivery_id"] == "12345"
+    assert record["event"] == "issues.reopened"
+    assert record["handlers"]["shallow"]["github_calls"] == 0
+    assert record["handlers"]["deep"]["github_calls"] == 2
+    assert record["handlers"]["deep"]["github_ms"] == 750
+    assert record["handlers"]["deep"]["github_retries"] == 1
+    assert record["handlers"]["shallow"]["github_retries"] == 0
+    assert record["github_calls"] == 3
+    assert record["github_ms"] == 1750
+    assert record["github_retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_callback_failure():
+    original = gidgethub.routing.Router()
+
+    @original.register("issues")
+    async def failing(event, *args, **kwargs):
+        raise ValueError
+
+    delivery = instrument.Delivery(make_event())
+    with delivery.active(), pytest.raises(ValueError):
+        await instrument.router(original).dispatch(delivery.event)
+    assert "failing" in delivery.handlers
+
+
+def test_metrics():
+    metrics = instrument.Metrics()
+    delivery = instrument.Delivery(make_event())
+    with delivery.stage("dispatch"):
+        pass
+    delivery.handlers["classify"] = 0.5
+    delivery.calls["classify"].add(0.25)
+    delivery.calls["classify"].add(0.125)
+    delivery.calls[None].add(1)
+    delivery.retries["classify"].add(0.5)
+    metrics.add(delivery)
+    # Not dispatched, e.g. a duplicate.
+    metrics.add(instrument.Delivery(make_event({}, "ping")))
+
+    snapshot = metrics.snapshot()
+    assert list(snapshot) == [
+        "event.issues.opened",
+        "github.classify",
+        "github.other",
+        "handler.classify",
+        "retry.classify",
+        "stage.dispatch",
+    ]
+    assert snapshot["github.classify"]["count"] == 2
+    assert snapshot["github.classify"]["max_ms"] == 250
+    assert snapshot["handler.classify"]["total_ms"] == 500
+    assert snapshot["retry.classify"]["count"] == 1
+    metrics.clear()
+    assert not metrics.snapshot()
+
+
+def test_report():
+    metrics = instrument.Metrics()
+    logger = Logger()
+    delivery = instrument.Delivery(make_event({}, "ping"))
+    instrument.report(delivery, metrics, logger)
+    assert logger._logged[0].startswith("Metrics for delivery ID 12345: ")
+    record = json.loads(logger._logged[0].partition(": ")[2])
+    assert record["event"] == "ping"
+
+    # Logging is optional.
+    instrument.report(delivery, metrics)
+    assert len(logger._logged) == 1
@@ -0,0 +1,165 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import journal, ratelimit
+
+
+class Logger:
+    def __init__(self):
+        self._logged = []
+
+    def exception(self, message):
+        self._logged.append(message)
+
+
+def make_event(delivery_id="1", action="opened"):
+    return gidgethub.sansio.Event(
+        {"action": action}, event="issues", delivery_id=delivery_id
+    )
+
+
+def outcomes(directory):
+    return {
+        delivery_id: entry.outcome
+        for delivery_id, entry in journal.entries(directory).items()
+    }
+
+
+def test_record_and_finish(tmp_path):
+    record = journal.Journal(tmp_path)
+    record.record(make_event("1"))
+    record.record(make_event("2", "closed"))
+    record.finish("2", "ok")
+    # Finishing an event from a file since deleted is ignored.
+    record.finish("3", "ok")
+    record.close()
+    record.close()  # Idempotent.
+
+    entries = journal.entries(tmp_path)
+    assert list(entries) == ["1", "2"]
+    assert entries["1"].outcome is None
+    assert entries["2"].outcome == "ok"
+    event = entries["2"].event
+    assert event.event == "issues"
+    assert event.delivery_id == "2"
+    assert event.data == {"action": "closed"}
+
+
+def test_track(tmp_path):
+    record = journal.Journal(tmp_path)
+    with record.track(make_event("ok")):
+        pass
+    with pytest.raises(ratelimit.Deferred):
+        with record.track(make_event("deferred")):
+            raise ratelimit.Deferred(30)
+    with pytest.raises(ValueError):
+        with record.track(make_event("error")):
+            raise ValueError
+    with pytest.raises(asyncio.CancelledError):
+        with record.track(make_event("cancelled")):
+            raise asyncio.CancelledError
+    record.close()
+
+    assert outcomes(tmp_path) == {
+        "ok": "ok",
+        "deferred": "deferred",
+        "error": "error",
+        "cancelled": None,
+    }
+
+
+def test_sync_every(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(journal.os, "fsync", synced.append)
+    record = journal.Journal(tmp_path, sync_every=3)
+    for delivery_id in range(7):
+        record.record(make_event(str(delivery_id)))
+    assert len(synced) == 2
+    record.close()
+    assert len(synced) == 3
+
+
+def test_rotation(tmp_path):
+    record = journal.Journal(tmp_path, max_bytes=1, keep=2)
+    for delivery_id in range(4):
+        record.record(make_event(str(delivery_id)))
+    record.close()
+    # Every record fills a file and only the newest files are kept.
+    assert [path.name for path in journal.files(tmp_path)] == [
+        "journal-000004.jsonl",
+        "journal-000005.jsonl",
+    ]
+    assert list(journal.entries(tmp_path)) == ["3"]
+
+
+def test_reopening(tmp_path):
+    record = journal.Journal(tmp_path)
+    record.record(make_event("1"))
+    record.close()
+
+    # Appends to the newest file.
+    record = journal.Journal(tmp_path)
+    record.finish("1", "ok")
+    record.close()
+    assert len(journal.files(tmp_path)) == 1
+    assert outcomes(tmp_path) == {"1": "ok"}
+
+
+def test_incomplete_lines(tmp_path):
+    record = journal.Journal(tmp_path)
+    record.record(make_event("1"))
+    record.close()
+    path = journal.files(tmp_path)[0]
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"type": "finish", "deliv')
+    assert len(list(journal.read(tmp_path))) == 1
+
+
+@pytest.mark.asyncio
+async def test_replay(tmp_path, monkeypatch):
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    attempts = []
+    factory_events = []
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(journal.asyncio, "sleep", sleep)
+
+    def gh_factory(event):
+        factory_events.append(event.delivery_id)
+        return object()
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        attempts.append(event.delivery_id)
+        if event.delivery_id == "deferred" and attempts.count("deferred") < 2:
+            raise ratelimit.Deferred(30)
+        elif event.delivery_id == "error":
+            raise ValueError
+
+    events = [make_event("ok"), make_event("deferred"), make_event("error")]
+    record = journal.Journal(tmp_path)
+    replayed = await journal.replay(
+        router, gh_factory, events, journal=record, logger=logger
+    )
+    record.close()
+
+    assert replayed == {"ok": "ok", "deferred": "ok", "error": "error"}
+    assert attempts == ["ok", "deferred", "deferred", "error"]
+    assert factory_events == attempts
+    assert sleeps == [30]
+    assert logger._logged == ["Replaying delivery ID error failed"]
+    assert outcomes(tmp_path) == {"ok": "ok", "deferred": "ok", "error": "error"}
+
+    # The journal and logger are optional.
+    replayed = await journal.replay(router, gh_factory, [make_event("error")])
+    assert replayed == {"error": "error"}
@@ -0,0 +1,78 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import lazyevent
+
+
+PAYLOAD = '{"action": "opened", "issue": {"number": 1}}'
+
+
+def test_decoded_on_first_use():
+    event = lazyevent.LazyEvent(PAYLOAD, event="issues", delivery_id="12345")
+    assert event.event == "issues"
+    assert event.delivery_id == "12345"
+    assert not event.decoded
+    assert event.data == {"action": "opened", "issue": {"number": 1}}
+    assert event.decoded
+    assert event.data is event.data
+    # Compact as there's no instance dictionary.
+    assert not hasattr(event, "__dict__")
+
+
+def test_data_assigned():
+    event = lazyevent.LazyEvent(PAYLOAD, event="issues", delivery_id="1")
+    event.data = {"action": "closed"}
+    assert event.decoded
+    assert event.data == {"action": "closed"}
+
+
+def test_payload_json():
+    event = lazyevent.LazyEvent(PAYLOAD, event="issues", delivery_id="1")
+    # Used as-is.
+    assert lazyevent.payload_json(event) is PAYLOAD
+    assert not event.decoded
+
+    # Decoded payloads may have been changed.
+    event.data["action"] = "closed"
+    assert json.loads(lazyevent.payload_json(event))["action"] == "closed"
+    other = gidgethub.sansio.Event(
+        {"action": "opened"}, event="issues", delivery_id="1"
+    )
+    assert json.loads(lazyevent.payload_json(other)) == {"action": "opened"}
+
+
+def test_dumps():
+    event = lazyevent.LazyEvent(PAYLOAD, event="issues", delivery_id="1")
+    serialized = lazyevent.dumps({"event": "issues"}, event)
+    assert json.loads(serialized) == {
+        "event": "issues",
+        "data": {"action": "opened", "issue": {"number": 1}},
+    }
+    assert json.loads(lazyevent.dumps({}, event))["data"]["action"] == "opened"
+
+
+@pytest.mark.parametrize(
+    "record",
+    [{}, {"event": "issues"}, {"event": 'say "data": no', "delivery_id": "1"}],
+)
+def test_loads(record):
+    event = gidgethub.sansio.Event(
+        {"data": {"data": 1}, "action": "opened"}, event="issues", delivery_id="1"
+    )
+    loaded, payload = lazyevent.loads(lazyevent.dumps(record, event))
+    assert loaded == record
+    assert json.loads(payload) == event.data
+    # Records written in one go by json.dumps() load too.
+    loaded, payload = lazyevent.loads(json.dumps({**record, "data": None}) + "\n")
+    assert loaded == record
+    assert payload == "null"
+
+
+def test_loads_without_payload():
+    with pytest.raises(ValueError):
+        lazyevent.loads('{"event": "issues"}')
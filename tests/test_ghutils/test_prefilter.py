@@ -0,0 +1,52 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import gidgethub.routing
+
+from __app__.ghutils import prefilter
+
+
+async def callback(*args, **kwargs):
+    pass
+
+
+def make_prefilter():
+    router = gidgethub.routing.Router()
+    router.add(callback, "ping")
+    router.add(callback, "issues", action="opened")
+    router.add(callback, "issues", action="closed")
+    router.add(callback, "pull_request", action="opened")
+    router.add(callback, "pull_request")
+    router.add(callback, "check_run", status="completed")
+    return prefilter.Prefilter(router)
+
+
+def headers(event_type):
+    return {"x-github-event": event_type}
+
+
+def test_event_types():
+    checker = make_prefilter()
+    assert checker.wanted(headers("ping"), b"{}")
+    assert checker.wanted(headers("pull_request"), b'{"action": "edited"}')
+    assert checker.wanted(headers("check_run"), b'{"action": "created"}')
+    assert not checker.wanted(headers("push"), b"{}")
+    assert checker.skipped == 1
+    # Let a malformed delivery fail as usual.
+    assert checker.wanted({}, b"")
+
+
+def test_actions():
+    checker = make_prefilter()
+    assert checker.wanted(headers("issues"), b'{"action": "opened", "issue": {}}')
+    assert checker.wanted(headers("issues"), b'\n{\n  "action" :"closed"}')
+    assert not checker.wanted(headers("issues"), b'{"action": "edited"}')
+    assert not checker.wanted(headers("issues"), b'{"action": "opened_"}')
+    assert checker.skipped == 2
+
+
+def test_action_not_found():
+    checker = make_prefilter()
+    assert checker.wanted(headers("issues"), b'{"issue": {}, "action": "edited"}')
+    assert checker.wanted(headers("issues"), b"payload=%7B%22action%22")
+    assert not checker.skipped
@@ -0,0 +1,132 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import time
+
+import pytest
+
+from __app__.ghutils import ratelimit
+
+
+NOW = 1_000_000.0
+
+
+def rate_limit_headers(remaining, reset_in, limit=5000):
+    return {
+        "x-ratelimit-limit": str(limit),
+        "x-ratelimit-remaining": str(remaining),
+        "x-ratelimit-reset": str(NOW + reset_in),
+    }
+
+
+@pytest.fixture
+def slept(monkeypatch):
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(time, "time", lambda: NOW)
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return slept
+
+
+def test_deferred():
+    exc = ratelimit.Deferred(1.5)
+    assert exc.retry_after == 1.5
+    assert "1.5" in str(exc)
+
+
+@pytest.mark.asyncio
+async def test_no_details(slept):
+    scheduler = ratelimit.Scheduler()
+    await scheduler.pace("POST")
+    scheduler.observe(200, {})
+    await scheduler.pace("POST")
+    assert scheduler.rate_limit is None
+    assert not slept
+
+
+@pytest.mark.asyncio
+async def test_plenty_remaining(slept):
+    scheduler = ratelimit.Scheduler(reserve=100)
+    scheduler.observe(200, rate_limit_headers(101, 3600))
+    await scheduler.pace("POST")
+    assert scheduler.rate_limit.remaining == 101
+    assert not slept
+
+
+@pytest.mark.asyncio
+async def test_reads_not_paced(slept):
+    scheduler = ratelimit.Scheduler(reserve=100)
+    scheduler.observe(200, rate_limit_headers(10, 3600))
+    await scheduler.pace("GET")
+    assert not slept
+
+
+@pytest.mark.asyncio
+async def test_mutations_spread(slept):
+    scheduler = ratelimit.Scheduler(reserve=100, max_delay=5)
+    scheduler.observe(200, rate_limit_headers(100, 300))
+    await scheduler.pace("POST")
+    assert slept == [3]
+
+
+@pytest.mark.asyncio
+async def test_mutations_deferred(slept):
+    scheduler = ratelimit.Scheduler(reserve=100, max_delay=5)
+    scheduler.observe(200, rate_limit_headers(10, 600))
+    with pytest.raises(ratelimit.Deferred) as exc_info:
+        await scheduler.pace("DELETE")
+    assert exc_info.value.retry_after == 60
+    assert not slept
+
+
+@pytest.mark.asyncio
+async def test_exhausted(slept):
+    scheduler = ratelimit.Scheduler(reserve=100, max_delay=5)
+    scheduler.observe(200, rate_limit_headers(0, 30))
+    with pytest.raises(ratelimit.Deferred) as exc_info:
+        await scheduler.pace("POST")
+    assert exc_info.value.retry_after == 30
+
+
+@pytest.mark.asyncio
+async def test_reset_passed(slept):
+    scheduler = ratelimit.Scheduler(reserve=100)
+    scheduler.observe(200, rate_limit_headers(0, -1))
+    await scheduler.pace("POST")
+    assert not slept
+
+
+@pytest.mark.asyncio
+async def test_secondary_rate_limit(slept):
+    scheduler = ratelimit.Scheduler()
+    with pytest.raises(ratelimit.Deferred) as exc_info:
+        scheduler.observe(403, {"retry-after": "60"})
+    assert exc_info.value.retry_after == 60
+    # Everything waits for the back-off, even reads.
+    with pytest.raises(ratelimit.Deferred) as exc_info:
+        await scheduler.pace("GET")
+    assert exc_info.value.retry_after == 60
+    with pytest.raises(ratelimit.Deferred):
+        scheduler.observe(429, {"retry-after": "1"})
+
+
+@pytest.mark.asyncio
+async def test_primary_rate_limit(slept):
+    scheduler = ratelimit.Scheduler()
+    with pytest.raises(ratelimit.Deferred) as exc_info:
+        scheduler.observe(403, rate_limit_headers(0, 120))
+    assert exc_info.value.retry_after == 120
+    with pytest.raises(ratelimit.Deferred):
+        scheduler.observe(403, rate_limit_headers(0, -10))
+    assert scheduler.blocked_until == NOW
+
+
+def test_forbidden_for_other_reasons(slept):
+    scheduler = ratelimit.Scheduler()
+    scheduler.observe(403, {})
+    scheduler.observe(403, rate_limit_headers(10, 120))
+    assert not scheduler.blocked_until
@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
+import gidgethub
+import pytest
+
+from __app__.ghutils import client, instrument, retry
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Record waits instead of sleeping and make the jitter predictable."""
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    return slept
+
+
+def test_backoff(monkeypatch):
+    ranges = []
+
+    def uniform(low, high):
+        ranges.append((low, high))
+        return low
+
+    monkeypatch.setattr(retry.random, "uniform", uniform)
+    policy = retry.Policy(attempts=10, base=0.5, cap=3, budget=60)
+    for attempt in range(1, 5):
+        assert policy.backoff(attempt, 0) == 0
+    # The ceiling grows exponentially until capped.
+    assert ranges == [(0, 0.5), (0, 1), (0, 2), (0, 3)]
+    # Out of attempts.
+    assert policy.backoff(10, 0) is None
+
+
+def test_backoff_budget(monkeypatch):
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    policy = retry.Policy(base=1, budget=10)
+    assert policy.backoff(1, 9) == 1
+    assert policy.backoff(1, 9.5) is None
+
+
+class Responses:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, {}, b""
+
+
+@pytest.mark.asyncio
+async def test_call(no_sleep):
+    policy = retry.Policy(attempts=3, base=1)
+    request = Responses(502, aiohttp.ServerDisconnectedError(), 200)
+    delivery = instrument.Delivery()
+    with delivery.active():
+        assert await policy.call(request) == (200, {}, b"")
+    assert request.calls == 3
+    assert no_sleep == [1, 2]
+    assert delivery.retries[None].count == 2
+
+
+@pytest.mark.asyncio
+async def test_call_not_retryable(no_sleep):
+    policy = retry.Policy()
+    request = Responses(404)
+    assert (await policy.call(request))[0] == 404
+    request = Responses(ValueError())
+    with pytest.raises(ValueError):
+        await policy.call(request)
+    assert request.calls == 1
+    assert not no_sleep
+
+
+@pytest.mark.asyncio
+async def test_call_exhausted(no_sleep):
+    policy = retry.Policy(attempts=2)
+    request = Responses(503, 503)
+    assert (await policy.call(request))[0] == 503
+    assert request.calls == 2
+
+    request = Responses(asyncio.TimeoutError(), asyncio.TimeoutError())
+    with pytest.raises(asyncio.TimeoutError):
+        await policy.call(request)
+    assert request.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_github_api(no_sleep):
+    statuses = [502, 200]
+    seen = []
+
+    async def labels(request):
+        seen.append(request.method)
+        status = statuses.pop(0)
+        if status != 200:
+            return aiohttp.web.json_response({"message": "Bad gateway"}, status=status)
+        return aiohttp.web.json_response({"name": "bug"}, status=201)
+
+    app = aiohttp.web.Application()
+    app.router.add_post("/labels", labels)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        url = str(server.make_url("/labels"))
+        http_client = client.Client(retry_policy=retry.Policy())
+        gh = http_client.github_api("pvscbot")
+        assert gh.retry_policy is http_client.retry_policy
+        delivery = instrument.Delivery()
+        with delivery.active():
+            assert await gh.post(url, data={"labels": ["bug"]}) == {"name": "bug"}
+        assert seen == ["POST", "POST"]
+        assert delivery.calls[None].count == 2
+        assert delivery.retries[None].count == 1
+
+        # Without a policy failures are not retried.
+        await http_client.close()
+        statuses.append(502)
+        http_client = client.Client()
+        gh = http_client.github_api("pvscbot")
+        with pytest.raises(gidgethub.GitHubBroken):
+            await gh.post(url, data={"labels": ["bug"]})
+        await http_client.close()
@@ -1,10 +1,13 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import asyncio
+
+import gidgethub
 import gidgethub.routing
 import pytest
 
-from __app__.ghutils import server
+from __app__.ghutils import dedup, instrument, journal, prefilter, ratelimit, server
 
 
 class Logger:
@@ -60,3 +63,371 @@ async def test_logging():
 
     # Setting a logger is optional.
     await server.serve(gh, router, headers, body, secret=secret, logger=None, pause=0)
+
+
+HEADERS = {
+    "content-type": "application/json",
+    "x-github-event": "pull_request",
+    "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+    "x-hub-signature": "sha1=c28e33b2e56e548956c446e890929a6cbec3ac89",
+}
+BODY = '{"action": "opened"}'.encode("UTF-8")
+SECRET = "123456"
+
+
+class FakeQueue:
+    def __init__(self):
+        self.queued = []
+        self.delays = []
+
+    async def put(self, event, *, delay=None):
+        self.queued.append(event)
+        self.delays.append(delay)
+
+
+@pytest.mark.asyncio
+async def test_acknowledge():
+    body = '{"action": "opened"}'.encode("UTF-8")
+    secret = "123456"
+    headers = {
+        "content-type": "application/json",
+        "x-github-event": "pull_request",
+        "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+        "x-hub-signature": "sha1=c28e33b2e56e548956c446e890929a6cbec3ac89",
+    }
+    queue = FakeQueue()
+    logger = Logger()
+
+    await server.acknowledge(queue, headers, body, secret=secret, logger=logger)
+    assert len(queue.queued) == 1
+    assert queue.queued[0].event == "pull_request"
+    assert queue.queued[0].data == {"action": "opened"}
+    assert headers["x-github-delivery"] in logger._logged[0]
+
+    # Setting a logger is optional.
+    await server.acknowledge(queue, headers, body, secret=secret, logger=None)
+    assert len(queue.queued) == 2
+
+
+@pytest.mark.asyncio
+async def test_acknowledge_validation():
+    body = '{"action": "opened"}'.encode("UTF-8")
+    headers = {
+        "content-type": "application/json",
+        "x-github-event": "pull_request",
+        "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+        "x-hub-signature": "sha1=c28e33b2e56e548956c446e890929a6cbec3ac89",
+    }
+    queue = FakeQueue()
+
+    with pytest.raises(gidgethub.ValidationFailure):
+        await server.acknowledge(queue, headers, body, secret="wrong")
+    assert not queue.queued
+
+
+@pytest.mark.asyncio
+async def test_deferred():
+    body = '{"action": "opened"}'.encode("UTF-8")
+    secret = "123456"
+    headers = {
+        "content-type": "application/json",
+        "x-github-event": "pull_request",
+        "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+        "x-hub-signature": "sha1=c28e33b2e56e548956c446e890929a6cbec3ac89",
+    }
+    router = gidgethub.routing.Router()
+    gh = object()
+    logger = Logger()
+    retry_queue = FakeQueue()
+
+    @router.register("pull_request", action="opened")
+    async def routed(*args, **kwargs):
+        raise ratelimit.Deferred(30)
+
+    await server.serve(
+        gh,
+        router,
+        headers,
+        body,
+        secret=secret,
+        logger=logger,
+        pause=0,
+        retry_queue=retry_queue,
+    )
+    assert retry_queue.queued[0].delivery_id == headers["x-github-delivery"]
+    assert retry_queue.delays == [30]
+    assert any("Deferring" in message for message in logger._logged)
+
+    # Logging is optional.
+    await server.serve(
+        gh, router, headers, body, secret=secret, pause=0, retry_queue=retry_queue
+    )
+    assert retry_queue.delays == [30, 30]
+
+    # Without a retry queue the exception propagates.
+    with pytest.raises(ratelimit.Deferred):
+        await server.serve(gh, router, headers, body, secret=secret, pause=0)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_delivery():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    deduplicator = dedup.MemoryDeduplicator()
+    routed = []
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, *args, **kwargs):
+        routed.append(event.delivery_id)
+
+    for _ in range(2):
+        await server.serve(
+            object(),
+            router,
+            HEADERS,
+            BODY,
+            secret=SECRET,
+            logger=logger,
+            pause=0,
+            dedup=deduplicator,
+        )
+    assert routed == [HEADERS["x-github-delivery"]]
+    assert "Dropping duplicate" in logger._logged[-1]
+    assert "1 duplicates dropped" in logger._logged[-1]
+
+    # Logging is optional.
+    await server.serve(
+        object(), router, HEADERS, BODY, secret=SECRET, pause=0, dedup=deduplicator
+    )
+    assert len(routed) == 1
+    assert deduplicator.duplicates == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_released():
+    router = gidgethub.routing.Router()
+    deduplicator = dedup.MemoryDeduplicator()
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, *args, **kwargs):
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await server.serve(
+            object(), router, HEADERS, BODY, secret=SECRET, pause=0, dedup=deduplicator
+        )
+    # A redelivery will be processed.
+    assert deduplicator.claim(HEADERS["x-github-delivery"])
+
+    # Deduplication is optional.
+    with pytest.raises(ValueError):
+        await server.serve(object(), router, HEADERS, BODY, secret=SECRET, pause=0)
+
+
+@pytest.mark.asyncio
+async def test_deferred_delivery_dedup():
+    router = gidgethub.routing.Router()
+    deduplicator = dedup.MemoryDeduplicator()
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, *args, **kwargs):
+        raise ratelimit.Deferred(10)
+
+    # Without a retry queue, GitHub needs to redeliver the event.
+    with pytest.raises(ratelimit.Deferred):
+        await server.serve(
+            object(), router, HEADERS, BODY, secret=SECRET, pause=0, dedup=deduplicator
+        )
+    assert deduplicator.claim(HEADERS["x-github-delivery"])
+    deduplicator.release(HEADERS["x-github-delivery"])
+
+    # With a retry queue any redelivery is a duplicate.
+    await server.serve(
+        object(),
+        router,
+        HEADERS,
+        BODY,
+        secret=SECRET,
+        pause=0,
+        retry_queue=FakeQueue(),
+        dedup=deduplicator,
+    )
+    assert not deduplicator.claim(HEADERS["x-github-delivery"])
+
+
+@pytest.mark.asyncio
+async def test_acknowledge_duplicate():
+    queue = FakeQueue()
+    deduplicator = dedup.MemoryDeduplicator()
+
+    for _ in range(2):
+        await server.acknowledge(
+            queue, HEADERS, BODY, secret=SECRET, dedup=deduplicator
+        )
+    assert len(queue.queued) == 1
+    assert deduplicator.duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    metrics = instrument.Metrics()
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, *args, **kwargs):
+        pass
+
+    await server.serve(
+        object(),
+        instrument.router(router),
+        HEADERS,
+        BODY,
+        secret=SECRET,
+        logger=logger,
+        pause=0,
+        metrics=metrics,
+    )
+    assert any(
+        message.startswith("Metrics for delivery ID") for message in logger._logged
+    )
+    snapshot = metrics.snapshot()
+    assert snapshot["event.pull_request.opened"]["count"] == 1
+    assert snapshot["handler.callback"]["count"] == 1
+    for stage in ("verify", "parse", "dispatch"):
+        assert snapshot[f"stage.{stage}"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_on_failure():
+    router = gidgethub.routing.Router()
+    metrics = instrument.Metrics()
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, *args, **kwargs):
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await server.serve(
+            object(), router, HEADERS, BODY, secret=SECRET, pause=0, metrics=metrics
+        )
+    assert metrics.snapshot()["event.pull_request.opened"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_prefilter():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    routed = []
+
+    @router.register("pull_request", action="closed")
+    async def callback(event, *args, **kwargs):
+        routed.append(event)
+
+    checker = prefilter.Prefilter(router)
+    # Unverified bodies are never parsed.
+    await server.serve(
+        object(),
+        router,
+        HEADERS,
+        BODY + b"garbage",
+        secret=SECRET,
+        logger=logger,
+        prefilter=checker,
+    )
+    assert not routed
+    assert logger._logged == [
+        f"Skipping delivery ID {HEADERS['x-github-delivery']}"
+        " of unhandled pull_request event (1 skipped)"
+    ]
+
+    # Logging is optional.
+    queue = FakeQueue()
+    await server.acknowledge(queue, HEADERS, BODY, secret=SECRET, prefilter=checker)
+    assert not queue.queued
+    assert checker.skipped == 2
+
+    router.add(callback, "pull_request", action="opened")
+    checker = prefilter.Prefilter(router)
+    await server.acknowledge(queue, HEADERS, BODY, secret=SECRET, prefilter=checker)
+    assert len(queue.queued) == 1
+
+
+@pytest.mark.asyncio
+async def test_gh_factory():
+    router = gidgethub.routing.Router()
+    deduplicator = dedup.MemoryDeduplicator()
+    gh = object()
+    created = []
+    routed = []
+
+    def gh_factory(event):
+        created.append(event.delivery_id)
+        return gh
+
+    @router.register("pull_request", action="opened")
+    async def callback(event, given_gh, *args, **kwargs):
+        routed.append(given_gh)
+
+    for _ in range(2):
+        await server.serve(
+            gh_factory,
+            router,
+            HEADERS,
+            BODY,
+            secret=SECRET,
+            pause=0,
+            dedup=deduplicator,
+        )
+    # Not created for the duplicate.
+    assert created == [HEADERS["x-github-delivery"]]
+    assert routed == [gh]
+
+
+@pytest.mark.asyncio
+async def test_gh_factory_before_pause(monkeypatch):
+    router = gidgethub.routing.Router()
+    calls = []
+
+    def gh_factory(event):
+        calls.append("gh")
+        return object()
+
+    async def sleep(delay):
+        calls.append("pause")
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    await server.serve(gh_factory, router, HEADERS, BODY, secret=SECRET, pause=1)
+    # Connecting to GitHub overlaps the pause.
+    assert calls == ["gh", "pause"]
+
+
+@pytest.mark.asyncio
+async def test_journal(tmp_path):
+    router = gidgethub.routing.Router()
+    record = journal.Journal(tmp_path)
+
+    @router.register("pull_request", action="opened")
+    async def routed(*args, **kwargs):
+        raise ratelimit.Deferred(30)
+
+    retry_queue = FakeQueue()
+    await server.serve(
+        object(),
+        router,
+        HEADERS,
+        BODY,
+        secret=SECRET,
+        pause=0,
+        retry_queue=retry_queue,
+        journal=record,
+    )
+    delivery_id = HEADERS["x-github-delivery"]
+    assert journal.entries(tmp_path)[delivery_id].outcome == "deferred"
+
+    # Queued events are recorded before being processed.
+    queue = FakeQueue()
+    await server.acknowledge(queue, HEADERS, BODY, secret=SECRET, journal=record)
+    record.close()
+    assert len(queue.queued) == 1
+    assert journal.entries(tmp_path)[delivery_id].outcome is None
@@ -0,0 +1,43 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+
+from __app__.ghutils import watermark
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def watermarks(request, tmp_path):
+    if request.param == "memory":
+        yield watermark.MemoryWatermarks()
+    else:
+        watermarks = watermark.SQLiteWatermarks(str(tmp_path / "watermarks.db"))
+        yield watermarks
+        watermarks.close()
+
+
+def test_advance(watermarks):
+    assert watermarks.get("a") is None
+    assert watermarks.advance("a", None, "2020-01-01T00:00:00Z")
+    assert watermarks.advance("a", "2020-01-01T00:00:00Z", "2020-01-02T00:00:00Z")
+    assert watermarks.get("a") == "2020-01-02T00:00:00Z"
+    assert watermarks.get("b") is None
+
+
+def test_overlapping_runs(watermarks):
+    # Both runs started without a watermark; only the first to finish counts.
+    assert watermarks.advance("a", None, "2020-01-02T00:00:00Z")
+    assert not watermarks.advance("a", None, "2020-01-01T00:00:00Z")
+    assert watermarks.advance("a", "2020-01-02T00:00:00Z", "2020-01-03T00:00:00Z")
+    assert not watermarks.advance("a", "2020-01-02T00:00:00Z", "2020-01-04T00:00:00Z")
+    assert watermarks.get("a") == "2020-01-03T00:00:00Z"
+
+
+def test_persisted(tmp_path):
+    path = str(tmp_path / "watermarks.db")
+    watermarks = watermark.SQLiteWatermarks(path)
+    watermarks.advance("a", None, "2020-01-01T00:00:00Z")
+    watermarks.close()
+    watermarks = watermark.SQLiteWatermarks(path)
+    assert watermarks.get("a") == "2020-01-01T00:00:00Z"
+    watermarks.close()
@@ -0,0 +1,374 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import time
+
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__.ghutils import instrument, journal, ratelimit, workqueue
+
+
+class Logger:
+    def __init__(self):
+        self._logged = []
+
+    def info(self, message):
+        self._logged.append(message)
+
+    def exception(self, message):
+        self._logged.append(message)
+
+
+def make_event(delivery_id="12345"):
+    return gidgethub.sansio.Event(
+        {"action": "opened"}, event="issues", delivery_id=delivery_id
+    )
+
+
+def new_gh(event):
+    return object()
+
+
+def test_event_serialization():
+    event = make_event()
+    loaded = workqueue.load_event(workqueue.dump_event(event))
+    assert loaded.event == event.event
+    assert loaded.delivery_id == event.delivery_id
+    assert loaded.data == event.data
+
+
+@pytest.mark.asyncio
+async def test_memory_store():
+    store = workqueue.MemoryStore()
+    event = make_event()
+    await store.put(42, event)
+    assert await store.get() == (42, event)
+
+    # Events are handed out once due, earliest first.
+    later = time.time() + 60
+    await store.put(later, make_event("later"))
+    await store.put(43, make_event("1"))
+    await store.put(42, make_event("0"))
+    assert [(await store.get())[1].delivery_id for _ in range(2)] == ["0", "1"]
+    getter = asyncio.ensure_future(store.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    await store.put(44, make_event("2"))
+    assert (await getter)[1].delivery_id == "2"
+
+    # Waits for the earliest event to be due.
+    await store.put(time.time() + 0.01, make_event("soon"))
+    assert (await store.get())[1].delivery_id == "soon"
+    assert len(store._heap) == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store(tmp_path):
+    path = tmp_path / "queue.db"
+    store = workqueue.SQLiteStore(str(path), poll_interval=0)
+    await store.put(42, make_event("1"))
+    store.close()
+
+    # Events survive reopening the database.
+    store = workqueue.SQLiteStore(str(path), poll_interval=0)
+    getter = asyncio.ensure_future(store.get())
+    due, event = await getter
+    assert due == 42
+    assert event.delivery_id == "1"
+
+    # Waits for an event to be queued.
+    getter = asyncio.ensure_future(store.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    await store.put(43, make_event("2"))
+    due, event = await getter
+    assert due == 43
+    assert event.delivery_id == "2"
+
+    # Events are handed out once due, earliest first.
+    await store.put(time.time() + 0.01, make_event("soon"))
+    await store.put(45, make_event("4"))
+    await store.put(44, make_event("3"))
+    handed_out = [(await store.get())[1].delivery_id for _ in range(3)]
+    assert handed_out == ["3", "4", "soon"]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_take(tmp_path):
+    store = workqueue.SQLiteStore(str(tmp_path / "queue.db"))
+    for delivery_id in range(3):
+        await store.put(0, make_event(str(delivery_id)))
+    # Not due yet.
+    await store.put(time.time() + 60, make_event("later"))
+    assert len(store) == 4
+
+    taken = store.take(2)
+    assert [event.delivery_id for _, event in taken] == ["0", "1"]
+    assert [event.delivery_id for _, event in store.take(5)] == ["2"]
+    assert store.take(5) == []
+    assert len(store) == 1
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_dispatching():
+    router = gidgethub.routing.Router()
+    gh = object()
+    logger = Logger()
+    seen = []
+
+    @router.register("issues", action="opened")
+    async def routed(event, given_gh, **kwargs):
+        seen.append((event.delivery_id, given_gh, kwargs["logger"]))
+
+    queue = workqueue.WorkQueue(
+        router, lambda event: gh, workers=2, delay=0, logger=logger
+    )
+    queue.start()
+    queue.start()  # Idempotent.
+    await queue.put(make_event("1"))
+    await queue.put(make_event("2"))
+    await queue.join()
+    await queue.close()
+
+    assert sorted(seen) == [("1", gh, logger), ("2", gh, logger)]
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    metrics = instrument.Metrics()
+
+    @router.register("issues", action="opened")
+    async def routed(*args, **kwargs):
+        pass
+
+    queue = workqueue.WorkQueue(router, new_gh, delay=0, logger=logger, metrics=metrics)
+    queue.start()
+    await queue.put(make_event("1"))
+    await queue.join()
+    await queue.close()
+
+    assert metrics.snapshot()["event.issues.opened"]["count"] == 1
+    assert logger._logged[0].startswith("Metrics for delivery ID 1:")
+
+
+@pytest.mark.asyncio
+async def test_consistency_delay():
+    router = gidgethub.routing.Router()
+    seen = []
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        seen.append(event.delivery_id)
+
+    queue = workqueue.WorkQueue(router, new_gh, workers=1, delay=60)
+    queue.start()
+    await queue.put(make_event("later"))
+    await queue.put(make_event("soon"), delay=0.01)
+    await queue.put(make_event("now"), delay=0)
+    while len(seen) < 2:
+        await asyncio.sleep(0.01)
+    await queue.close()
+
+    assert seen == ["now", "soon"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("in_database", [False, True])
+async def test_ready_overtakes_deferred(tmp_path, in_database):
+    router = gidgethub.routing.Router()
+    seen = []
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        if event.delivery_id == "deferred":
+            raise ratelimit.Deferred(30)
+        seen.append(event.delivery_id)
+
+    if in_database:
+        store = workqueue.SQLiteStore(str(tmp_path / "queue.db"), poll_interval=0)
+    else:
+        store = workqueue.MemoryStore()
+    queue = workqueue.WorkQueue(router, new_gh, store=store, workers=1, delay=0)
+    queue.start()
+    await queue.put(make_event("deferred"))
+    await queue.put(make_event("ready"))
+    # The deferred event doesn't keep the only worker busy for 30 seconds.
+    started = time.monotonic()
+    while not seen:
+        await asyncio.sleep(0.01)
+    assert time.monotonic() - started < 5
+    assert queue._unfinished == 1
+    await queue.close()
+    assert seen == ["ready"]
+
+
+@pytest.mark.asyncio
+async def test_failure_logged():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+
+    @router.register("issues", action="opened")
+    async def routed(*args, **kwargs):
+        raise ValueError
+
+    queue = workqueue.WorkQueue(router, new_gh, delay=0, logger=logger)
+    queue.start()
+    await queue.put(make_event("1"))
+    await queue.join()
+
+    # Logging is optional.
+    queue._logger = None
+    await queue.put(make_event("2"))
+    await queue.join()
+    await queue.close()
+
+    assert logger._logged == ["Failed to process delivery 1"]
+    assert queue.failed == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("queued", [1, 2])
+async def test_close_while_processing(queued):
+    router = gidgethub.routing.Router()
+    started = asyncio.Event()
+
+    @router.register("issues", action="opened")
+    async def routed(*args, **kwargs):
+        started.set()
+        await asyncio.Event().wait()
+
+    queue = workqueue.WorkQueue(router, new_gh, workers=1, delay=0)
+    queue.start()
+    for delivery_id in range(queued):
+        await queue.put(make_event(str(delivery_id)))
+    await started.wait()
+    await queue.close()
+    assert not queue._workers
+    assert queue._unfinished == queued - 1
+
+
+@pytest.mark.asyncio
+async def test_leftover_events(tmp_path):
+    path = str(tmp_path / "queue.db")
+    store = workqueue.SQLiteStore(path, poll_interval=0)
+    await store.put(0, make_event())
+    router = gidgethub.routing.Router()
+    seen = []
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        seen.append(event.delivery_id)
+
+    queue = workqueue.WorkQueue(router, new_gh, store=store, workers=1)
+    queue.start()
+    while not seen:
+        await asyncio.sleep(0)
+    await queue.close()
+    store.close()
+    assert queue._unfinished == 0
+
+
+@pytest.mark.asyncio
+async def test_deferred_requeued():
+    router = gidgethub.routing.Router()
+    logger = Logger()
+    attempts = []
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        attempts.append(event.delivery_id)
+        if len(attempts) < 3:
+            raise ratelimit.Deferred(0)
+
+    queue = workqueue.WorkQueue(router, new_gh, workers=1, delay=0, logger=logger)
+    queue.start()
+    await queue.put(make_event("1"))
+    await queue.join()
+
+    queue._logger = None
+    attempts.clear()
+    await queue.put(make_event("2"))
+    await queue.join()
+    await queue.close()
+
+    assert attempts == ["2", "2", "2"]
+    assert logger._logged == ["Deferring delivery 1 for 0.0 seconds"] * 2
+
+
+@pytest.mark.asyncio
+async def test_journal(tmp_path):
+    router = gidgethub.routing.Router()
+    record = journal.Journal(tmp_path)
+
+    @router.register("issues", action="opened")
+    async def routed(event, *args, **kwargs):
+        if event.delivery_id == "2":
+            raise ValueError
+
+    queue = workqueue.WorkQueue(router, new_gh, workers=1, delay=0, journal=record)
+    queue.start()
+    for delivery_id in ("1", "2"):
+        # As when acknowledged.
+        event = make_event(delivery_id)
+        record.record(event)
+        await queue.put(event)
+    await queue.join()
+    await queue.close()
+    record.close()
+
+    entries = journal.entries(tmp_path)
+    assert {key: entry.outcome for key, entry in entries.items()} == {
+        "1": "ok",
+        "2": "error",
+    }
+    # Payloads are only written once.
+    starts = [entry for entry in journal.read(tmp_path) if entry["type"] == "start"]
+    assert len(starts) == 2
+
+
+def subject(event):
+    return event.data.get("issue")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("in_database", [False, True])
+async def test_subject_kept_in_order(tmp_path, in_database):
+    router = gidgethub.routing.Router()
+    deferrals = {"A"}
+    seen = []
+
+    @router.register("issues")
+    async def routed(event, *args, **kwargs):
+        if event.delivery_id in deferrals:
+            deferrals.remove(event.delivery_id)
+            raise ratelimit.Deferred(0.05)
+        seen.append(event.delivery_id)
+
+    if in_database:
+        store = workqueue.SQLiteStore(str(tmp_path / "queue.db"), poll_interval=0)
+    else:
+        store = workqueue.MemoryStore()
+    queue = workqueue.WorkQueue(
+        router, new_gh, store=store, workers=1, delay=0, key=subject
+    )
+    queue.start()
+    for delivery_id, issue in [("A", 1), ("B", 1), ("C", 2), ("D", None)]:
+        event = gidgethub.sansio.Event(
+            {"action": "labeled", "issue": issue},
+            event="issues",
+            delivery_id=delivery_id,
+        )
+        await queue.put(event)
+    await queue.join()
+    await queue.close()
+
+    # B waits for the deferred A; other subjects don't.
+    assert seen == ["C", "D", "A", "B"]
+    assert not queue._held
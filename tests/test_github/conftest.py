@@ -0,0 +1,15 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import pytest
+
+from __app__.github import labelcache
+
+
+@pytest.fixture(autouse=True)
+def clear_label_cache():
+    """Keep what one test learns about an issue's labels from leaking into another."""
+    labelcache.LABELS.clear()
+    yield
+    labelcache.LABELS.clear()
+    labelcache.LABELS.max_age = labelcache.DEFAULT_MAX_AGE
@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Fakes of GitHub for the command line tools which change issues' labels."""
+
+import gidgethub.sansio
+
+from __app__.ghutils import ratelimit
+
+
+REPO = "Microsoft/vscode-python"
+ISSUES_URL = f"https://api.github.com/repos/{REPO}/issues"
+
+
+def make_issue(number, state, *label_names, updated_at=None, pull_request=False):
+    issue = {
+        "number": number,
+        "state": state,
+        "updated_at": updated_at,
+        "labels": [{"name": name} for name in label_names],
+        "labels_url": f"{ISSUES_URL}/{number}/labels{{/name}}",
+    }
+    if pull_request:
+        issue["pull_request"] = {}
+    return issue
+
+
+class FakeGH:
+    def __init__(self, issues, *, deferrals=0):
+        self.issues = issues
+        self.deferrals = deferrals
+        self.getiter_ = []
+        self.post_ = []
+        self.delete_ = []
+
+    async def getiter(self, url, url_vars={}):
+        self.getiter_.append(gidgethub.sansio.format_url(url, url_vars))
+        for issue in self.issues:
+            yield issue
+
+    async def post(self, url, url_vars={}, *, data):
+        if self.deferrals:
+            self.deferrals -= 1
+            raise ratelimit.Deferred(30)
+        self.post_.append((gidgethub.sansio.format_url(url, url_vars), data))
+
+    async def delete(self, url, url_vars={}):
+        self.delete_.append(gidgethub.sansio.format_url(url, url_vars))
+
+
+class FakeClient:
+
+    """Stand in for client.Client, serving an issue which needs 'classify'."""
+
+    instances = []
+
+    def __init__(self, *, scheduler_factory):
+        self.scheduler = scheduler_factory()
+        self.gh = FakeGH([make_issue(1, "open", updated_at="2020-01-01T10:00:00Z")])
+        self.closed = False
+        self.instances.append(self)
+
+    def github_api(self, requester, *, oauth_token=None):
+        self.gh.requester = requester
+        self.gh.oauth_token = oauth_token
+        return self.gh
+
+    async def close(self):
+        self.closed = True
@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import io
+import runpy
+import sys
+
+import pytest
+
+from __app__ import github as github_main
+from __app__.ghutils import client
+from __app__.github import backfill, labels, reconcile
+
+from .fakes import ISSUES_URL, FakeClient, FakeGH, make_issue
+
+
+ISSUES = [
+    # Needs 'classify'.
+    make_issue(1, "open"),
+    # Already classified.
+    make_issue(2, "open", labels.Status.needs_PR.value),
+    # Has 'classify' despite being classified.
+    make_issue(3, "open", labels.Status.classify.value, labels.Status.needs_PR.value),
+    # Closed with a status label.
+    make_issue(4, "closed", "bug", labels.Status.needs_PR.value),
+    make_issue(5, "open", pull_request=True),
+]
+
+
+@pytest.mark.asyncio
+async def test_plan():
+    gh = FakeGH(ISSUES)
+    changes = [change async for change in backfill.plan(gh, "Microsoft/vscode-python")]
+    assert gh.getiter_ == [
+        "https://api.github.com/repos/Microsoft/vscode-python/issues"
+        "?state=open&per_page=100"
+    ]
+    assert [change.issue["number"] for change in changes] == [1, 3, 4]
+    assert [str(change) for change in changes] == [
+        "#1: +classify",
+        "#3: -classify",
+        "#4: -needs PR",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dry_run():
+    gh = FakeGH(ISSUES)
+    out = io.StringIO()
+    changes = await backfill.backfill(
+        gh, "Microsoft/vscode-python", state="all", dry_run=True, out=out
+    )
+    assert len(changes) == 3
+    assert out.getvalue().splitlines() == [str(change) for change in changes]
+    assert "state=all" in gh.getiter_[0]
+    assert not gh.post_
+    assert not gh.delete_
+
+
+@pytest.mark.asyncio
+async def test_backfill(monkeypatch):
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    gh = FakeGH(ISSUES, deferrals=1)
+    changes = await backfill.backfill(gh, "Microsoft/vscode-python", limit=1)
+    assert len(changes) == 3
+    # Rate limits are waited out.
+    assert slept == [30]
+    assert gh.post_ == [(f"{ISSUES_URL}/1/labels", {"labels": ["classify"]})]
+    assert sorted(gh.delete_) == [
+        f"{ISSUES_URL}/3/labels/classify",
+        f"{ISSUES_URL}/4/labels/needs%20PR",
+    ]
+
+
+@pytest.mark.parametrize("dry_run", [True, False])
+def test_main(monkeypatch, capsys, dry_run):
+    monkeypatch.setattr(client, "Client", FakeClient)
+    monkeypatch.setattr(FakeClient, "instances", [])
+    monkeypatch.setenv("GH_AUTH", "token")
+    argv = ["Microsoft/vscode-python"] + (["--dry-run"] if dry_run else [])
+
+    backfill.main(argv)
+
+    http_client = FakeClient.instances[0]
+    assert http_client.closed
+    assert http_client.scheduler.max_delay == float("inf")
+    assert http_client.gh.requester == github_main.REQUESTER
+    assert http_client.gh.oauth_token == "token"
+    assert bool(http_client.gh.post_) is not dry_run
+    out, err = capsys.readouterr()
+    assert out == "#1: +classify\n"
+    assert err == ("1 issues need changes\n" if dry_run else "1 issues changed\n")
+
+
+def test_main_graphql(monkeypatch, capsys):
+    monkeypatch.setattr(client, "Client", FakeClient)
+    monkeypatch.setattr(reconcile, "BACKEND", reconcile.BACKEND)
+    backfill.main(["Microsoft/vscode-python", "--dry-run", "--graphql"])
+    assert isinstance(reconcile.BACKEND, reconcile.GraphQLLabels)
+    assert capsys.readouterr().out == "#1: +classify\n"
+
+
+def test_run_as_module(monkeypatch, capsys):
+    monkeypatch.setattr(client, "Client", FakeClient)
+    monkeypatch.setattr(sys, "argv", ["backfill", "Microsoft/vscode-python"])
+    monkeypatch.delitem(sys.modules, "__app__.github.backfill")
+    runpy.run_module("__app__.github.backfill", run_name="__main__")
+    assert capsys.readouterr().out == "#1: +classify\n"
@@ -10,7 +10,7 @@ import importlib_resources
 import pytest
 
 from . import samples
-from __app__.github import classify, labels
+from __app__.github import classify, labelcache, labels
 
 
 def read_sample_data(filename):
@@ -115,6 +115,52 @@ async def test_new_issue_gains_no_status_label_while_processing():
     assert action[1] == {"labels": [labels.Status.classify.value]}
 
 
+@pytest.mark.asyncio
+async def test_new_issue_trusts_fresh_labels():
+    sample_data = read_sample_data("issues-opened.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="12345")
+    labels_url = sample_data["issue"]["labels_url"]
+    labelcache.LABELS.record(labels_url, [])
+    gh = FakeGH()
+
+    await classify.router.dispatch(event, gh)
+    assert not gh.getiter_request
+    assert gh.post_ == [
+        (
+            gidgethub.sansio.format_url(labels_url, {}),
+            {"labels": [labels.Status.classify.value]},
+        )
+    ]
+    assert labelcache.LABELS.get(labels_url) == {labels.Status.classify.value}
+
+
+@pytest.mark.asyncio
+async def test_new_issue_known_to_have_status_label():
+    sample_data = read_sample_data("issues-opened.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="12345")
+    labelcache.LABELS.record(sample_data["issue"]["labels_url"], ["needs PR"])
+    gh = FakeGH()
+
+    await classify.router.dispatch(event, gh)
+    assert not gh.getiter_request
+    assert not gh.post_
+
+
+@pytest.mark.asyncio
+async def test_new_issue_labels_fetched_when_stale():
+    sample_data = read_sample_data("issues-opened.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="12345")
+    labels_url = sample_data["issue"]["labels_url"]
+    labelcache.LABELS.record(labels_url, [])
+    labelcache.LABELS.max_age = -1
+    gh = FakeGH()
+    gh.getiter_response = [{"name": "needs PR"}]
+
+    await classify.router.dispatch(event, gh)
+    assert len(gh.getiter_request) == 1
+    assert not gh.post_
+
+
 @pytest.mark.asyncio
 async def test_adding_classify():
     sample_data = read_sample_data("issues-labeled-classify.json")
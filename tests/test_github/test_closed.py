@@ -14,11 +14,19 @@ from __app__.github import closed
 class FakeGH:
     def __init__(self):
         self.called = []
+        self.put_ = []
+        self.labels = set()
 
     async def delete(self, url, url_vars):
+        self.labels.discard(url_vars["name"])
         url = gidgethub.sansio.format_url(url, url_vars)
         self.called.append(url)
 
+    async def put(self, url, url_vars={}, *, data):
+        self.labels = set(data["labels"])
+        url = gidgethub.sansio.format_url(url, url_vars)
+        self.put_.append((url, data))
+
 
 @pytest.mark.asyncio
 async def test_status_label_removal():
@@ -34,3 +42,28 @@ async def test_status_label_removal():
         "https://api.github.com/repos/Microsoft/vscode-python/issues/3453/labels{/name}",
         {"name": "needs spec"},
     )
+
+
+@pytest.mark.asyncio
+async def test_multiple_status_labels_removed():
+    sample_data = json.loads(
+        importlib_resources.read_text(samples, "issues-closed.json")
+    )
+    sample_data["issue"]["labels"].extend(
+        [{"name": "triage"}, {"name": "needs PR"}, {"name": "classify"}]
+    )
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="12345")
+    gh = FakeGH()
+    labels_url = sample_data["issue"]["labels_url"]
+    gh.labels = {label["name"] for label in sample_data["issue"]["labels"]}
+    # Added after the payload was built.
+    gh.labels.add("important")
+
+    await closed.router.dispatch(event, gh)
+    assert not gh.put_
+    assert sorted(gh.called) == sorted(
+        gidgethub.sansio.format_url(labels_url, {"name": name})
+        for name in ["needs spec", "triage", "needs PR", "classify"]
+    )
+    assert "important" in gh.labels
+    assert not gh.labels & {"needs spec", "triage", "needs PR", "classify"}
@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import runpy
+import sys
+
+import gidgethub.sansio
+import pytest
+
+from __app__ import github as github_main
+from __app__.ghutils import workqueue
+from __app__.github import drain
+
+
+def make_event(delivery_id):
+    return gidgethub.sansio.Event(
+        {"action": "opened"}, event="issues", delivery_id=delivery_id
+    )
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def queued(tmp_path, monkeypatch, event_loop):
+    path = str(tmp_path / "queue.db")
+    store = workqueue.SQLiteStore(path)
+    for delivery_id in range(5):
+        event_loop.run_until_complete(store.put(0, make_event(str(delivery_id))))
+    store.close()
+
+    batches = []
+    deferrals = {"3": 1}
+
+    async def process_batch(events):
+        # Handling events connects to GitHub, creating the client.
+        github_main.CLIENT = http_client
+        batches.append([event.delivery_id for event in events])
+        deferred = []
+        for event in events:
+            if deferrals.get(event.delivery_id):
+                deferrals[event.delivery_id] -= 1
+                deferred.append((event, 0))
+        return deferred
+
+    http_client = FakeClient()
+    monkeypatch.setattr(github_main, "process_batch", process_batch)
+    monkeypatch.setattr(github_main, "CLIENT", None)
+    return path, batches, http_client
+
+
+def test_main(queued, capsys):
+    path, batches, http_client = queued
+    drain.main([path, "--size", "2"])
+    # The deferred event is handled again once due.
+    assert batches == [["0", "1"], ["2", "3"], ["4", "3"]]
+    assert http_client.closed
+    assert capsys.readouterr().err == "6 events handled\n"
+
+
+def test_main_empty(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(github_main, "CLIENT", None)
+    drain.main([str(tmp_path / "queue.db")])
+    # No client is created just to close it.
+    assert github_main.CLIENT is None
+    assert capsys.readouterr().err == "0 events handled\n"
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_deferred(tmp_path, monkeypatch):
+    store = workqueue.SQLiteStore(str(tmp_path / "queue.db"))
+    await store.put(0, make_event("1"))
+    handled = []
+
+    async def process_batch(events):
+        handled.extend(event.delivery_id for event in events)
+        return [(event, 0.01) for event in events if len(handled) == 1]
+
+    monkeypatch.setattr(github_main, "process_batch", process_batch)
+    assert await drain.drain(store, poll_interval=0.01) == 2
+    assert handled == ["1", "1"]
+    store.close()
+
+
+def test_run_as_module(queued, monkeypatch, capsys):
+    path, batches, _ = queued
+    monkeypatch.setattr(sys, "argv", ["drain", path])
+    monkeypatch.delitem(sys.modules, "__app__.github.drain")
+    runpy.run_module("__app__.github.drain", run_name="__main__")
+    assert batches[0] == ["0", "1", "2", "3", "4"]
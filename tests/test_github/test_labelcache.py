@@ -0,0 +1,105 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import time
+
+import gidgethub.sansio
+import importlib_resources
+import pytest
+
+from . import samples
+from __app__.github import labelcache
+
+
+LABELS_URL = (
+    "https://api.github.com/repos/Microsoft/vscode-python/issues/3327/labels{/name}"
+)
+
+
+def read_sample_data(filename):
+    return json.loads(importlib_resources.read_text(samples, filename))
+
+
+def test_unknown():
+    cache = labelcache.LabelCache()
+    assert cache.get(LABELS_URL) is None
+
+
+def test_record():
+    cache = labelcache.LabelCache()
+    cache.record(LABELS_URL, ["bug", "triage"])
+    assert cache.get(LABELS_URL) == {"bug", "triage"}
+    cache.invalidate(LABELS_URL)
+    assert cache.get(LABELS_URL) is None
+    cache.invalidate(LABELS_URL)  # Idempotent.
+
+
+def test_stale(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache = labelcache.LabelCache(max_age=10)
+    cache.record(LABELS_URL, ["bug"])
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get(LABELS_URL) == {"bug"}
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get(LABELS_URL) is None
+
+
+def test_out_of_order_payloads():
+    cache = labelcache.LabelCache()
+    cache.record(LABELS_URL, ["bug"], updated_at="2018-12-19T21:56:50Z")
+    cache.record(LABELS_URL, ["triage"], updated_at="2018-12-19T21:56:49Z")
+    assert cache.get(LABELS_URL) == {"bug"}
+    cache.record(LABELS_URL, ["needs PR"], updated_at="2018-12-19T21:56:50Z")
+    assert cache.get(LABELS_URL) == {"needs PR"}
+    # The bot's own changes are newer than the payload that triggered them.
+    cache.record(LABELS_URL, ["meta"])
+    cache.record(LABELS_URL, ["triage"], updated_at="2018-12-19T21:56:49Z")
+    assert cache.get(LABELS_URL) == {"meta"}
+
+
+def test_maxsize():
+    cache = labelcache.LabelCache(maxsize=2)
+    cache.record("A", ["bug"])
+    cache.record("B", ["bug"])
+    cache.get("A")
+    cache.record("C", ["bug"])
+    assert cache.get("A") == {"bug"}
+    assert cache.get("B") is None
+    assert cache.get("C") == {"bug"}
+    cache.clear()
+    assert cache.get("A") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        (
+            "issues-opened_with_labels.json",
+            {"P2", "feature-*", "needs spec", "type-code health"},
+        ),
+        (
+            "issues-labeled-has_classify_adding_triage.json",
+            {"classify", "external contributor", "triage"},
+        ),
+        ("issues-unlabeled-no_status.json", set()),
+    ],
+)
+async def test_payload_recorded(filename, expected):
+    sample_data = read_sample_data(filename)
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+
+    await labelcache.router.dispatch(event, object())
+    assert labelcache.LABELS.get(sample_data["issue"]["labels_url"]) == expected
+
+
+@pytest.mark.asyncio
+async def test_other_actions_ignored():
+    sample_data = read_sample_data("issues-opened_with_labels.json")
+    sample_data["action"] = "edited"
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+
+    await labelcache.router.dispatch(event, object())
+    assert labelcache.LABELS.get(sample_data["issue"]["labels_url"]) is None
@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import importlib
+import json
+
+import pytest
+
+from __app__.github import labelrules, labels, reconcile
+
+
+def test_defaults():
+    rules = labelrules.load()
+    assert rules.classify == labels.Status.classify.value
+    assert rules.status == labels.STATUS_LABELS
+    assert rules.classification == labels.CLASSIFICATION_LABELS
+    assert rules.team == {labels.Team.data_science.value}
+    assert rules.classifying == (
+        labels.STATUS_LABELS
+        | labels.CLASSIFICATION_LABELS
+        | {labels.Team.data_science.value}
+    )
+    assert isinstance(rules.classifying, frozenset)
+
+
+def test_overrides(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"status": ["triage"], "team": ["xteam"]}))
+    rules = labelrules.load(str(path))
+    # 'classify' is always a status label.
+    assert rules.status == {"triage", "classify"}
+    assert rules.classification == labels.CLASSIFICATION_LABELS
+    assert rules.classifying == {"triage", "classify", "xteam"} | rules.classification
+
+
+def test_unknown_category(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"status": [], "priority": [], "area": []}))
+    with pytest.raises(ValueError, match="area, priority"):
+        labelrules.load(str(path))
+
+
+def test_environment(monkeypatch, tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"classify": "unsorted"}))
+    monkeypatch.setenv("GH_LABEL_RULES", str(path))
+    try:
+        importlib.reload(labelrules)
+        assert labelrules.REGISTRY.classify == "unsorted"
+    finally:
+        monkeypatch.delenv("GH_LABEL_RULES")
+        importlib.reload(labelrules)
+    assert labelrules.REGISTRY.classify == labels.Status.classify.value
+
+
+def test_active():
+    rules = labelrules.build({"classify": "unsorted"})
+    assert labelrules.current() is labelrules.REGISTRY
+    with labelrules.active(rules):
+        assert labelrules.current() is rules
+        assert reconcile.target_labels("open", set()) == {"unsorted"}
+    assert labelrules.current() is labelrules.REGISTRY
+
+
+def test_rules_follow_registry(monkeypatch):
+    rules = labelrules.LabelRules(
+        status={"triage"}, classification=set(), team={"xteam"}, classify="unsorted"
+    )
+    monkeypatch.setattr(labelrules, "REGISTRY", rules)
+    assert reconcile.target_labels("open", {"bug"}) == {"bug", "unsorted"}
+    assert reconcile.target_labels("open", {"unsorted", "xteam"}) == {"xteam"}
+    assert reconcile.target_labels("closed", {"triage", "needs PR"}) == {"needs PR"}
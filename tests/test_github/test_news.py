@@ -0,0 +1,127 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+
+import gidgethub.sansio
+import importlib_resources
+import pytest
+
+from . import samples
+from __app__.github import news
+
+
+STATUSES_URL = (
+    "https://api.github.com/repos/Microsoft/vscode-python/statuses/"
+    "f1013549456d13eb15dab4fffaa6cfe172b4244e"
+)
+FILES_URL = (
+    "https://api.github.com/repos/Microsoft/vscode-python/pulls/3690/files"
+    "?per_page=100"
+)
+
+
+def read_sample_data(filename):
+    return json.loads(importlib_resources.read_text(samples, filename))
+
+
+class FakeGH:
+    def __init__(self, files=()):
+        self.files = files
+        self.listed = 0
+        self.getiter_ = []
+        self.post_ = []
+
+    async def getiter(self, url, url_vars={}):
+        self.getiter_.append(gidgethub.sansio.format_url(url, url_vars))
+        for changed in self.files:
+            self.listed += 1
+            yield changed
+
+    async def post(self, url, url_vars={}, *, data):
+        self.post_.append((gidgethub.sansio.format_url(url, url_vars), data))
+
+
+def make_event(filename, *, action=None, label_names=None):
+    data = read_sample_data(filename)
+    if action is not None:
+        data["action"] = action
+    if label_names is not None:
+        data["pull_request"]["labels"] = [{"name": name} for name in label_names]
+    return gidgethub.sansio.Event(data, event="pull_request", delivery_id="12345")
+
+
+def status(gh):
+    assert len(gh.post_) == 1
+    url, data = gh.post_[0]
+    assert url == STATUSES_URL
+    assert data["context"] == news.STATUS_CONTEXT
+    return data["state"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "filename",
+    ["pull_request-labeled-skip_news.json", "pull_request-reopened-skip_news.json"],
+)
+async def test_skip_news(filename):
+    gh = FakeGH(read_sample_data("pull_request-files.json"))
+    await news.router.dispatch(make_event(filename), gh)
+    assert status(gh) == "success"
+    # The label is enough.
+    assert not gh.getiter_
+
+
+@pytest.mark.asyncio
+async def test_news_entry():
+    gh = FakeGH(read_sample_data("pull_request-files.json"))
+    await news.router.dispatch(make_event("pull_request-unlabeled-skip_news.json"), gh)
+    assert gh.getiter_ == [FILES_URL]
+    assert status(gh) == "success"
+    # Listing stopped at the news entry.
+    assert gh.listed == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action", ["opened", "synchronize", "unlabeled"])
+async def test_no_news_entry(action):
+    files = [
+        changed
+        for changed in read_sample_data("pull_request-files.json")
+        if not changed["filename"].startswith("news/")
+    ]
+    # Deleting a news entry doesn't count.
+    files.append({"filename": "news/1 Enhancements/1.md", "status": "removed"})
+    # Nor does a file outside of a category.
+    files.append({"filename": "news/README.md", "status": "modified"})
+    gh = FakeGH(files)
+    event = make_event(
+        "pull_request-unlabeled-skip_news.json", action=action, label_names=["P2"]
+    )
+    await news.router.dispatch(event, gh)
+    assert status(gh) == "failure"
+    assert gh.listed == len(files)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action", ["labeled", "unlabeled"])
+async def test_other_labels(action):
+    event = make_event("pull_request-labeled-skip_news.json", action=action)
+    event.data["label"] = {"name": "P2"}
+    gh = FakeGH()
+    await news.router.dispatch(event, gh)
+    assert not gh.getiter_
+    assert not gh.post_
+
+
+@pytest.mark.asyncio
+async def test_large_pull_request():
+    files = [
+        {"filename": f"src/file{index}.ts", "status": "modified"}
+        for index in range(500)
+    ]
+    files.insert(150, {"filename": "news/2 Fixes/3690.md", "status": "added"})
+    gh = FakeGH(files)
+    await news.router.dispatch(make_event("pull_request-unlabeled-skip_news.json"), gh)
+    assert status(gh) == "success"
+    assert gh.listed == 151
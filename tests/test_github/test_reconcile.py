@@ -0,0 +1,423 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import http
+import json
+import re
+
+import aiohttp.test_utils
+import aiohttp.web
+import gidgethub
+import gidgethub.sansio
+import importlib_resources
+import pytest
+
+from . import samples
+from __app__.ghutils import client, graphql
+from __app__.github import labelcache, labels, reconcile
+
+
+def read_sample_data(filename):
+    return json.loads(importlib_resources.read_text(samples, filename))
+
+
+def label_names(*names):
+    return [{"name": name} for name in names]
+
+
+ISSUE_URL = "https://api.github.com/repos/Microsoft/vscode-python/issues/3327"
+LABELS_URL = ISSUE_URL + "/labels{/name}"
+ISSUE = {"labels_url": LABELS_URL}
+
+
+class FakeGH:
+    def __init__(self, issue):
+        self.issue = issue
+        self.getitem_ = []
+        self.put_ = []
+        self.post_ = []
+        self.delete_ = []
+
+    async def getitem(self, url, url_vars={}):
+        self.getitem_.append(gidgethub.sansio.format_url(url, url_vars))
+        return self.issue
+
+    async def put(self, url, url_vars={}, *, data):
+        self.put_.append((gidgethub.sansio.format_url(url, url_vars), data))
+
+    async def post(self, url, url_vars={}, *, data):
+        self.post_.append((gidgethub.sansio.format_url(url, url_vars), data))
+
+    async def delete(self, url, url_vars={}):
+        self.delete_.append(gidgethub.sansio.format_url(url, url_vars))
+
+
+@pytest.mark.parametrize(
+    "filename,action",
+    [
+        ("issues-opened.json", "opened"),
+        ("issues-reopened-no_labels.json", "reopened"),
+        ("issues-labeled-classify.json", "labeled"),
+        ("issues-unlabeled-no_status.json", "unlabeled"),
+        ("issues-closed.json", "closed"),
+    ],
+)
+def test_issue_key(filename, action):
+    sample_data = read_sample_data(filename)
+    assert sample_data["action"] == action
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+    assert reconcile.issue_key(event) == (
+        sample_data["repository"]["full_name"],
+        sample_data["issue"]["number"],
+    )
+
+
+def test_issue_key_not_coalesced():
+    event = gidgethub.sansio.Event(
+        {"action": "edited"}, event="issues", delivery_id="1"
+    )
+    assert reconcile.issue_key(event) is None
+    sample_data = read_sample_data("pull_request-labeled-skip_news.json")
+    event = gidgethub.sansio.Event(sample_data, event="pull_request", delivery_id="1")
+    assert reconcile.issue_key(event) is None
+
+
+def test_subject_key():
+    for filename, event_type in [
+        ("issues-opened.json", "issues"),
+        ("pull_request-labeled-skip_news.json", "pull_request"),
+    ]:
+        sample_data = read_sample_data(filename)
+        event = gidgethub.sansio.Event(sample_data, event=event_type, delivery_id="1")
+        subject = sample_data.get("issue") or sample_data["pull_request"]
+        assert reconcile.subject_key(event) == (
+            "Microsoft/vscode-python",
+            subject["number"],
+        )
+    for data in [{"zen": "Design for failure."}, {"issue": {"number": 1}}]:
+        event = gidgethub.sansio.Event(data, event="ping", delivery_id="1")
+        assert reconcile.subject_key(event) is None
+
+
+@pytest.mark.parametrize(
+    "labels_to_check,expected",
+    [
+        (set(), False),
+        ({"bug"}, False),
+        ({"classify"}, True),
+        ({"bug", "needs PR"}, True),
+        ({"Epic"}, True),
+        ({"data science"}, True),
+        ({"xteam"}, False),
+    ],
+)
+def test_classify_unneeded(labels_to_check, expected):
+    assert reconcile.classify_unneeded(labels_to_check) == expected
+
+
+@pytest.mark.parametrize(
+    "state,current,expected",
+    [
+        ("open", set(), {"classify"}),
+        ("open", {"bug"}, {"bug", "classify"}),
+        ("open", {"classify"}, {"classify"}),
+        ("open", {"classify", "needs PR"}, {"needs PR"}),
+        ("open", {"classify", "data science"}, {"data science"}),
+        ("open", {"meta"}, {"meta"}),
+        ("closed", {"classify", "bug"}, {"bug"}),
+        ("closed", {"needs spec", "triage", "meta"}, {"meta"}),
+        ("closed", {"bug"}, {"bug"}),
+    ],
+)
+def test_target_labels(state, current, expected):
+    assert reconcile.target_labels(state, current) == expected
+
+
+def test_target_labels_custom_rules():
+    def add_bug(state, current):
+        return current | {"bug"}
+
+    assert reconcile.target_labels("open", set(), [add_bug]) == {"bug"}
+    assert reconcile.target_labels("closed", {"triage"}, [add_bug]) == {
+        "triage",
+        "bug",
+    }
+
+
+@pytest.mark.asyncio
+async def test_apply_no_changes():
+    gh = FakeGH(None)
+    await reconcile.apply_labels(gh, ISSUE, {"bug"}, {"bug"}, replace=True)
+    assert not gh.put_
+    assert not gh.post_
+    assert not gh.delete_
+    assert labelcache.LABELS.get(LABELS_URL) is None
+
+
+@pytest.mark.asyncio
+async def test_apply_single_change_with_replace():
+    # A single change is as cheap as a replacement but safer.
+    gh = FakeGH(None)
+    await reconcile.apply_labels(gh, ISSUE, {"bug", "triage"}, {"bug"}, replace=True)
+    assert not gh.put_
+    assert gh.delete_ == [f"{ISSUE_URL}/labels/triage"]
+
+
+@pytest.mark.asyncio
+async def test_apply_replace():
+    gh = FakeGH(None)
+    await reconcile.apply_labels(
+        gh, ISSUE, {"bug", "triage", "needs PR"}, {"bug", "meta"}, replace=True
+    )
+    assert gh.put_ == [(f"{ISSUE_URL}/labels", {"labels": ["bug", "meta"]})]
+    assert not gh.post_
+    assert not gh.delete_
+    assert labelcache.LABELS.get(LABELS_URL) == {"bug", "meta"}
+
+
+@pytest.mark.asyncio
+async def test_apply_without_replace():
+    gh = FakeGH(None)
+    await reconcile.apply_labels(
+        gh, ISSUE, {"bug", "triage", "needs PR"}, {"bug", "meta", "Epic"}
+    )
+    assert not gh.put_
+    assert gh.post_ == [(f"{ISSUE_URL}/labels", {"labels": ["Epic", "meta"]})]
+    assert sorted(gh.delete_) == [
+        f"{ISSUE_URL}/labels/needs%20PR",
+        f"{ISSUE_URL}/labels/triage",
+    ]
+    assert labelcache.LABELS.get(LABELS_URL) == {"bug", "meta", "Epic"}
+
+
+@pytest.mark.asyncio
+async def test_apply_missing_label():
+    class FakeGHDeleteException(FakeGH):
+        async def delete(self, url, url_vars={}):
+            raise gidgethub.BadRequest(
+                http.HTTPStatus.BAD_REQUEST, "Label does not exist"
+            )
+
+    gh = FakeGHDeleteException(None)
+    labelcache.LABELS.record(LABELS_URL, ["bug", "triage"])
+    await reconcile.apply_labels(gh, ISSUE, {"bug", "triage"}, {"bug"})
+    # What was known about the issue's labels was wrong.
+    assert labelcache.LABELS.get(LABELS_URL) is None
+
+
+@pytest.mark.asyncio
+async def test_apply_removal_error():
+    class FakeGHDeleteException(FakeGH):
+        async def delete(self, url, url_vars={}):
+            raise gidgethub.BadRequest(http.HTTPStatus.BAD_REQUEST, "oops")
+
+    gh = FakeGHDeleteException(None)
+    with pytest.raises(gidgethub.BadRequest):
+        await reconcile.apply_labels(gh, ISSUE, {"bug", "triage"}, {"bug"})
+
+
+@pytest.mark.asyncio
+async def test_minimal_changes_applied():
+    sample_data = read_sample_data("issues-labeled-has_classify_adding_triage.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+    issue = dict(sample_data["issue"])
+    issue["labels"] = label_names("classify", "triage", "needs PR", "bug")
+    gh = FakeGH(issue)
+
+    await reconcile.reconcile_issue(event, gh, logger=None)
+    assert gh.getitem_ == [sample_data["issue"]["url"]]
+    assert not gh.post_
+    assert gh.delete_ == [
+        "https://api.github.com/repos/Microsoft/vscode-python/issues/3327/labels/classify"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_classify_added():
+    sample_data = read_sample_data("issues-unlabeled-no_status.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+    issue = dict(sample_data["issue"])
+    issue["labels"] = label_names("bug")
+    gh = FakeGH(issue)
+
+    await reconcile.reconcile_issue(event, gh)
+    assert gh.post_ == [
+        (
+            "https://api.github.com/repos/Microsoft/vscode-python/issues/3327/labels",
+            {"labels": [labels.Status.classify.value]},
+        )
+    ]
+    assert not gh.delete_
+
+
+@pytest.mark.asyncio
+async def test_closed_issue_reconciled():
+    sample_data = read_sample_data("issues-closed.json")
+    event = gidgethub.sansio.Event(sample_data, event="issues", delivery_id="1")
+    issue = dict(sample_data["issue"])
+    issue["labels"] = label_names("needs spec", "triage", "bug")
+    gh = FakeGH(issue)
+
+    await reconcile.reconcile_issue(event, gh)
+    assert not gh.post_
+    assert not gh.delete_
+    assert gh.put_ == [
+        (
+            "https://api.github.com/repos/Microsoft/vscode-python/issues/3453/labels",
+            {"labels": ["bug"]},
+        )
+    ]
+
+
+FIELD = re.compile(r"(r\d+): (\w+)\(")
+LABEL_IDS = {"bug": "L_bug", "classify": "L_classify", "triage": "L_triage"}
+
+
+class FakeGraphQL:
+
+    """Enough of GitHub's GraphQL API to read and change labels."""
+
+    def __init__(self, issues):
+        # Issue node ID -> label names
+        self.issues = issues
+        self.requests = []
+
+    def node(self, args):
+        names = sorted(self.issues[args["id"]])
+        return {"labels": {"nodes": [{"name": name} for name in names]}}
+
+    def repository(self, args):
+        assert (args["owner"], args["repo"]) == ("Microsoft", "vscode-python")
+        label_id = LABEL_IDS.get(args["name"])
+        return {"label": {"id": label_id} if label_id else None}
+
+    def addLabelsToLabelable(self, args):
+        names = {
+            name for name, id_ in LABEL_IDS.items() if id_ in args["input"]["labelIds"]
+        }
+        self.issues[args["input"]["labelableId"]] |= names
+        return {"clientMutationId": None}
+
+    def removeLabelsFromLabelable(self, args):
+        names = {
+            name for name, id_ in LABEL_IDS.items() if id_ in args["input"]["labelIds"]
+        }
+        self.issues[args["input"]["labelableId"]] -= names
+        return {"clientMutationId": None}
+
+    async def handle(self, request):
+        payload = await request.json()
+        self.requests.append(payload)
+        data = {}
+        errors = []
+        for alias, field in FIELD.findall(payload["query"]):
+            args = {
+                name[len(alias) + 1 :]: value
+                for name, value in payload["variables"].items()
+                if name.startswith(alias + "_")
+            }
+            node_id = args.get("input", {}).get("labelableId")
+            if node_id is not None and node_id not in self.issues:
+                data[alias] = None
+                errors.append({"message": "Could not resolve", "path": [alias]})
+            else:
+                data[alias] = getattr(self, field)(args)
+        return aiohttp.web.json_response({"data": data, "errors": errors})
+
+
+def graphql_issue(number, *label_names):
+    url = f"https://api.github.com/repos/Microsoft/vscode-python/issues/{number}"
+    return {
+        "node_id": f"I_{number}",
+        "repository_url": "https://api.github.com/repos/Microsoft/vscode-python",
+        "labels_url": url + "/labels{/name}",
+        "labels": [{"name": name, "node_id": LABEL_IDS[name]} for name in label_names],
+    }
+
+
+@pytest.fixture
+async def graphql_server(monkeypatch):
+    fake = FakeGraphQL({"I_1": {"bug", "triage"}, "I_2": set()})
+    app = aiohttp.web.Application()
+    app.router.add_post("/graphql", fake.handle)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        http_client = client.Client()
+        batcher = graphql.Batcher(url=str(server.make_url("/graphql")))
+        monkeypatch.setattr(reconcile, "BACKEND", reconcile.GraphQLLabels(batcher))
+        fake.gh = http_client.github_api("pvscbot")
+        yield fake
+        await http_client.close()
+
+
+@pytest.mark.asyncio
+async def test_graphql_read(graphql_server):
+    issue = graphql_issue(1)
+    gh = graphql_server.gh
+    assert await reconcile.read_labels(gh, issue) == {"bug", "triage"}
+    assert labelcache.LABELS.get(issue["labels_url"]) == {"bug", "triage"}
+    # Known labels aren't asked for again.
+    assert await reconcile.read_labels(gh, issue) == {"bug", "triage"}
+    assert len(graphql_server.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_graphql_apply(graphql_server):
+    gh = graphql_server.gh
+    first = graphql_issue(1, "bug", "triage")
+    second = graphql_issue(2)
+    await asyncio.gather(
+        reconcile.apply_labels(
+            gh, first, {"bug", "triage"}, {"bug", "classify"}, replace=True
+        ),
+        reconcile.apply_labels(gh, second, set(), {"classify"}),
+    )
+    assert graphql_server.issues == {"I_1": {"bug", "classify"}, "I_2": {"classify"}}
+    assert labelcache.LABELS.get(first["labels_url"]) == {"bug", "classify"}
+    assert labelcache.LABELS.get(second["labels_url"]) == {"classify"}
+    # Label IDs not in the payload are looked up together, then all changes to
+    # both issues are made in one request.
+    queries = [request["query"] for request in graphql_server.requests]
+    assert len(queries) == 2
+    assert queries[0].startswith("query")
+    assert queries[0].count("repository(") == 1
+    assert queries[1].startswith("mutation")
+    assert queries[1].count("Labelable(") == 3
+
+    # Label IDs are remembered.
+    await reconcile.apply_labels(gh, second, {"classify"}, {"classify", "triage"})
+    assert graphql_server.issues["I_2"] == {"classify", "triage"}
+    assert len(graphql_server.requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_graphql_no_changes(graphql_server):
+    await reconcile.apply_labels(
+        graphql_server.gh, graphql_issue(1, "bug"), {"bug"}, {"bug"}
+    )
+    assert not graphql_server.requests
+
+
+@pytest.mark.asyncio
+async def test_graphql_unknown_label(graphql_server, monkeypatch):
+    gh = graphql_server.gh
+    issue = graphql_issue(1, "bug", "triage")
+    # A label the repository doesn't have can't be on the issue.
+    await reconcile.apply_labels(gh, issue, {"bug", "ghost"}, {"bug", "triage"})
+    assert graphql_server.issues["I_1"] == {"bug", "triage"}
+    with pytest.raises(LookupError):
+        await reconcile.apply_labels(gh, issue, {"bug"}, {"bug", "ghost"})
+
+    # The label is looked up again once it may have been created.
+    monkeypatch.setitem(LABEL_IDS, "ghost", "L_ghost")
+    await reconcile.apply_labels(gh, issue, {"bug"}, {"bug", "ghost"})
+    assert "ghost" in graphql_server.issues["I_1"]
+
+
+@pytest.mark.asyncio
+async def test_graphql_error(graphql_server):
+    issue = graphql_issue(3, "bug")
+    labelcache.LABELS.record(issue["labels_url"], {"bug"})
+    with pytest.raises(graphql.GraphQLError):
+        await reconcile.apply_labels(graphql_server.gh, issue, {"bug"}, set())
+    assert labelcache.LABELS.get(issue["labels_url"]) is None
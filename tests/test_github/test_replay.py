@@ -0,0 +1,126 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import runpy
+import sys
+
+import gidgethub.routing
+import gidgethub.sansio
+import pytest
+
+from __app__ import github as github_main
+from __app__.ghutils import journal
+from __app__.github import replay
+
+
+def make_event(delivery_id, event_type="issues"):
+    return gidgethub.sansio.Event(
+        {"action": "opened"}, event=event_type, delivery_id=delivery_id
+    )
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """A journal with finished, unfinished, deferred and failed events."""
+    record = journal.Journal(tmp_path)
+    for delivery_id, outcome in [
+        ("1", "ok"),
+        ("2", None),
+        ("3", "deferred"),
+        ("4", "error"),
+    ]:
+        record.record(make_event(delivery_id))
+        if outcome is not None:
+            record.finish(delivery_id, outcome)
+    record.record(make_event("5", "pull_request"))
+    record.close()
+    return tmp_path
+
+
+def test_select(recorded):
+    entries = journal.entries(recorded)
+
+    def selected(**kwargs):
+        return [event.delivery_id for event in replay.select(entries, **kwargs)]
+
+    assert selected() == ["2", "3", "5"]
+    assert selected(everything=True) == ["1", "2", "3", "4", "5"]
+    # Deliveries picked by ID are replayed even if they finished.
+    assert selected(delivery_ids={"1", "4"}) == ["1", "4"]
+    assert selected(event_types={"pull_request"}) == ["5"]
+    assert selected(everything=True, event_types={"issues"}) == ["1", "2", "3", "4"]
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    router = gidgethub.routing.Router()
+    router.seen = []
+    http_client = FakeClient()
+
+    @router.register("issues", action="opened")
+    async def routed(event, gh, **kwargs):
+        router.seen.append((event.delivery_id, gh))
+
+    def github_api(event):
+        # Connecting to GitHub creates the client.
+        github_main.CLIENT = http_client
+        return event.delivery_id
+
+    monkeypatch.setattr(github_main, "dispatcher", lambda: router)
+    monkeypatch.setattr(github_main, "github_api", github_api)
+    monkeypatch.setattr(github_main, "CLIENT", None)
+    return router, http_client
+
+
+def test_main(recorded, fake_bot, capsys):
+    router, http_client = fake_bot
+    replay.main([str(recorded), "--event", "issues"])
+
+    assert router.seen == [("2", "2"), ("3", "3")]
+    assert http_client.closed
+    out, err = capsys.readouterr()
+    assert out == "2 (issues)\n3 (issues)\n"
+    assert err == "2 events replayed, 0 failed\n"
+    # Replays are recorded, so there is nothing left to replay.
+    assert [
+        event.delivery_id for event in replay.select(journal.entries(recorded))
+    ] == ["5"]
+
+
+def test_main_dry_run(recorded, fake_bot, capsys):
+    router, http_client = fake_bot
+    replay.main([str(recorded), "--all", "--dry-run"])
+    assert not router.seen
+    out, err = capsys.readouterr()
+    assert len(out.splitlines()) == 5
+    assert err == "5 events to replay\n"
+
+
+def test_main_deliveries(recorded, fake_bot, capsys):
+    router, _ = fake_bot
+    replay.main([str(recorded), "--delivery", "1", "--delivery", "5"])
+    # Nothing handles the pull request, which counts as replayed.
+    assert router.seen == [("1", "1")]
+    assert capsys.readouterr().err == "2 events replayed, 0 failed\n"
+
+
+def test_main_nothing_to_replay(recorded, fake_bot, capsys):
+    replay.main([str(recorded), "--delivery", "missing"])
+    # No client is created just to close it.
+    assert github_main.CLIENT is None
+    assert capsys.readouterr().err == "0 events replayed, 0 failed\n"
+
+
+def test_run_as_module(recorded, fake_bot, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["replay", str(recorded), "--dry-run"])
+    monkeypatch.delitem(sys.modules, "__app__.github.replay")
+    runpy.run_module("__app__.github.replay", run_name="__main__")
+    assert capsys.readouterr().err == "3 events to replay\n"
@@ -0,0 +1,102 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import asyncio
+import json
+
+import gidgethub.sansio
+import pytest
+
+from __app__.github import labelrules, repos
+
+
+def make_event(full_name="Microsoft/vscode-python", delivery_id="1"):
+    data = {"action": "opened", "repository": {"full_name": full_name}}
+    return gidgethub.sansio.Event(data, event="issues", delivery_id=delivery_id)
+
+
+@pytest.fixture
+def settings_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("GH_AUTH_PYTHON", "python token")
+    path = tmp_path / "repos.json"
+    path.write_text(
+        json.dumps(
+            {
+                "Microsoft/vscode-python": {
+                    "auth": "GH_AUTH_PYTHON",
+                    "labels": {"team": ["xteam"]},
+                    "concurrency": 2,
+                },
+                "Microsoft/ptvsd": {},
+            }
+        )
+    )
+    return str(path)
+
+
+def test_load(settings_path):
+    repositories = repos.load(settings_path, default_token="default", concurrency=3)
+    python = repositories.get("microsoft/VSCODE-python")
+    assert python.full_name == "Microsoft/vscode-python"
+    assert python.oauth_token == "python token"
+    assert python.rules.team == {"xteam"}
+    assert python.concurrency == 2
+    ptvsd = repositories.get("Microsoft/ptvsd")
+    assert ptvsd.oauth_token == "default"
+    assert ptvsd.rules is None
+    assert ptvsd.concurrency == 3
+
+
+def test_unlisted():
+    repositories = repos.Repositories(default_token="default")
+    other = repositories.for_event(make_event("Microsoft/other"))
+    assert other.full_name == "Microsoft/other"
+    assert other.oauth_token == "default"
+    assert other.concurrency == repos.DEFAULT_CONCURRENCY
+    assert repositories.get("microsoft/other") is other
+    # Events without a repository, e.g. for an organization, are still served.
+    event = gidgethub.sansio.Event({}, event="ping", delivery_id="1")
+    assert repositories.for_event(event).oauth_token == "default"
+
+
+@pytest.mark.asyncio
+async def test_semaphore():
+    repository = repos.Repository("Microsoft/vscode-python", concurrency=2)
+    assert repository.semaphore is repository.semaphore
+    async with repository.semaphore:
+        async with repository.semaphore:
+            assert repository.semaphore.locked()
+
+
+class Router:
+    def __init__(self):
+        self.running = {}
+        self.most = {}
+        self.rules = []
+
+    async def dispatch(self, event, gh, **kwargs):
+        full_name = event.data["repository"]["full_name"]
+        self.running[full_name] = self.running.get(full_name, 0) + 1
+        self.most[full_name] = max(self.most.get(full_name, 0), self.running[full_name])
+        self.rules.append((full_name, labelrules.current()))
+        await asyncio.sleep(0.01)
+        self.running[full_name] -= 1
+
+
+@pytest.mark.asyncio
+async def test_dispatcher(settings_path):
+    router = Router()
+    repositories = repos.load(settings_path, concurrency=5)
+    dispatcher = repos.Dispatcher(router, repositories)
+    events = [make_event("Microsoft/vscode-python", str(n)) for n in range(4)]
+    events += [make_event("Microsoft/ptvsd", str(n)) for n in range(4)]
+    await asyncio.gather(*(dispatcher.dispatch(event, object()) for event in events))
+    # A busy repository is held to its own limit without holding up the rest.
+    assert router.most == {"Microsoft/vscode-python": 2, "Microsoft/ptvsd": 4}
+    python_rules = repositories.get("Microsoft/vscode-python").rules
+    for full_name, rules in router.rules:
+        if full_name == "Microsoft/vscode-python":
+            assert rules is python_rules
+        else:
+            assert rules is labelrules.REGISTRY
+    assert labelrules.current() is labelrules.REGISTRY
@@ -0,0 +1,129 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import io
+import runpy
+import sys
+import time
+
+import pytest
+
+from __app__ import github as github_main
+from __app__.ghutils import client, ratelimit, watermark
+from __app__.github import labels, sync
+
+from .fakes import ISSUES_URL, REPO, FakeClient, FakeGH, make_issue
+
+
+ISSUES = [
+    # Needs 'classify'.
+    make_issue(1, "open", updated_at="2020-01-01T10:00:00Z"),
+    # Already classified.
+    make_issue(
+        2, "open", labels.Status.needs_PR.value, updated_at="2020-01-01T11:00:00Z"
+    ),
+    # Closed with a status label.
+    make_issue(
+        3,
+        "closed",
+        "bug",
+        labels.Status.needs_PR.value,
+        updated_at="2020-01-01T11:00:00Z",
+    ),
+    make_issue(4, "open", updated_at="2020-01-01T12:00:00Z", pull_request=True),
+]
+
+
+@pytest.mark.asyncio
+async def test_plan():
+    gh = FakeGH(ISSUES)
+    changes, newest = await sync.plan(gh, REPO, "2020-01-01T00:00:00Z")
+    assert gh.getiter_ == [
+        f"{ISSUES_URL}?state=all&since=2020-01-01T00%3A00%3A00Z"
+        "&sort=updated&direction=asc&per_page=100"
+    ]
+    assert [str(change) for change in changes] == ["#1: +classify", "#3: -needs PR"]
+    # Pull requests still count towards how far the sync got.
+    assert newest == "2020-01-01T12:00:00Z"
+
+    changes, newest = await sync.plan(FakeGH([]), REPO, "2020-01-01T00:00:00Z")
+    assert changes == []
+    assert newest is None
+
+
+@pytest.mark.asyncio
+async def test_first_sync(monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1_577_880_000)
+    gh = FakeGH(ISSUES)
+    watermarks = watermark.MemoryWatermarks()
+    out = io.StringIO()
+    changes = await sync.sync(gh, REPO, watermarks, lookback=3600, out=out)
+    assert "since=2020-01-01T11%3A00%3A00Z" in gh.getiter_[0]
+    assert out.getvalue().splitlines() == [str(change) for change in changes]
+    assert gh.post_ == [(f"{ISSUES_URL}/1/labels", {"labels": ["classify"]})]
+    assert gh.delete_ == [f"{ISSUES_URL}/3/labels/needs%20PR"]
+    assert watermarks.get(REPO) == "2020-01-01T12:00:00Z"
+
+    # Later syncs start from the watermark.
+    gh = FakeGH([make_issue(5, "open", "bug", updated_at="2020-01-01T13:00:00Z")])
+    await sync.sync(gh, REPO, watermarks)
+    assert "since=2020-01-01T12%3A00%3A00Z" in gh.getiter_[0]
+    assert watermarks.get(REPO) == "2020-01-01T13:00:00Z"
+
+
+@pytest.mark.asyncio
+async def test_unchanged_watermark():
+    watermarks = watermark.MemoryWatermarks()
+    watermarks.advance(REPO, None, "2020-01-01T00:00:00Z")
+
+    gh = FakeGH(ISSUES)
+    changes = await sync.sync(gh, REPO, watermarks, dry_run=True)
+    assert len(changes) == 2
+    assert not gh.post_
+    assert not gh.delete_
+    assert watermarks.get(REPO) == "2020-01-01T00:00:00Z"
+
+    # Nothing was updated.
+    await sync.sync(FakeGH([]), REPO, watermarks)
+    assert watermarks.get(REPO) == "2020-01-01T00:00:00Z"
+
+    # Rate limited; the other changes still go through.
+    gh = FakeGH(ISSUES, deferrals=1)
+    with pytest.raises(ratelimit.Deferred):
+        await sync.sync(gh, REPO, watermarks)
+    assert gh.delete_ == [f"{ISSUES_URL}/3/labels/needs%20PR"]
+    assert watermarks.get(REPO) == "2020-01-01T00:00:00Z"
+
+
+@pytest.mark.parametrize("dry_run", [True, False])
+def test_main(monkeypatch, capsys, tmp_path, dry_run):
+    monkeypatch.setattr(client, "Client", FakeClient)
+    monkeypatch.setattr(FakeClient, "instances", [])
+    monkeypatch.setenv("GH_AUTH", "token")
+    path = str(tmp_path / "watermarks.db")
+    argv = [REPO, path, "--lookback", "2"] + (["--dry-run"] if dry_run else [])
+
+    sync.main(argv)
+
+    http_client = FakeClient.instances[0]
+    assert http_client.closed
+    assert http_client.scheduler.max_delay == float("inf")
+    assert http_client.gh.requester == github_main.REQUESTER
+    assert http_client.gh.oauth_token == "token"
+    assert bool(http_client.gh.post_) is not dry_run
+    out, err = capsys.readouterr()
+    assert out == "#1: +classify\n"
+    assert err == ("1 issues need changes\n" if dry_run else "1 issues changed\n")
+    watermarks = watermark.SQLiteWatermarks(path)
+    expected = None if dry_run else "2020-01-01T10:00:00Z"
+    assert watermarks.get(REPO) == expected
+    watermarks.close()
+
+
+def test_run_as_module(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr(client, "Client", FakeClient)
+    path = str(tmp_path / "watermarks.db")
+    monkeypatch.setattr(sys, "argv", ["sync", REPO, path])
+    monkeypatch.delitem(sys.modules, "__app__.github.sync")
+    runpy.run_module("__app__.github.sync", run_name="__main__")
+    assert capsys.readouterr().out == "#1: +classify\n"